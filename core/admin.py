@@ -1,14 +1,108 @@
-from django.contrib import admin
+from django.contrib import admin, messages
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.views.main import ChangeList
 from django.contrib.auth.admin import UserAdmin
-from .models import User, WasteCategory, WasteItem, Match
+from django.utils import timezone
+from . import jobs, refdata
+from .forms import CategoryChoiceField
+from .models import (User, WasteCategory, WasteItem, Match, CreditTransaction, AdminJob, ImpactRollup, LeaderboardScore,
+                     DuplicateCandidate, PickupSlot, ArchivedWasteItem, ArchivedMatch)
+from .pagination import EstimatedCountPaginator
+
+CURSOR_VAR = 'after'
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    """Changelist defaults for tables that grow to millions of rows"""
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+
+class KeysetChangeList(ChangeList):
+    """
+    Changelist paged by primary key (`?after=<pk>`) instead of OFFSET, so the
+    cost of a page does not grow with how deep into the table it is.
+    """
+
+    def __init__(self, request, *args, **kwargs):
+        cursor = request.GET.get(CURSOR_VAR)
+        try:
+            self.cursor = int(cursor) if cursor else None
+        except ValueError:
+            raise IncorrectLookupParameters
+        self.next_cursor = None
+        # Hide the cursor from the filter machinery and from generated links
+        original_get = request.GET
+        request.GET = original_get.copy()
+        request.GET.pop(CURSOR_VAR, None)
+        try:
+            super().__init__(request, *args, **kwargs)
+        finally:
+            request.GET = original_get
+
+    def get_results(self, request):
+        queryset = self.queryset
+        if self.cursor is not None:
+            queryset = queryset.filter(pk__lt=self.cursor)
+        rows = list(queryset[:self.list_per_page + 1])
+        if len(rows) > self.list_per_page:
+            rows = rows[:self.list_per_page]
+            self.next_cursor = rows[-1].pk
+
+        self.paginator = self.model_admin.get_paginator(request, self.queryset, self.list_per_page)
+        self.result_count = self.paginator.count
+        self.full_result_count = None
+        self.show_full_result_count = False
+        self.show_admin_actions = True
+        self.result_list = rows
+        self.can_show_all = False
+        self.multi_page = self.cursor is not None or self.next_cursor is not None
+
+    def first_page_url(self):
+        return self.get_query_string(remove=[CURSOR_VAR])
+
+    def next_page_url(self):
+        return self.get_query_string({CURSOR_VAR: self.next_cursor})
+
+
+class CategoryFilter(admin.SimpleListFilter):
+    """Category filter with its options from the reference-data cache instead of a query per changelist"""
+    title = 'category'
+    parameter_name = 'category__id__exact'
+
+    def lookups(self, request, model_admin):
+        return refdata.get().categories
+
+    def queryset(self, request, queryset):
+        if self.value():
+            return queryset.filter(category_id=self.value())
+        return queryset
+
+
+def job_action(kind, dry_run=False):
+    """Admin action that queues a background AdminJob over the selected rows"""
+    label = dict(AdminJob.KINDS)[kind]
+
+    def action(modeladmin, request, queryset):
+        job = jobs.create_job(kind, queryset, user=request.user, dry_run=dry_run)
+        modeladmin.message_user(
+            request, f"Queued job #{job.pk} ({label}{', dry run' if dry_run else ''}) for {job.total} rows. "
+                     f"Follow its progress under Admin jobs."
+        )
+
+    action.__name__ = f'{kind}_dry_run' if dry_run else kind
+    return admin.action(description=f"{label}{' (dry run)' if dry_run else ''}")(action)
+
 
 @admin.register(User)
 class CustomUserAdmin(UserAdmin):
     list_display = ('username', 'email', 'user_type', 'phone', 'is_staff')
     list_filter = ('user_type', 'is_staff', 'is_superuser')
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
     fieldsets = UserAdmin.fieldsets + (
         ('WasteHub Profile', {
-            'fields': ('user_type', 'phone', 'address')
+            'fields': ('user_type', 'phone', 'address', 'vehicle_capacity_kg')
         }),
     )
     add_fieldsets = UserAdmin.add_fieldsets + (
@@ -23,16 +117,189 @@ class WasteCategoryAdmin(admin.ModelAdmin):
     search_fields = ('name',)
 
 @admin.register(WasteItem)
-class WasteItemAdmin(admin.ModelAdmin):
+class WasteItemAdmin(LargeTableAdmin):
     list_display = ('title', 'poster', 'category', 'quantity', 'unit', 'location', 'status', 'created_at')
-    list_filter = ('status', 'category', 'created_at')
+    # created_at is filtered with date ranges (index-backed) rather than date_hierarchy,
+    # whose drill-down runs SELECT DISTINCT over a truncated date of every row
+    list_filter = ('status', CategoryFilter, 'created_at')
+    list_select_related = ('poster', 'category')
     search_fields = ('title', 'description', 'location', 'poster__username')
+    autocomplete_fields = ('poster',)
     readonly_fields = ('created_at', 'updated_at')
-    date_hierarchy = 'created_at'
+    ordering = ('-created_at',)
+    actions = [
+        job_action('mark_collected'), job_action('mark_collected', dry_run=True),
+        job_action('award_credits'), job_action('award_credits', dry_run=True),
+        job_action('recompute_estimates'), job_action('recompute_estimates', dry_run=True),
+    ]
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name == 'category':
+            return CategoryChoiceField(required=False, label=db_field.verbose_name.capitalize())
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
 
 @admin.register(Match)
-class MatchAdmin(admin.ModelAdmin):
+class MatchAdmin(LargeTableAdmin):
     list_display = ('waste_item', 'collector', 'status', 'created_at')
     list_filter = ('status', 'created_at')
+    list_select_related = ('waste_item__poster', 'collector')
     search_fields = ('waste_item__title', 'collector__username', 'message')
+    autocomplete_fields = ('waste_item', 'collector')
+    # Planned by core.scheduling
+    readonly_fields = ('slot', 'created_at')
+    ordering = ('-created_at',)
+    actions = [job_action('reject_stale_matches'), job_action('reject_stale_matches', dry_run=True)]
+
+@admin.register(CreditTransaction)
+class CreditTransactionAdmin(LargeTableAdmin):
+    list_display = ('id', 'user', 'transaction_type', 'amount', 'reason', 'created_at')
+    list_filter = ('transaction_type', 'created_at')
+    list_select_related = ('user',)
+    search_fields = ('=user__username',)
+    autocomplete_fields = ('user',)
     readonly_fields = ('created_at',)
+    # Keyset pages walk the primary key, so the order is fixed
+    ordering = ('-pk',)
+    sortable_by = ()
+    change_list_template = 'admin/core/credittransaction/change_list.html'
+
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
+
+@admin.register(PickupSlot)
+class PickupSlotAdmin(LargeTableAdmin):
+    list_display = ('collector', 'start', 'end', 'capacity_kg')
+    list_filter = ('start',)
+    list_select_related = ('collector',)
+    search_fields = ('=collector__username',)
+    autocomplete_fields = ('collector',)
+    ordering = ('-start',)
+
+@admin.register(AdminJob)
+class AdminJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'kind', 'dry_run', 'status', 'processed', 'total', 'progress', 'affected',
+                    'created_by', 'created_at', 'finished_at')
+    list_filter = ('status', 'kind', 'dry_run')
+    list_select_related = ('created_by',)
+    readonly_fields = ('kind', 'dry_run', 'status', 'total', 'processed', 'affected', 'checkpoint', 'log',
+                       'created_by', 'created_at', 'updated_at', 'finished_at')
+    exclude = ('params',)
+    actions = ['run_for_real', 'resume']
+
+    def has_add_permission(self, request):
+        return False
+
+    @admin.display(description='Progress')
+    def progress(self, obj):
+        return f"{obj.progress}%"
+
+    @admin.action(description="Run selected dry runs for real")
+    def run_for_real(self, request, queryset):
+        for job in queryset.filter(dry_run=True, status='completed'):
+            real = jobs.rerun_for_real(job, user=request.user)
+            self.message_user(request, f"Queued job #{real.pk} from dry run #{job.pk}")
+
+    @admin.action(description="Resume selected failed or interrupted jobs")
+    def resume(self, request, queryset):
+        for job in queryset.filter(jobs.claimable(resume=True)).exclude(status='queued'):
+            jobs.start_in_background(job.pk, resume=True)
+            self.message_user(request, f"Resuming job #{job.pk} after pk {job.checkpoint}")
+        busy = queryset.filter(status='running').exclude(jobs.claimable(resume=True)).count()
+        if busy:
+            self.message_user(request, f"{busy} running job(s) still hold their lease and were left alone",
+                              level=messages.WARNING)
+
+@admin.register(ImpactRollup)
+class ImpactRollupAdmin(admin.ModelAdmin):
+    """Read-only: rows are maintained by core.analytics"""
+    list_display = ('day', 'area', 'waste_type', 'category', 'status', 'items', 'weight_kg', 'credits_earned')
+    list_filter = ('status', 'waste_type', 'day')
+    list_select_related = ('category',)
+    search_fields = ('area',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+@admin.register(LeaderboardScore)
+class LeaderboardScoreAdmin(admin.ModelAdmin):
+    """Read-only: rows are maintained by core.leaderboard"""
+    list_display = ('board', 'period', 'place', 'user', 'score')
+    list_filter = ('board', 'period')
+    list_select_related = ('user',)
+    search_fields = ('=user__username', 'place')
+    ordering = ('board', '-period', 'place', '-score')
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+@admin.register(DuplicateCandidate)
+class DuplicateCandidateAdmin(LargeTableAdmin):
+    """Review queue for listings that look like reposts (found by core.dedup)"""
+    list_display = ('item', 'duplicate_of', 'image_distance', 'text_similarity', 'status', 'created_at')
+    list_filter = ('status', 'created_at')
+    list_select_related = ('item__poster', 'duplicate_of__poster')
+    readonly_fields = ('item', 'duplicate_of', 'image_distance', 'text_similarity', 'status', 'reviewed_by',
+                       'created_at', 'reviewed_at')
+    ordering = ('-created_at',)
+    actions = ['confirm', 'dismiss']
+
+    def has_add_permission(self, request):
+        return False
+
+    @admin.action(description="Confirm: remove the later listing if it is still available")
+    def confirm(self, request, queryset):
+        removed = 0
+        for candidate in queryset.filter(status='pending').select_related('item'):
+            # The candidate row goes with the listing; collected ones stay and are marked confirmed
+            if candidate.item.status == 'available':
+                candidate.item.delete()
+                removed += 1
+        marked = queryset.filter(status='pending').update(
+            status='confirmed', reviewed_by=request.user, reviewed_at=timezone.now())
+        self.message_user(request, f"Removed {removed} duplicate listings; marked {marked} more confirmed")
+
+    @admin.action(description="Dismiss: not duplicates")
+    def dismiss(self, request, queryset):
+        dismissed = queryset.filter(status='pending').update(
+            status='dismissed', reviewed_by=request.user, reviewed_at=timezone.now())
+        self.message_user(request, f"Dismissed {dismissed} candidates")
+
+
+class ArchiveAdmin(LargeTableAdmin):
+    """Read-only: rows are moved here by core.archive"""
+    ordering = ('-pk',)
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+@admin.register(ArchivedWasteItem)
+class ArchivedWasteItemAdmin(ArchiveAdmin):
+    list_display = ('id', 'title', 'poster', 'quantity', 'unit', 'location', 'status', 'updated_at', 'archived_at')
+    list_filter = ('status',)
+    list_select_related = ('poster',)
+    search_fields = ('=id', '=poster__username')
+
+@admin.register(ArchivedMatch)
+class ArchivedMatchAdmin(ArchiveAdmin):
+    list_display = ('id', 'waste_item_title', 'waste_item_ref', 'collector', 'status', 'updated_at', 'archived_at')
+    list_filter = ('status',)
+    list_select_related = ('collector',)
+    search_fields = ('=id', '=waste_item_ref', '=collector__username')
@@ -0,0 +1,177 @@
+"""
+Admission control for write-heavy endpoints.
+
+Views listed by URL name in ADMISSION_RULES belong to a class in
+ADMISSION_CLASSES, whose settings a rule may override. Before such a view
+runs, `admit()` checks, in order:
+
+1. load: if this process has more than ADMISSION_MAX_IN_FLIGHT requests in
+   flight, or the recent time per SQL query (a moving average over every
+   request, ignored once ADMISSION_LATENCY_WINDOW seconds old) is above
+   ADMISSION_MAX_DB_LATENCY_MS, answer 503 straight away;
+2. rate: one token bucket per user and one per client IP (see `client_ip`),
+   per class, kept in the default cache (`user_rate` / `ip_rate` tokens a
+   second, up to `user_burst` / `ip_burst`); an empty bucket answers 429,
+   and a refused request takes nothing from the other bucket;
+3. concurrency: at most `concurrency` requests of the class run at once in
+   this process; the next one gets 503.
+
+Refusals carry Retry-After and are counted in `admission_rejected`. The
+buckets are read and written without a lock, so concurrent workers may let
+a few extra requests through; concurrency and load are per process.
+"""
+
+import math
+import threading
+import time
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse, JsonResponse
+
+from . import metrics
+
+DEFAULT_CLASS = {
+    'user_rate': 1.0, 'user_burst': 10, 'ip_rate': 5.0, 'ip_burst': 50, 'concurrency': 4, 'shed': True,
+}
+
+_lock = threading.Lock()
+_in_flight = 0
+_running = {}
+_db_latency = 0.0  # Moving average of seconds per SQL query
+_db_latency_at = 0.0
+
+
+def rule_for(url_name, method):
+    """The settings that apply to `url_name` for this method, or None if it is not admission-controlled"""
+    rule = getattr(settings, 'ADMISSION_RULES', {}).get(url_name)
+    if rule is None or (rule.get('methods') and method not in rule['methods']):
+        return None
+    klass = rule.get('class', url_name)
+    merged = dict(DEFAULT_CLASS, **getattr(settings, 'ADMISSION_CLASSES', {}).get(klass, {}))
+    merged.update(rule)
+    # A rule with its own concurrency gets its own pool
+    merged['pool'] = url_name if 'concurrency' in rule else klass
+    merged['class'] = klass
+    return merged
+
+
+def client_ip(request):
+    """
+    The client's address. Behind ADMISSION_PROXY_HOPS trusted proxies it is
+    the entry the outermost one appended to X-Forwarded-For (the ones before
+    it come from the client and can be anything); REMOTE_ADDR otherwise.
+    """
+    hops = getattr(settings, 'ADMISSION_PROXY_HOPS', 0)
+    forwarded = [hop.strip() for hop in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if hop.strip()]
+    if hops > 0 and len(forwarded) >= hops:
+        return forwarded[-hops]
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def take(buckets):
+    """
+    Take a token from each of the [(key, rate, burst)] buckets, or from none
+    of them; 0 if taken, else the seconds until every bucket has one.
+    """
+    buckets = [(key, rate, burst) for key, rate, burst in buckets if rate > 0]
+    now = time.time()
+    found = cache.get_many([key for key, _, _ in buckets])
+    levels = []
+    wait = 0
+    for key, rate, burst in buckets:
+        tokens, stamp = found.get(key) or (burst, now)
+        tokens = min(burst, tokens + (now - stamp) * rate)
+        if tokens < 1:
+            wait = max(wait, (1 - tokens) / rate)
+        levels.append(tokens)
+    if wait:
+        return wait
+    for (key, rate, burst), tokens in zip(buckets, levels):
+        # Untouched for burst / rate seconds the bucket is full again, so it may expire
+        cache.set(key, (tokens - 1, now), math.ceil(burst / rate) + 1)
+    return 0
+
+
+@contextmanager
+def in_flight():
+    global _in_flight
+    with _lock:
+        _in_flight += 1
+    try:
+        yield
+    finally:
+        with _lock:
+            _in_flight -= 1
+
+
+def observe(stats):
+    """Fold a finished request's SQL time into the moving average"""
+    global _db_latency, _db_latency_at
+    if stats is not None and stats.query_count:
+        alpha = getattr(settings, 'ADMISSION_LATENCY_SMOOTHING', 0.2)
+        with _lock:
+            _db_latency += alpha * (stats.sql_time / stats.query_count - _db_latency)
+            _db_latency_at = time.monotonic()
+
+
+def overloaded():
+    """Why this process should shed load right now, or None"""
+    if _in_flight > getattr(settings, 'ADMISSION_MAX_IN_FLIGHT', 64):
+        return 'queue'
+    # A reading nobody has refreshed lately (everything shed, say) no longer counts
+    recent = time.monotonic() - _db_latency_at < getattr(settings, 'ADMISSION_LATENCY_WINDOW', 5)
+    if recent and _db_latency * 1000 > getattr(settings, 'ADMISSION_MAX_DB_LATENCY_MS', 250):
+        return 'db_latency'
+    return None
+
+
+def reject(request, status, reason, retry_after, url_name):
+    metrics.ADMISSION_REJECTED.inc(view=url_name, reason=reason)
+    message = "Too many requests" if status == 429 else "Server busy, try again shortly"
+    if request.path.startswith('/api/'):
+        response = JsonResponse({'error': message, 'details': {'reason': reason}}, status=status)
+    else:
+        response = HttpResponse(message, status=status, content_type='text/plain; charset=utf-8')
+    response['Retry-After'] = str(max(1, math.ceil(retry_after)))
+    return response
+
+
+def admit(request, url_name):
+    """None if the request may run (holding a concurrency slot until `release()`), else the refusal"""
+    rule = rule_for(url_name, request.method)
+    if rule is None:
+        return None
+    if rule['shed']:
+        reason = overloaded()
+        if reason:
+            return reject(request, 503, reason, 1, url_name)
+
+    user = getattr(request, 'user', None)
+    buckets = [(f'core.admission.{rule["class"]}.ip.{client_ip(request)}', rule['ip_rate'], rule['ip_burst'])]
+    if user is not None and user.is_authenticated:
+        buckets.insert(0, (f'core.admission.{rule["class"]}.user.{user.pk}', rule['user_rate'], rule['user_burst']))
+    wait = take(buckets)
+    if wait:
+        return reject(request, 429, 'rate', wait, url_name)
+
+    pool = rule['pool']
+    with _lock:
+        if _running.get(pool, 0) >= rule['concurrency']:
+            busy = True
+        else:
+            busy = False
+            _running[pool] = _running.get(pool, 0) + 1
+    if busy:
+        return reject(request, 503, 'concurrency', 1, url_name)
+    request.admission_pool = pool
+    return None
+
+
+def release(request):
+    pool = getattr(request, 'admission_pool', None)
+    if pool is not None:
+        with _lock:
+            _running[pool] -= 1
+        request.admission_pool = None
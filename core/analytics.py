@@ -0,0 +1,412 @@
+"""
+Impact analytics rollups.
+
+Every waste item contributes (1 item, its weight in kg, its estimated and
+earned credits) to exactly one `ImpactRollup` row, keyed by the day it was
+listed, its place, waste type, category and current status. The place is
+the item's place ID (core/places.py), or its area text if it has none yet;
+the row's `area` is the place's name, for display. Writes apply the
+difference between an item's previous and new contribution, so a status
+change moves the item from one bucket to another without rescanning
+anything, and reports only ever read the (small) rollup table.
+
+Paths that bypass `WasteItem.save()` (QuerySet.update, bulk inserts) wrap
+the write in `track(queryset)` or fold new rows in with
+`apply(aggregate(queryset))`. `rebuild()` locks the table against them for
+as long as it scans, so no increment lands between its scan and its swap.
+"""
+
+import datetime
+from contextlib import contextmanager
+from decimal import Decimal
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, F, Max, Min, Q, Sum
+from django.db.models.functions import TruncDate, TruncMonth, TruncYear
+from django.utils import timezone
+
+from . import places
+from .parallel import id_ranges, run_chunks
+
+MEASURES = ('items', 'weight_kg', 'estimated_credits', 'credits_earned')
+ZERO = (0, Decimal('0'), Decimal('0'), Decimal('0'))
+
+# Units whose quantity can be converted to kilograms; others count 0 kg
+UNIT_TO_KG = {
+    'kg': Decimal('1'), 'kgs': Decimal('1'), 'kilograms': Decimal('1'),
+    'g': Decimal('0.001'), 'grams': Decimal('0.001'),
+    'lbs': Decimal('0.45359237'), 'lb': Decimal('0.45359237'),
+    't': Decimal('1000'), 'tonnes': Decimal('1000'), 'tons': Decimal('1000'),
+}
+KG = Decimal('0.001')
+
+def area_for(location):
+    """Normalised area of a free-text location: 'machakos town, near stage' -> 'Machakos Town'"""
+    area = ' '.join((location or '').split(',')[0].split()).title()
+    return area[:100] or 'Unknown'
+
+
+def place_key(place, location):
+    """Rollup key of an item's place: its place ID, or its area text when it has none"""
+    return place or area_for(location)
+
+
+def area_name(key):
+    """Name shown for a place key"""
+    return places.name(key) or key
+
+
+def weight_kg(quantity, unit):
+    factor = UNIT_TO_KG.get((unit or '').strip().lower())
+    if not factor or quantity is None:
+        return Decimal('0')
+    return (Decimal(str(quantity)) * factor).quantize(KG)
+
+
+def _day(value):
+    return timezone.localdate(value) if timezone.is_aware(value) else value.date()
+
+
+def _add(totals, key, measures, sign=1):
+    current = totals.get(key, ZERO)
+    totals[key] = tuple(a + sign * b for a, b in zip(current, measures))
+
+
+def contribution(created_at, location, waste_type, category_id, status, quantity, unit,
+                 estimated_credits=0, credits_earned=0, place=''):
+    """(key, measures) of one item, from its field values"""
+    key = (_day(created_at), place_key(place, location), waste_type, category_id, status)
+    return key, (
+        1,
+        weight_kg(quantity, unit),
+        Decimal(str(estimated_credits or 0)),
+        Decimal(str(credits_earned or 0)),
+    )
+
+
+def snapshot(item):
+    """The rollup contribution of a saved item, as {key: measures}"""
+    if item.pk is None or item.created_at is None:
+        return {}
+    key, measures = contribution(item.created_at, item.location, item.waste_type, item.category_id, item.status,
+                                 item.quantity, item.unit, item.estimated_credits, item.credits_earned, item.place)
+    return {key: measures}
+
+
+def total(contributions):
+    """{key: measures} summed over (key, measures) pairs, e.g. of rows inserted without save()"""
+    totals = {}
+    for key, measures in contributions:
+        _add(totals, key, measures)
+    return totals
+
+
+def aggregate(queryset):
+    """Summed contributions of the items in `queryset`, with one grouped query"""
+    rows = (
+        queryset.order_by()
+        .values('place', 'location', 'waste_type', 'category_id', 'status', 'unit', day=TruncDate('created_at'))
+        .annotate(n=Count('pk'), quantity=Sum('quantity'),
+                  estimated=Sum('estimated_credits'), earned=Sum('credits_earned'))
+    )
+    totals = {}
+    for row in rows:
+        key = (row['day'], place_key(row['place'], row['location']), row['waste_type'], row['category_id'],
+               row['status'])
+        _add(totals, key, (
+            row['n'],
+            weight_kg(row['quantity'], row['unit']),
+            Decimal(str(row['estimated'] or 0)),
+            Decimal(str(row['earned'] or 0)),
+        ))
+    return totals
+
+
+def difference(after, before):
+    """Per-key change from `before` to `after`, without the keys that did not change"""
+    delta = {}
+    for key, measures in after.items():
+        _add(delta, key, measures)
+    for key, measures in before.items():
+        _add(delta, key, measures, -1)
+    return {key: measures for key, measures in delta.items() if any(measures)}
+
+
+def _by_grain(delta):
+    """Stored keys: every day-level key also counts towards its month row"""
+    rows = {}
+    for (day, *rest), measures in delta.items():
+        _add(rows, ('day', day, *rest), measures)
+        _add(rows, ('month', day.replace(day=1), *rest), measures)
+    return rows
+
+
+def apply(delta):
+    """Add `delta` ({key: measures}) to the rollup table"""
+    if delta:
+        _write(_by_grain(delta))
+
+
+def _write(rows):
+    """Add {stored key: measures} (see `_by_grain`) to the rollup table"""
+    if connection.vendor not in ('sqlite', 'postgresql'):
+        for key, measures in rows.items():
+            _apply_one(key, measures)
+        return
+    with connection.cursor() as cursor:
+        for uncategorised in (False, True):
+            params = [_row_params(key, measures) for key, measures in rows.items()
+                      if (key[4] is None) == uncategorised]
+            if params:
+                cursor.executemany(_upsert_sql(uncategorised), params)
+
+
+KEY_FIELDS = ('grain', 'day', 'place', 'waste_type', 'category', 'status')
+
+
+def _upsert_sql(uncategorised):
+    """
+    INSERT ... ON CONFLICT DO UPDATE that adds to an existing row. Uncategorised
+    keys conflict on the partial unique index.
+    """
+    from .models import ImpactRollup
+
+    quote = connection.ops.quote_name
+    table = quote(ImpactRollup._meta.db_table)
+    keys = [quote(ImpactRollup._meta.get_field(name).column) for name in KEY_FIELDS]
+    columns = keys + [quote(ImpactRollup._meta.get_field(name).column) for name in ('area', *MEASURES)]
+    measures = columns[len(keys) + 1:]
+    category = quote(ImpactRollup._meta.get_field('category').column)
+    if uncategorised:
+        target = f'({", ".join(c for c in keys if c != category)}) WHERE {category} IS NULL'
+    else:
+        target = f'({", ".join(keys)})'
+    return (
+        f'INSERT INTO {table} ({", ".join(columns)}) VALUES ({", ".join(["%s"] * len(columns))}) '
+        f'ON CONFLICT {target} DO UPDATE SET '
+        + ', '.join(f'{column} = {table}.{column} + excluded.{column}' for column in measures)
+    )
+
+
+def _row_params(key, measures):
+    from .models import ImpactRollup
+
+    grain, day, *rest = key
+    params = [grain, connection.ops.adapt_datefield_value(day), *rest, area_name(key[2])]
+    for name, value in zip(MEASURES, measures):
+        field = ImpactRollup._meta.get_field(name)
+        if field.get_internal_type() == 'DecimalField':
+            value = connection.ops.adapt_decimalfield_value(value, field.max_digits, field.decimal_places)
+        params.append(value)
+    return params
+
+
+def _lookup(key):
+    return dict(zip(('grain', 'day', 'place', 'waste_type', 'category_id', 'status'), key))
+
+
+def _apply_one(key, measures):
+    """UPDATE, then INSERT if the row does not exist yet (databases without ON CONFLICT)"""
+    from .models import ImpactRollup
+
+    rows = ImpactRollup.objects.filter(**_lookup(key))
+    increments = {name: F(name) + value for name, value in zip(MEASURES, measures)}
+    if rows.update(**increments):
+        return
+    try:
+        with transaction.atomic():
+            ImpactRollup.objects.create(**_lookup(key), area=area_name(key[2]), **dict(zip(MEASURES, measures)))
+    except IntegrityError:
+        # Created concurrently since the UPDATE above
+        rows.update(**increments)
+
+
+@contextmanager
+def track(queryset):
+    """
+    Fold whatever the wrapped bulk write changes in `queryset`'s rows into the
+    rollups. The queryset must select the same rows before and after (filter by pk).
+    """
+    before = aggregate(queryset)
+    yield
+    apply(difference(aggregate(queryset), before))
+
+
+def aggregate_range(lo, hi):
+    from .models import WasteItem
+
+    return aggregate(WasteItem.objects.filter(pk__gte=lo, pk__lt=hi))
+
+
+def aggregate_archived_range(lo, hi):
+    from .models import ArchivedWasteItem
+
+    return aggregate(ArchivedWasteItem.objects.filter(pk__gte=lo, pk__lt=hi))
+
+
+def lock_table(model):
+    """
+    Hold off every other write to `model`'s table until the current
+    transaction ends; reads go on. SQLite has one writer at a time, so there
+    the first write (the caller's DELETE) is what takes the lock; other
+    databases lock the existing rows.
+    """
+    if connection.vendor == 'postgresql':
+        with connection.cursor() as cursor:
+            cursor.execute(f'LOCK TABLE {connection.ops.quote_name(model._meta.db_table)} IN SHARE ROW EXCLUSIVE MODE')
+    elif connection.vendor != 'sqlite':
+        list(model.objects.select_for_update().values_list('pk'))
+
+
+def rebuild(chunk_size=50000, workers=1):
+    """
+    Recompute the whole rollup table from WasteItem and ArchivedWasteItem,
+    scanning them in ID-range chunks (optionally in parallel) and swapping
+    the result in with one transaction. The table is locked before the scan:
+    a write that lands first is in the scan, one that waits is applied to the
+    new rows. Returns (items scanned, rollup rows written).
+    """
+    from .models import ArchivedWasteItem, ImpactRollup, WasteItem
+
+    with transaction.atomic():
+        lock_table(ImpactRollup)
+        ImpactRollup.objects.all().delete()
+        totals = {}
+        for model, func in ((WasteItem, aggregate_range), (ArchivedWasteItem, aggregate_archived_range)):
+            bounds = model.objects.aggregate(lo=Min('pk'), hi=Max('pk'))
+            if bounds['lo'] is None:
+                continue
+            chunks = id_ranges(bounds['lo'], bounds['hi'] + 1, chunk_size)
+            for chunk_totals in run_chunks(func, chunks, workers=workers):
+                for key, measures in chunk_totals.items():
+                    _add(totals, key, measures)
+
+        rows = {key: m for key, m in _by_grain(totals).items() if any(m)}
+        if connection.vendor in ('sqlite', 'postgresql'):
+            # Into an empty table the upsert is a plain batched INSERT, without a model instance per row
+            _write(rows)
+        else:
+            ImpactRollup.objects.bulk_create(
+                [ImpactRollup(**_lookup(key), area=area_name(key[2]), **dict(zip(MEASURES, m)))
+                 for key, m in rows.items()], batch_size=1000)
+    return sum(m[0] for m in totals.values()), len(rows)
+
+
+# Report dimensions: name -> values() argument
+DIMENSIONS = {
+    'year': TruncYear('day'),
+    'month': TruncMonth('day'),
+    'day': F('day'),
+    'area': F('place'),
+    'waste_type': F('waste_type'),
+    'category': F('category__name'),
+    'status': F('status'),
+}
+TIME_DIMENSIONS = ('year', 'month', 'day')
+
+
+def _month_start(value, round_up=False):
+    first = value.replace(day=1)
+    if round_up and first != value:
+        first = (first + datetime.timedelta(days=32)).replace(day=1)
+    return first
+
+
+def _period(start, end, daily=False):
+    """
+    Rows covering [start, end]: month rows for the whole months in the range and
+    day rows only for the partial months at either end (or day rows throughout
+    when the report is grouped by day).
+    """
+    if daily:
+        q = Q(grain='day')
+        if start:
+            q &= Q(day__gte=start)
+        if end:
+            q &= Q(day__lte=end)
+        return q
+
+    months_from = start and _month_start(start, round_up=True)
+    months_to = end and _month_start(end + datetime.timedelta(days=1))  # exclusive
+    if months_from and months_to and months_from >= months_to:
+        return _period(start, end, daily=True)
+    q = Q(grain='month')
+    if months_from:
+        q &= Q(day__gte=months_from)
+    if months_to:
+        q &= Q(day__lt=months_to)
+    if start and start < months_from:
+        q |= Q(grain='day', day__gte=start, day__lt=months_from)
+    if end and months_to <= end:
+        q |= Q(grain='day', day__gte=months_to, day__lte=end)
+    return q
+
+
+def report(start=None, end=None, group_by=('month',), area=None, waste_type=None, status=None, category=None):
+    """
+    Totals from the rollup table grouped by `group_by` dimensions, as a list of
+    dicts with the dimension values, items, weight_kg, tonnes and credits.
+    """
+    from .models import ImpactRollup
+
+    rows = ImpactRollup.objects.filter(_period(start, end, daily='day' in group_by))
+    if area:
+        rows = rows.filter(place__in={places.place_id(area), area_for(area)})
+    for name, value in (('waste_type', waste_type), ('status', status), ('category', category)):
+        if value:
+            rows = rows.filter(**{name: value})
+
+    group_by = [name for name in DIMENSIONS if name in group_by]
+    rows = (
+        rows.order_by()
+        .values(**{f'g_{name}': DIMENSIONS[name] for name in group_by})
+        # Areas are grouped by place and shown by name (the same for every row of a place)
+        .annotate(n=Sum('items'), kg=Sum('weight_kg'), estimated=Sum('estimated_credits'),
+                  earned=Sum('credits_earned'), area_name=Max('area'))
+        .order_by(*['area_name' if name == 'area' else f'g_{name}' for name in group_by])
+    )
+    results = []
+    for row in rows:
+        if not row['n'] and not row['kg'] and not row['earned']:
+            continue
+        result = {name: row['area_name'] if name == 'area' else row[f'g_{name}'] for name in group_by}
+        weight = Decimal(str(row['kg'] or 0)).quantize(KG)
+        result.update(
+            items=row['n'] or 0,
+            weight_kg=weight,
+            tonnes=(weight / 1000).quantize(KG),
+            estimated_credits=Decimal(str(row['estimated'] or 0)).quantize(Decimal('0.01')),
+            credits_earned=Decimal(str(row['earned'] or 0)).quantize(Decimal('0.01')),
+        )
+        results.append(result)
+    return results
+
+
+def _shift_year(value, years):
+    try:
+        return value.replace(year=value.year + years)
+    except ValueError:  # 29 February
+        return value.replace(year=value.year + years, day=28)
+
+
+def year_over_year(start, end, group_by=('month',), **filters):
+    """`report()` for [start, end] with each row's figures for the same period a year earlier"""
+    current = report(start, end, group_by, **filters)
+    previous = report(start and _shift_year(start, -1), end and _shift_year(end, -1), group_by, **filters)
+
+    def key(row, shift):
+        return tuple(
+            _shift_year(row[name], 1) if shift and name in TIME_DIMENSIONS else row[name]
+            for name in group_by if name in row
+        )
+
+    earlier = {key(row, True): row for row in previous}
+    for row in current:
+        before = earlier.get(key(row, False))
+        row['previous_items'] = before['items'] if before else 0
+        row['previous_tonnes'] = before['tonnes'] if before else Decimal('0.000')
+        row['tonnes_change_pct'] = (
+            round(100 * (row['tonnes'] - before['tonnes']) / before['tonnes'], 1)
+            if before and before['tonnes'] else None
+        )
+    return current
@@ -0,0 +1,549 @@
+"""
+Versioned JSON API (`/api/v1/`) for mobile and low-bandwidth clients.
+
+* Lists are newest first and paged by primary key (`?after=<id>&limit=<n>`),
+  so a page costs the same however deep it is; `next` links the next page.
+  History lists read the archive tables too (core/archive.py).
+* `?fields=id,title,status` returns only those fields and loads only their
+  columns (`QuerySet.only()` plus `select_related()` for related names).
+* POST /waste/ takes one listing or a list of up to `API_MAX_BATCH`
+  listings, validated together and inserted in one transaction.
+* Responses are compressed by `CompressionMiddleware` (brotli or gzip).
+* /sync/ serves offline clients: changes since a checkpoint and replayed
+  actions with idempotency keys (core/sync.py).
+
+Clients sign in with POST /session/ and then use the session cookie; unsafe
+requests carry the returned CSRF token in `X-CSRFToken`, like the HTML forms.
+"""
+
+import json
+from collections import Counter
+from functools import wraps
+
+from django.conf import settings
+from django.contrib.auth import authenticate, login, logout
+from django.db import transaction
+from django.db.models import Q, Sum
+from django.http import HttpResponse, JsonResponse
+from django.middleware.csrf import CsrfViewMiddleware, get_token
+from django.utils import timezone
+from django.utils.cache import patch_cache_control
+from django.views.decorators.csrf import csrf_exempt
+
+from . import analytics, archive, counters, dedup, importer, leaderboard, metrics, places, refdata, sync
+from .forms import WasteItemApiForm
+from .models import ArchivedMatch, ArchivedWasteItem, CreditTransaction, Match, WasteItem
+
+
+class ApiError(Exception):
+    def __init__(self, status, message, details=None):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+        self.details = details
+
+
+def error_response(status, message, details=None):
+    body = {'error': message}
+    if details:
+        body['details'] = details
+    return JsonResponse(body, status=status)
+
+
+def _csrf_failure(request):
+    """The CSRF middleware's verdict on a session-authenticated unsafe request"""
+    return CsrfViewMiddleware(lambda r: None).process_view(request, None, (), {})
+
+
+def api_view(*methods, login_required=True):
+    """JSON errors instead of redirects, 405 for other methods, CSRF checked for signed-in writes"""
+    def decorator(view):
+        @csrf_exempt
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            if request.method not in methods:
+                response = error_response(405, f"Method {request.method} not allowed")
+                response['Allow'] = ', '.join(methods)
+                return response
+            if login_required and not request.user.is_authenticated:
+                return error_response(401, "Authentication required")
+            if request.user.is_authenticated and request.method not in ('GET', 'HEAD', 'OPTIONS'):
+                if _csrf_failure(request) is not None:
+                    return error_response(403, "CSRF token missing or incorrect")
+            try:
+                return view(request, *args, **kwargs)
+            except ApiError as exc:
+                return error_response(exc.status, exc.message, exc.details)
+        return wrapped
+    return decorator
+
+
+def read_json(request):
+    try:
+        return json.loads(request.body or b'null')
+    except ValueError:
+        raise ApiError(400, "Request body is not valid JSON")
+
+
+# Serialised fields: name -> (only() path, select_related() path or None, attribute path)
+def field(path, related=None):
+    attribute = path.split('__')
+    if path.endswith('_id'):
+        path = path[:-3]
+    return path, related, attribute
+
+
+def _value(obj, attribute):
+    for name in attribute:
+        if obj is None:
+            return None
+        obj = getattr(obj, name)
+    return obj
+
+
+WASTE_FIELDS = {
+    'id': field('id'),
+    'title': field('title'),
+    'description': field('description'),
+    'waste_type': field('waste_type'),
+    'category': field('category__name', 'category'),
+    'category_id': field('category_id'),
+    'quantity': field('quantity'),
+    'unit': field('unit'),
+    'location': field('location'),
+    'place': field('place'),
+    'status': field('status'),
+    'estimated_credits': field('estimated_credits'),
+    'credits_earned': field('credits_earned'),
+    'poster': field('poster__username', 'poster'),
+    'created_at': field('created_at'),
+    'updated_at': field('updated_at'),
+}
+
+MATCH_FIELDS = {
+    'id': field('id'),
+    'status': field('status'),
+    'message': field('message'),
+    'waste_item_id': field('waste_item_id'),
+    'waste_item': field('waste_item__title', 'waste_item'),
+    'poster': field('waste_item__poster__username', 'waste_item__poster'),
+    'collector': field('collector__username', 'collector'),
+    'location': field('waste_item__location', 'waste_item'),
+    'pickup_start': field('slot__start', 'slot'),
+    'pickup_end': field('slot__end', 'slot'),
+    'created_at': field('created_at'),
+    'updated_at': field('updated_at'),
+}
+
+# The same names over ArchivedMatch, which keeps what it shows of the listing
+ARCHIVED_MATCH_FIELDS = dict(
+    MATCH_FIELDS,
+    waste_item_id=field('waste_item_ref'),
+    waste_item=field('waste_item_title'),
+    poster=field('poster__username', 'poster'),
+    location=field('location'),
+    pickup_start=field('pickup_start'),
+    pickup_end=field('pickup_end'),
+)
+
+CREDIT_FIELDS = {
+    'id': field('id'),
+    'transaction_type': field('transaction_type'),
+    'amount': field('amount'),
+    'reason': field('reason'),
+    'created_at': field('created_at'),
+}
+
+
+def requested_fields(request, available):
+    """Names asked for with `?fields=`, or every field"""
+    names = [name.strip() for name in request.GET.get('fields', '').split(',') if name.strip()]
+    if not names:
+        return list(available)
+    unknown = [name for name in names if name not in available]
+    if unknown:
+        raise ApiError(400, f"Unknown fields: {', '.join(unknown)}", {'available': list(available)})
+    return names
+
+
+def sparse(queryset, names, available):
+    """Load only the columns (and joins) that `names` need"""
+    paths = [available[name][0] for name in names]
+    related = {available[name][1] for name in names} - {None}
+    if related:
+        queryset = queryset.select_related(*related)
+    return queryset.only(*paths)
+
+
+def serialise(obj, names, available):
+    return {name: _value(obj, available[name][2]) for name in names}
+
+
+def _int_param(request, name, default=None, minimum=1, maximum=None):
+    raw = request.GET.get(name)
+    if raw in (None, ''):
+        return default
+    try:
+        value = int(raw)
+    except ValueError:
+        raise ApiError(400, f"{name} must be an integer")
+    if value < minimum:
+        raise ApiError(400, f"{name} must be at least {minimum}")
+    return min(value, maximum) if maximum else value
+
+
+def paginate(request, queryset, available, extra=None, archived=None):
+    """
+    One keyset page of `queryset`, newest first, as a JSON response.
+    `archived` is an (archive queryset, fields) pair merged in by id; archived
+    rows keep their original ids, so the tiers never share one.
+    """
+    names = requested_fields(request, available)
+    after = _int_param(request, 'after')
+    limit = _int_param(request, 'limit', getattr(settings, 'API_PAGE_SIZE', 50),
+                       maximum=getattr(settings, 'API_MAX_PAGE_SIZE', 200))
+    rows = []
+    for tier, tier_fields in [(queryset, available)] + ([archived] if archived else []):
+        tier = sparse(tier, names, tier_fields).order_by('-pk')
+        if after is not None:
+            tier = tier.filter(pk__lt=after)
+        rows += [(row, tier_fields) for row in tier[:limit + 1]]
+    rows.sort(key=lambda row: row[0].pk, reverse=True)
+    next_url = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        params = request.GET.copy()
+        params['after'] = rows[-1][0].pk
+        next_url = f'{request.path}?{params.urlencode()}'
+    body = dict(extra or {}, results=[serialise(row, names, fields) for row, fields in rows], next=next_url)
+    return JsonResponse(body)
+
+
+def detail(request, obj_queryset, available):
+    names = requested_fields(request, available)
+    obj = sparse(obj_queryset, names, available).first()
+    if obj is None:
+        raise ApiError(404, "Not found")
+    return JsonResponse(serialise(obj, names, available))
+
+
+def as_batch(payload):
+    """A JSON object or a list of them, as a list, within the batch limit"""
+    items = payload if isinstance(payload, list) else [payload]
+    limit = getattr(settings, 'API_MAX_BATCH', 100)
+    if not items or not all(isinstance(item, dict) for item in items):
+        raise ApiError(400, "Expected a JSON object or a list of objects")
+    if len(items) > limit:
+        raise ApiError(400, f"At most {limit} objects per request")
+    return items
+
+
+@api_view('POST', 'DELETE', login_required=False)
+def session(request):
+    """Sign in with {"username", "password"} (POST) or sign out (DELETE)"""
+    if request.method == 'DELETE':
+        logout(request)
+        return HttpResponse(status=204)
+    credentials = read_json(request)
+    if not isinstance(credentials, dict):
+        raise ApiError(400, "Expected a JSON object")
+    user = authenticate(request, username=credentials.get('username'), password=credentials.get('password'))
+    if user is None:
+        raise ApiError(400, "Invalid username or password")
+    login(request, user)
+    return JsonResponse({'username': user.username, 'user_type': user.user_type, 'csrf_token': get_token(request)})
+
+
+@api_view('GET', 'POST')
+def waste_items(request):
+    """
+    GET: listings, available ones by default (`status`, `waste_type`, `mine=1`).
+    POST: create one listing or a batch; all or nothing.
+    """
+    if request.method == 'POST':
+        return create_waste_items(request)
+    if request.GET.get('mine') == '1':
+        filters = {'poster': request.user}
+    else:
+        filters = {'status': request.GET.get('status') or 'available'}
+    if request.GET.get('waste_type'):
+        filters['waste_type'] = request.GET['waste_type']
+    # Only finished listings are archived, so the available list stays on the live table
+    archived = None
+    if 'poster' in filters or filters['status'] in archive.ARCHIVED_STATUSES:
+        archived = (ArchivedWasteItem.objects.filter(**filters), WASTE_FIELDS)
+    return paginate(request, WasteItem.objects.filter(**filters), WASTE_FIELDS, archived=archived)
+
+
+def create_waste_items(request):
+    payload = as_batch(read_json(request))
+    category_ids = refdata.get().category_names.keys()
+    forms = [WasteItemApiForm(data, category_ids=category_ids) for data in payload]
+    errors = {index: form.errors.get_json_data() for index, form in enumerate(forms) if not form.is_valid()}
+    if errors:
+        raise ApiError(400, "Invalid listings", errors)
+
+    items = []
+    for form in forms:
+        data = dict(form.cleaned_data)
+        item = WasteItem(poster=request.user, category_id=data.pop('category'), **data)
+        item.calculate_estimated_credits()
+        item.place = places.place_id(item.location, listing=True)
+        items.append(item)
+    with transaction.atomic():
+        created = WasteItem.objects.bulk_create(items)
+        # bulk_create skips save(), so fold the new rows into the rollups here
+        analytics.apply(analytics.aggregate(WasteItem.objects.filter(pk__in=[item.pk for item in created])))
+        counters.bump({(request.user.pk, 'items_posted'): len(created)})
+        dedup.check(created)
+    names = requested_fields(request, WASTE_FIELDS)
+    rows = sparse(WasteItem.objects.filter(pk__in=[item.pk for item in created]), names, WASTE_FIELDS)
+    return JsonResponse({'results': [serialise(row, names, WASTE_FIELDS) for row in rows.order_by('pk')]},
+                        status=201)
+
+
+@api_view('POST')
+def import_waste_items(request):
+    """Multipart upload of a CSV `file` (`?dry_run=1` only validates); invalid rows are reported and skipped"""
+    upload = request.FILES.get('file')
+    if upload is None:
+        raise ApiError(400, "Upload the CSV as the multipart field 'file'")
+    result = importer.import_listings(upload, request.user, dry_run=request.GET.get('dry_run') == '1')
+    return JsonResponse({
+        'rows': result.rows,
+        'created': result.created,
+        'invalid': result.invalid,
+        'errors': [{'line': line, 'errors': errors} for line, errors in result.errors],
+    }, status=201 if result.created and request.GET.get('dry_run') != '1' else 200)
+
+
+@api_view('GET')
+def waste_item(request, pk):
+    try:
+        return detail(request, WasteItem.objects.filter(pk=pk), WASTE_FIELDS)
+    except ApiError as error:
+        if error.status != 404:
+            raise
+    # Finished listings may have moved to the archive
+    return detail(request, ArchivedWasteItem.objects.filter(pk=pk), WASTE_FIELDS)
+
+
+@api_view('GET', 'POST')
+def matches(request):
+    """
+    GET: the user's collection requests, made (`role=collector`) or received
+    (`role=poster`), optionally by `status`.
+    POST: request one or more listings: {"waste_item_id", "message"}.
+    """
+    if request.method == 'POST':
+        return create_matches(request)
+    role = request.GET.get('role')
+    if role == 'collector':
+        found = Match.objects.filter(collector=request.user)
+        archived = ArchivedMatch.objects.filter(collector=request.user)
+    elif role == 'poster':
+        found = Match.objects.filter(waste_item__poster=request.user)
+        archived = ArchivedMatch.objects.filter(poster=request.user)
+    else:
+        found = Match.objects.filter(Q(collector=request.user) | Q(waste_item__poster=request.user))
+        archived = ArchivedMatch.objects.filter(Q(collector=request.user) | Q(poster=request.user))
+    if request.GET.get('status'):
+        found = found.filter(status=request.GET['status'])
+        archived = archived.filter(status=request.GET['status'])
+    return paginate(request, found, MATCH_FIELDS, archived=(archived, ARCHIVED_MATCH_FIELDS))
+
+
+def create_matches(request):
+    created = request_items(request.user, as_batch(read_json(request)))
+    names = requested_fields(request, MATCH_FIELDS)
+    rows = sparse(Match.objects.filter(pk__in=[match.pk for match in created]), names, MATCH_FIELDS)
+    return JsonResponse({'results': [serialise(row, names, MATCH_FIELDS) for row in rows.order_by('pk')]},
+                        status=201)
+
+
+def request_items(user, payload):
+    """Create pending matches for [{"waste_item_id", "message"}]; all or nothing"""
+    if user.user_type != 'collector':
+        raise ApiError(403, "Only collectors can request waste items")
+    wanted = {}
+    for index, data in enumerate(payload):
+        try:
+            wanted[index] = int(data.get('waste_item_id'))
+        except (TypeError, ValueError):
+            raise ApiError(400, "Invalid requests", {index: "waste_item_id must be an integer"})
+    available = dict(WasteItem.objects.filter(pk__in=wanted.values(), status='available')
+                     .exclude(poster=user).values_list('pk', 'poster_id'))
+    requested = set(Match.objects.filter(waste_item_id__in=wanted.values(), collector=user)
+                    .values_list('waste_item_id', flat=True))
+    repeated = {item_id for item_id, count in Counter(wanted.values()).items() if count > 1}
+    errors = {}
+    for index, item_id in wanted.items():
+        if item_id not in available:
+            errors[index] = "Waste item is not available"
+        elif item_id in requested or item_id in repeated:
+            errors[index] = "Already requested"
+    if errors:
+        raise ApiError(400, "Invalid requests", errors)
+
+    with transaction.atomic():
+        created = Match.objects.bulk_create([
+            Match(waste_item_id=wanted[index], collector=user, message=str(data.get('message', '')))
+            for index, data in enumerate(payload)
+        ])
+        received = Counter((available[item_id], 'pending_matches_received') for item_id in wanted.values())
+        counters.bump({**received, (user.pk, 'matches_made'): len(created)})
+    metrics.MATCH_TRANSITIONS.inc(len(created), from_status='new', to_status='pending')
+    return created
+
+
+@api_view('POST')
+def match_action(request, pk, action):
+    """accept / reject (the listing's poster) or complete (the collector)"""
+    return JsonResponse(apply_match_action(request.user, pk, action))
+
+
+def apply_match_action(user, pk, action):
+    match = Match.objects.select_related('waste_item__poster', 'collector').filter(pk=pk).first()
+    if match is None:
+        raise ApiError(404, "Not found")
+    if action == 'complete':
+        if user != match.collector:
+            raise ApiError(403, "Only the collector can complete this collection")
+        success, credits_awarded = match.complete_match()
+    elif action in ('accept', 'reject'):
+        if user != match.waste_item.poster:
+            raise ApiError(403, "You can only manage requests for your own waste items")
+        if action == 'accept':
+            success = match.accept_match()
+        else:
+            success = match.status == 'pending'
+            if success:
+                match.status = 'rejected'
+                match.save()
+        credits_awarded = 0
+    else:
+        raise ApiError(404, f"Unknown action {action}")
+    if not success:
+        raise ApiError(409, f"Cannot {action} a match that is {match.status}")
+    return {'id': match.pk, 'status': match.status, 'credits_awarded': credits_awarded}
+
+
+@api_view('GET')
+def credits(request):
+    """The user's balance and ledger, newest first"""
+    return paginate(request, CreditTransaction.objects.filter(user=request.user), CREDIT_FIELDS,
+                    extra={'balance': request.user.digital_credits})
+
+
+@api_view('GET')
+def dashboard(request):
+    """The numbers on the HTML dashboard, without the lists"""
+    user = request.user
+    now = timezone.now()
+    # Counts come from the user row (core/counters.py)
+    this_month = CreditTransaction.objects.filter(
+        user=user, transaction_type='credit', created_at__month=now.month, created_at__year=now.year,
+    ).aggregate(total=Sum('amount'))['total']
+    accepted = Match.objects.filter(collector=user, status='accepted').count()
+    board = 'collectors' if user.user_type in ('collector', 'recycler') else 'earners'
+    rank = leaderboard.rank(board, user)
+    return JsonResponse({
+        'balance': user.digital_credits,
+        'total_waste_posted': user.items_posted,
+        'total_credits_earned': archive.listing_credits(user),
+        'transaction_count': user.transaction_count,
+        'credits_this_month': this_month or 0,
+        'pending_matches': user.pending_matches_received,
+        'accepted_matches': accepted,
+        'leaderboard': {'board': board, 'rank': rank[0], 'score': rank[1]} if rank else None,
+    })
+
+
+SYNC_LISTING_FIELDS = ('id', 'title', 'waste_type', 'category_id', 'quantity', 'unit', 'location',
+                       'estimated_credits', 'poster', 'updated_at')
+SYNC_MATCH_FIELDS = ('id', 'status', 'waste_item_id', 'waste_item', 'location', 'pickup_start', 'pickup_end',
+                     'updated_at')
+SYNC_CREDIT_FIELDS = ('id', 'transaction_type', 'amount', 'reason', 'created_at')
+SYNC_ACTIONS = ('request', 'accept', 'reject', 'complete')
+
+
+def columnar(rows, names, available):
+    """Rows as {"columns": [...], "rows": [[...], ...]}: field names once, not per row"""
+    return {'columns': list(names),
+            'rows': [[_value(row, available[name][2]) for name in names] for row in rows]}
+
+
+@api_view('GET', 'POST')
+def delta_sync(request):
+    """
+    GET: changes since `?checkpoint=` (listings in `?area=`, by default the
+    user's; at most `?limit=` rows per stream). See core/sync.py.
+    POST: replay queued actions, [{"key", "type", ...}] with type request
+    ({"waste_item_id", "message"}), accept, reject or complete ({"match_id"}).
+    """
+    if request.method == 'POST':
+        return replay_actions(request)
+    limit = _int_param(request, 'limit', getattr(settings, 'SYNC_BATCH_SIZE', 200),
+                       maximum=getattr(settings, 'SYNC_MAX_BATCH_SIZE', 1000))
+    try:
+        found = sync.changes(
+            request.user, request.GET.get('checkpoint') or None, request.GET.get('area'), limit,
+            listings=sparse(WasteItem.objects.all(), SYNC_LISTING_FIELDS, WASTE_FIELDS),
+            matches=sparse(Match.objects.all(), SYNC_MATCH_FIELDS, MATCH_FIELDS),
+            credits=sparse(CreditTransaction.objects.all(), SYNC_CREDIT_FIELDS, CREDIT_FIELDS),
+        )
+    except ValueError as exc:
+        raise ApiError(400, str(exc))
+    return JsonResponse({
+        'checkpoint': found.checkpoint.dumps(),
+        'reset': found.reset,
+        'more': found.more,
+        'listings': columnar(found.listings, SYNC_LISTING_FIELDS, WASTE_FIELDS),
+        'matches': columnar(found.matches, SYNC_MATCH_FIELDS, MATCH_FIELDS),
+        'credits': columnar(found.credits, SYNC_CREDIT_FIELDS, CREDIT_FIELDS),
+        'removed': {'listings': found.removed_listings, 'matches': found.removed_matches},
+    })
+
+
+def replay_actions(request):
+    payload = as_batch(read_json(request))
+    for index, action in enumerate(payload):
+        key = action.get('key')
+        if not isinstance(key, str) or not 0 < len(key) <= 64:
+            raise ApiError(400, "Invalid actions", {index: "key must be a string of 1 to 64 characters"})
+        if action.get('type') not in SYNC_ACTIONS:
+            raise ApiError(400, "Invalid actions", {index: f"type must be one of {', '.join(SYNC_ACTIONS)}"})
+
+    def perform(action):
+        try:
+            # A failed action rolls back alone; its error is stored like a result
+            with transaction.atomic():
+                if action['type'] == 'request':
+                    match = request_items(request.user, [action])[0]
+                    return 201, {'id': match.pk, 'status': match.status}
+                try:
+                    match_id = int(action.get('match_id'))
+                except (TypeError, ValueError):
+                    raise ApiError(400, "match_id must be an integer")
+                return 200, apply_match_action(request.user, match_id, action['type'])
+        except ApiError as exc:
+            return exc.status, dict({'error': exc.message}, **({'details': exc.details} if exc.details else {}))
+
+    results = []
+    for action in payload:
+        status, body = sync.replay(request.user, action['key'], action['type'], lambda: perform(action))
+        results.append({'key': action['key'], 'status': status, 'body': body})
+    return JsonResponse({'results': results})
+
+
+@api_view('GET', login_required=False)
+def place_search(request):
+    """Location autocomplete: places matching `?q=` (one typo allowed), best first, at most `?limit=`"""
+    limit = _int_param(request, 'limit', 10, maximum=getattr(settings, 'PLACES_MAX_RESULTS', 25))
+    results = places.index().search(request.GET.get('q', ''), limit)
+    response = JsonResponse({'results': [
+        {'id': place.id, 'name': place.name, 'kind': place.kind, 'subcounty': place.subcounty}
+        for place in results
+    ]})
+    patch_cache_control(response, public=True, max_age=getattr(settings, 'PAGE_MAX_AGE', 60))
+    return response
@@ -0,0 +1,160 @@
+"""
+Hot/cold archival of finished listings and matches.
+
+WasteItem and Match keep every row ever written, so the queries over
+available listings and open requests scan all-time volume. `archive()`
+(`manage.py archive_finished`) moves finished rows last updated more than
+ARCHIVE_AFTER_DAYS ago into ArchivedWasteItem / ArchivedMatch, under their
+original ids:
+
+* recycled listings, and collected ones whose credits were awarded, with
+  every match on them (a listing with an accepted match is left alone);
+* rejected matches, whatever state their listing is in.
+
+Each chunk of ARCHIVE_CHUNK_SIZE rows is copied and deleted in one
+transaction, so an interrupted run leaves whole chunks archived and the
+next run carries on. The rows are deleted without signals: rollups and
+leaderboards are totals that archival does not change (their rebuilds read
+both tiers), offline copies already dropped the listings when they stopped
+being available, and finished matches stay valid where they are cached.
+CreditTransaction only names listings in its text, so the ledger is
+untouched. Dedup fingerprints of archived listings are dropped.
+
+History reads go through both tiers: `listings_for()` (the dashboard) and
+`listing_credits()` here, the API's paginated lists (see `api.paginate`)
+and the listing page, which falls back to the archived row.
+"""
+
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q, Sum
+from django.utils import timezone
+
+from . import counters
+
+ARCHIVED_STATUSES = ('collected', 'recycled')
+ITEM_FIELDS = ('id', 'poster_id', 'title', 'description', 'waste_type', 'category_id', 'quantity', 'unit',
+               'location', 'place', 'image', 'status', 'credits_earned', 'estimated_credits', 'credited_at',
+               'created_at', 'updated_at')
+MATCH_FIELDS = {
+    'id': 'id',
+    'waste_item_ref': 'waste_item_id',
+    'waste_item_title': 'waste_item__title',
+    'location': 'waste_item__location',
+    'poster_id': 'waste_item__poster_id',
+    'collector_id': 'collector_id',
+    'status': 'status',
+    'message': 'message',
+    'pickup_start': 'slot__start',
+    'pickup_end': 'slot__end',
+    'collected_at': 'completed_at',
+    'created_at': 'created_at',
+    'updated_at': 'updated_at',
+}
+
+
+def cutoff(now=None):
+    return (now or timezone.now()) - timedelta(days=getattr(settings, 'ARCHIVE_AFTER_DAYS', 90))
+
+
+def finished_items(before):
+    from .models import WasteItem
+
+    return (WasteItem.objects.filter(updated_at__lt=before)
+            .filter(Q(status='recycled') | Q(status='collected', credits_earned__gt=0))
+            .exclude(match__status='accepted'))
+
+
+def finished_matches(before):
+    from .models import Match
+
+    return Match.objects.filter(status='rejected', updated_at__lt=before)
+
+
+def _copy_matches(matches):
+    from .models import ArchivedMatch
+
+    archived = [ArchivedMatch(**dict(zip(MATCH_FIELDS, row))) for row in matches.order_by()
+                .values_list(*MATCH_FIELDS.values())]
+    ArchivedMatch.objects.bulk_create(archived)
+    # Archived requests still count as made, but a pending one is no longer waiting on its poster
+    waiting = Counter(match.poster_id for match in archived if match.status == 'pending')
+    counters.bump({(poster_id, 'pending_matches_received'): -n for poster_id, n in waiting.items()})
+
+
+def _raw_delete(queryset):
+    # A plain DELETE: no signals (see the module docstring) and no cascade, dependants go first
+    return queryset._raw_delete(queryset.db)
+
+
+def archive_items(pks, before):
+    """Move these listings (those still finished) and their matches; returns (listings, matches) moved"""
+    from .models import ArchivedWasteItem, DedupBucket, DuplicateCandidate, ListingFingerprint, Match, WasteItem
+
+    with transaction.atomic():
+        # Checked again inside the transaction: a listing may have changed since it was picked
+        rows = list(finished_items(before).filter(pk__in=pks).values_list(*ITEM_FIELDS))
+        pks = [row[0] for row in rows]
+        if not pks:
+            return 0, 0
+        ArchivedWasteItem.objects.bulk_create([ArchivedWasteItem(**dict(zip(ITEM_FIELDS, row))) for row in rows])
+        matches = Match.objects.filter(waste_item_id__in=pks)
+        _copy_matches(matches)
+        moved = _raw_delete(matches)
+        _raw_delete(DuplicateCandidate.objects.filter(Q(item_id__in=pks) | Q(duplicate_of_id__in=pks)))
+        _raw_delete(DedupBucket.objects.filter(item_id__in=pks))
+        _raw_delete(ListingFingerprint.objects.filter(item_id__in=pks))
+        _raw_delete(WasteItem.objects.filter(pk__in=pks))
+    return len(pks), moved
+
+
+def archive_matches(pks, before):
+    """Move these matches (those still finished); returns how many moved"""
+    with transaction.atomic():
+        matches = finished_matches(before).filter(pk__in=pks)
+        _copy_matches(matches)
+        return _raw_delete(matches)
+
+
+def _chunks(queryset, chunk_size):
+    last = 0
+    while True:
+        pks = list(queryset.filter(pk__gt=last).order_by('pk').values_list('pk', flat=True)[:chunk_size])
+        if not pks:
+            return
+        last = pks[-1]
+        yield pks
+
+
+def archive(chunk_size=None, now=None):
+    """Archive everything finished before ARCHIVE_AFTER_DAYS ago; returns (listings, matches) moved"""
+    chunk_size = chunk_size or getattr(settings, 'ARCHIVE_CHUNK_SIZE', 500)
+    before = cutoff(now)
+    items = matches = 0
+    for pks in _chunks(finished_items(before), chunk_size):
+        moved = archive_items(pks, before)
+        items += moved[0]
+        matches += moved[1]
+    for pks in _chunks(finished_matches(before), chunk_size):
+        matches += archive_matches(pks, before)
+    return items, matches
+
+
+def listings_for(user):
+    """The user's listings from both tiers, in the order they were posted"""
+    from .models import ArchivedWasteItem, WasteItem
+
+    hot = WasteItem.objects.filter(poster=user).order_by('pk')
+    archived = ArchivedWasteItem.objects.filter(poster=user).order_by('pk')
+    return sorted([*hot, *archived], key=lambda item: item.pk)
+
+
+def listing_credits(user):
+    """Credits earned from the user's listings over both tiers (the count is `User.items_posted`)"""
+    from .models import ArchivedWasteItem, WasteItem
+
+    return sum(model.objects.filter(poster=user).aggregate(credits=Sum('credits_earned'))['credits'] or 0
+               for model in (WasteItem, ArchivedWasteItem))
@@ -0,0 +1,83 @@
+"""
+Authenticated-user cache.
+
+`CachedModelBackend` serves `request.user` from the default cache for up to
+USER_CACHE_SECONDS instead of loading the row on every request. Each entry
+is tagged with the user's generation number and a shared epoch; `forget()`
+bumps the generation, so an entry written by a request that read the row
+before a change is never used after it. Forgetting more than
+USER_CACHE_BULK_FORGET users at once (a rebuild, a ledger repair) bumps the
+epoch instead: one cache write that drops every cached user. Every `User.save()` forgets the user through the receivers in
+core/models.py, both straight away and once the transaction commits.
+Writes that bypass save() must call `forget()` themselves (see
+`User.add_credits` and `jobs._add_balances`).
+
+This only holds with a cache every process shares: a `forget()` from a
+management command or a pool worker must reach the copies the web workers
+read. settings.CACHES configures one; a process-local backend (LocMemCache)
+is fine only for a single process, such as the test runner.
+"""
+
+import time
+
+from django.conf import settings
+from django.contrib.auth.backends import ModelBackend
+from django.core.cache import cache
+from django.db import transaction
+
+from . import metrics
+
+EPOCH_KEY = 'core.user.epoch'
+
+
+def _keys(user_id):
+    return f'core.user.{user_id}', f'core.user.{user_id}.generation'
+
+
+def _bump(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, time.time_ns(), None)
+
+
+def _current(key, found):
+    value = found.get(key)
+    if value is None:
+        # Seed with the clock so a value is never reused after the key is evicted
+        cache.add(key, time.time_ns(), None)
+        value = cache.get(key)
+    return value
+
+
+def forget(user_ids):
+    """Drop the cached copies of these users"""
+    user_ids = list(user_ids)
+    if len(user_ids) > getattr(settings, 'USER_CACHE_BULK_FORGET', 100):
+        _bump(EPOCH_KEY)
+        return
+    for user_id in user_ids:
+        _bump(_keys(user_id)[1])
+
+
+def forget_on_commit(user_ids):
+    """`forget()` now and again after the current transaction commits"""
+    user_ids = list(user_ids)
+    forget(user_ids)
+    transaction.on_commit(lambda: forget(user_ids))
+
+
+class CachedModelBackend(ModelBackend):
+    def get_user(self, user_id):
+        key, generation_key = _keys(user_id)
+        found = cache.get_many([key, generation_key, EPOCH_KEY])
+        tag = (_current(EPOCH_KEY, found), _current(generation_key, found))
+        entry = found.get(key)
+        if entry is not None and entry[0] == tag:
+            metrics.record_cache_lookup('user', True)
+            return entry[1]
+        metrics.record_cache_lookup('user', False)
+        user = super().get_user(user_id)
+        if user is not None:
+            cache.set(key, (tag, user), getattr(settings, 'USER_CACHE_SECONDS', 60))
+        return user
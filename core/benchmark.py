@@ -0,0 +1,401 @@
+"""
+Load generator behind `manage.py benchmark`.
+
+A pool of threads replays a weighted mix of realistic traffic, either through
+the Django test client (in-process, same database) or over HTTP against a
+running gunicorn. Every request is timed and grouped per endpoint so the run
+can be summarised as latency percentiles, throughput and error rate.
+"""
+
+import http.cookiejar
+import math
+import os
+import random
+import shutil
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.test import Client, RequestFactory
+from django.test.utils import override_settings
+from django.urls import reverse
+from django.views import static
+
+from . import analytics, media
+from .models import Match, User, WasteCategory, WasteItem
+
+PASSWORD = 'bench-pass-123'
+PREFIX = 'bench_'
+# Sent with every request, as browsers and mobile HTTP stacks do; sizes are recorded as sent
+ACCEPT_ENCODING = 'br, gzip'
+# The fields a listing card on a phone needs
+SPARSE_WASTE_FIELDS = 'id,title,quantity,unit,location,estimated_credits'
+LOCATIONS = ('Machakos Town', 'Athi River', 'Kangundo', 'Tala', 'Mwala', 'Kathiani')
+
+
+def seed(posters=20, collectors=20, items=500, batch_size=500, seed_value=None):
+    """Create (or reuse) the benchmark users and listings with bulk inserts"""
+    rng = random.Random(seed_value)
+    existing = User.objects.filter(username__startswith=PREFIX)
+    if existing.exists():
+        return
+    password = make_password(PASSWORD)  # Hash once, PBKDF2 per user would dominate seeding
+    category, _ = WasteCategory.objects.get_or_create(name='Plastic', defaults={'description': 'Plastic'})
+    User.objects.bulk_create(
+        [User(username=f'{PREFIX}poster_{i}', password=password, user_type='household',
+              location=rng.choice(LOCATIONS)) for i in range(posters)]
+        + [User(username=f'{PREFIX}collector_{i}', password=password, user_type='collector',
+                location=rng.choice(LOCATIONS)) for i in range(collectors)],
+        batch_size=batch_size,
+    )
+    poster_ids = list(User.objects.filter(username__startswith=f'{PREFIX}poster_').values_list('id', flat=True))
+    rows = []
+    for i in range(items):
+        item = WasteItem(
+            poster_id=rng.choice(poster_ids), title=f'Bench lot {i}', description='Sorted and bagged',
+            waste_type=rng.choice(WasteItem.WASTE_TYPES)[0], category=category,
+            quantity=Decimal(rng.randint(1, 200)), unit='kg', location=rng.choice(LOCATIONS),
+        )
+        item.calculate_estimated_credits()
+        rows.append(item)
+    with analytics.track(WasteItem.objects.filter(poster_id__in=poster_ids)):
+        WasteItem.objects.bulk_create(rows, batch_size=batch_size)
+
+
+class TestClientSession:
+    """In-process session backed by the Django test client"""
+
+    def __init__(self, user=None):
+        self.client = Client()
+        self.etags = {}
+        if user is not None:
+            self.client.force_login(user)
+
+    def request(self, method, path, data=None, revalidate=False):
+        headers = {'HTTP_ACCEPT_ENCODING': ACCEPT_ENCODING}
+        if revalidate and path in self.etags:
+            headers['HTTP_IF_NONE_MATCH'] = self.etags[path]
+        response = getattr(self.client, method)(path, data or {}, **headers)
+        if response.has_header('ETag'):
+            self.etags[path] = response['ETag']
+        return response.status_code, len(response.content)
+
+
+class HttpSession:
+    """Cookie-keeping HTTP session against a live server"""
+
+    def __init__(self, base_url, user=None):
+        self.base_url = base_url.rstrip('/')
+        self.cookies = http.cookiejar.CookieJar()
+        self.etags = {}
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(self.cookies), _NoRedirect,
+        )
+        if user is not None:
+            self.request('get', reverse('login'))
+            self.request('post', reverse('login'), {'username': user.username, 'password': PASSWORD})
+
+    def _csrf_token(self):
+        return next((c.value for c in self.cookies if c.name == 'csrftoken'), '')
+
+    def request(self, method, path, data=None, revalidate=False):
+        url = self.base_url + path
+        body = None
+        headers = {'Accept-Encoding': ACCEPT_ENCODING}
+        if method == 'post':
+            body = urllib.parse.urlencode(dict(data or {}, csrfmiddlewaretoken=self._csrf_token())).encode()
+            headers.update({'X-CSRFToken': self._csrf_token(), 'Referer': url})
+        if revalidate and path in self.etags:
+            headers['If-None-Match'] = self.etags[path]
+        req = urllib.request.Request(url, data=body, headers=headers, method=method.upper())
+        try:
+            with self.opener.open(req, timeout=30) as response:
+                if response.headers.get('ETag'):
+                    self.etags[path] = response.headers['ETag']
+                return response.status, len(response.read())
+        except urllib.error.HTTPError as exc:
+            # 304 Not Modified arrives as an HTTPError too
+            return exc.code, len(exc.read() or b'')
+
+
+class _NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, *args, **kwargs):
+        return None
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.bytes = defaultdict(int)
+
+    def record(self, endpoint, seconds, status, size):
+        with self.lock:
+            self.latencies[endpoint].append(seconds)
+            self.bytes[endpoint] += size
+            if status is None or status >= 400:
+                self.errors[endpoint] += 1
+
+
+def percentile(sorted_values, pct):
+    if not sorted_values:
+        return 0.0
+    # Nearest-rank method
+    rank = math.ceil(pct / 100 * len(sorted_values))
+    return sorted_values[max(0, min(len(sorted_values), rank) - 1)]
+
+
+def summarise(recorder, elapsed):
+    endpoints = {}
+    all_latencies = []
+    for endpoint, values in sorted(recorder.latencies.items()):
+        values = sorted(values)
+        all_latencies.extend(values)
+        endpoints[endpoint] = {
+            'requests': len(values),
+            'errors': recorder.errors[endpoint],
+            'error_rate': round(recorder.errors[endpoint] / len(values), 4),
+            'rps': round(len(values) / elapsed, 2),
+            'mean_ms': round(1000 * sum(values) / len(values), 2),
+            'p50_ms': round(1000 * percentile(values, 50), 2),
+            'p95_ms': round(1000 * percentile(values, 95), 2),
+            'p99_ms': round(1000 * percentile(values, 99), 2),
+            'avg_bytes': round(recorder.bytes[endpoint] / len(values)),
+        }
+    all_latencies.sort()
+    total_errors = sum(recorder.errors.values())
+    return {
+        'elapsed_s': round(elapsed, 3),
+        'requests': len(all_latencies),
+        'errors': total_errors,
+        'error_rate': round(total_errors / len(all_latencies), 4) if all_latencies else 0.0,
+        'rps': round(len(all_latencies) / elapsed, 2) if elapsed else 0.0,
+        'p50_ms': round(1000 * percentile(all_latencies, 50), 2),
+        'p95_ms': round(1000 * percentile(all_latencies, 95), 2),
+        'p99_ms': round(1000 * percentile(all_latencies, 99), 2),
+        'endpoints': endpoints,
+    }
+
+
+class Benchmark:
+    """Drive the traffic mix with `concurrency` threads until `requests` have been sent"""
+
+    # (scenario, weight)
+    MIX = (
+        ('anonymous_home', 30),
+        ('collector_waste_list', 15),
+        ('collector_waste_list_revisit', 5),
+        ('collector_dashboard', 15),
+        ('poster_dashboard', 10),
+        ('poster_post_waste', 10),
+        ('poster_post_waste_submit', 5),
+        ('match_flow', 10),
+        ('collector_api_waste_list', 10),
+        ('collector_api_waste_list_sparse', 5),
+        ('poster_api_dashboard', 5),
+    )
+
+    def __init__(self, requests=500, concurrency=8, base_url=None, seed_value=None):
+        self.total = requests
+        self.concurrency = concurrency
+        self.base_url = base_url
+        self.random = random.Random(seed_value)
+        self.recorder = Recorder()
+        self._sent = 0
+        self._lock = threading.Lock()
+        self.posters = list(User.objects.filter(username__startswith=f'{PREFIX}poster_'))
+        self.collectors = list(User.objects.filter(username__startswith=f'{PREFIX}collector_'))
+        self.item_ids = list(
+            WasteItem.objects.filter(poster__in=self.posters, status='available').values_list('id', flat=True)
+        )
+        names, weights = zip(*self.MIX)
+        self.scenarios, self.weights = names, weights
+
+    def session(self, user=None):
+        if self.base_url:
+            return HttpSession(self.base_url, user)
+        return TestClientSession(user)
+
+    def _claim(self):
+        with self._lock:
+            if self._sent >= self.total:
+                return False
+            self._sent += 1
+            return True
+
+    def timed(self, session, endpoint, method, path, data=None, revalidate=False):
+        start = time.perf_counter()
+        try:
+            status, size = session.request(method, path, data, revalidate)
+        except Exception:
+            status, size = None, 0
+        self.recorder.record(endpoint, time.perf_counter() - start, status, size)
+        return status
+
+    def worker(self, thread_index):
+        rng = random.Random(self.random.random() + thread_index)
+        sessions = {}
+
+        def session_for(user):
+            key = user.pk if user else None
+            if key not in sessions:
+                sessions[key] = self.session(user)
+            return sessions[key]
+
+        while self._claim():
+            scenario = rng.choices(self.scenarios, self.weights)[0]
+            poster = rng.choice(self.posters)
+            collector = rng.choice(self.collectors)
+            if scenario == 'anonymous_home':
+                self.timed(session_for(None), 'home', 'get', reverse('home'))
+            elif scenario == 'collector_waste_list':
+                self.timed(session_for(collector), 'waste_list', 'get', reverse('waste_list'))
+            elif scenario == 'collector_waste_list_revisit':
+                # A browser revisiting the page sends the ETag it was given
+                self.timed(session_for(collector), 'waste_list [revisit]', 'get', reverse('waste_list'),
+                           revalidate=True)
+            elif scenario == 'collector_dashboard':
+                self.timed(session_for(collector), 'dashboard', 'get', reverse('dashboard'))
+            elif scenario == 'poster_dashboard':
+                self.timed(session_for(poster), 'dashboard', 'get', reverse('dashboard'))
+            elif scenario == 'poster_post_waste':
+                self.timed(session_for(poster), 'post_waste', 'get', reverse('post_waste'))
+            elif scenario == 'collector_api_waste_list':
+                self.timed(session_for(collector), 'api_waste_items', 'get', reverse('api_waste_items'))
+            elif scenario == 'collector_api_waste_list_sparse':
+                self.timed(session_for(collector), 'api_waste_items [fields]', 'get',
+                           f"{reverse('api_waste_items')}?fields={SPARSE_WASTE_FIELDS}")
+            elif scenario == 'poster_api_dashboard':
+                self.timed(session_for(poster), 'api_dashboard', 'get', reverse('api_dashboard'))
+            elif scenario == 'poster_post_waste_submit':
+                self.timed(session_for(poster), 'post_waste [POST]', 'post', reverse('post_waste'), {
+                    'title': 'Bench submission', 'description': 'Bagged', 'quantity': '4', 'unit': 'kg',
+                    'location': rng.choice(LOCATIONS),
+                })
+            else:
+                self.match_flow(rng, session_for, collector)
+
+    def match_flow(self, rng, session_for, collector):
+        """Collector requests an item, the poster accepts, the collector completes"""
+        item_id = rng.choice(self.item_ids)
+        self.timed(session_for(collector), 'request_match', 'get',
+                   reverse('request_match', kwargs={'waste_item_id': item_id}))
+        match = Match.objects.filter(waste_item_id=item_id, collector=collector).select_related(
+            'waste_item__poster').first()
+        if match is None or match.status != 'pending':
+            return
+        self.timed(session_for(match.waste_item.poster), 'manage_match [accept]', 'get',
+                   reverse('manage_match', kwargs={'pk': match.pk, 'action': 'accept'}))
+        self.timed(session_for(collector), 'manage_match [complete]', 'get',
+                   reverse('manage_match', kwargs={'pk': match.pk, 'action': 'complete'}))
+
+    def run(self):
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            list(pool.map(self.worker, range(self.concurrency)))
+        return summarise(self.recorder, time.perf_counter() - start)
+
+
+class MediaBenchmark:
+    """
+    Concurrent downloads of large images. In-process, Django's `static()`
+    view (what DEBUG serving used) is compared with `media.serve` streaming
+    whole files, serving ranges, and offloading with X-Accel-Redirect; with
+    `base_url` the same files are fetched from a running server instead.
+    """
+
+    FOLDER = f'{PREFIX}media'
+
+    def __init__(self, files=4, size_mb=5, requests=200, concurrency=8, range_kb=1024, base_url=None):
+        self.files = files
+        self.size = int(size_mb * 1024 * 1024)
+        self.requests = requests
+        self.concurrency = concurrency
+        self.range_bytes = range_kb * 1024
+        self.base_url = base_url.rstrip('/') if base_url else None
+        self.factory = RequestFactory()
+
+    def make_files(self):
+        folder = os.path.join(settings.MEDIA_ROOT, self.FOLDER)
+        os.makedirs(folder, exist_ok=True)
+        names = []
+        for i in range(self.files):
+            name = f'{self.FOLDER}/image_{i}.jpg'
+            with open(os.path.join(settings.MEDIA_ROOT, name), 'wb') as fh:
+                fh.write(os.urandom(self.size))
+            names.append(name)
+        return folder, names
+
+    def variants(self):
+        whole = lambda name: static.serve(self.factory.get('/'), name, document_root=settings.MEDIA_ROOT)
+        served = lambda name, **headers: media.serve(self.factory.get('/', **headers), name)
+        if self.base_url:
+            return {
+                'http': lambda name: self.fetch(name),
+                'http [range]': lambda name: self.fetch(name, {'Range': f'bytes=0-{self.range_bytes - 1}'}),
+            }
+        return {
+            'static_serve (before)': whole,
+            'media_serve': served,
+            'media_serve [range]': lambda name: served(name, HTTP_RANGE=f'bytes=0-{self.range_bytes - 1}'),
+            'media_serve [x-accel]': served,
+        }
+
+    def fetch(self, name, headers=None):
+        request = urllib.request.Request(f'{self.base_url}{settings.MEDIA_URL}{name}', headers=headers or {})
+        with urllib.request.urlopen(request, timeout=60) as response:
+            size = 0
+            while chunk := response.read(256 * 1024):
+                size += len(chunk)
+            return response.status, size
+
+    @staticmethod
+    def consume(response):
+        """Read the body like a WSGI server without file_wrapper would"""
+        try:
+            if response.streaming:
+                return response.status_code, sum(len(chunk) for chunk in response.streaming_content)
+            return response.status_code, len(response.content)
+        finally:
+            response.close()
+
+    def run_variant(self, download, names):
+        recorder = Recorder()
+
+        def one(index):
+            name = names[index % len(names)]
+            start = time.perf_counter()
+            try:
+                result = download(name)
+                status, size = result if isinstance(result, tuple) else self.consume(result)
+            except Exception:
+                status, size = None, 0
+            recorder.record('download', time.perf_counter() - start, status, size)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            list(pool.map(one, range(self.requests)))
+        elapsed = time.perf_counter() - start
+        report = summarise(recorder, elapsed)['endpoints']['download']
+        report['mb_per_s'] = round(recorder.bytes['download'] / elapsed / 1024 / 1024, 1)
+        return report
+
+    def run(self):
+        folder, names = self.make_files()
+        try:
+            report = {}
+            for variant, download in self.variants().items():
+                mode = 'x-accel' if 'x-accel' in variant else 'django'
+                with override_settings(MEDIA_SERVE_MODE=mode):
+                    report[variant] = self.run_variant(download, names)
+            return report
+        finally:
+            shutil.rmtree(folder, ignore_errors=True)
@@ -0,0 +1,122 @@
+"""
+Conditional GET (ETag / Last-Modified) and Cache-Control for HTML pages.
+
+A page's validators come from a cheap version query, never from rendering
+it: `listings_version` is the newest `updated_at` among available listings
+plus the newest tombstone ID (listings deleted or no longer available, see
+core/sync.py); `item_version` is one listing's `updated_at`. Mixed into the
+ETag are the viewer (the navbar shows the user and a CSRF-protected logout
+form) and the template files, so another account or a deploy never
+revalidates someone else's copy.
+
+Signed-in pages are sent `private, no-cache`: the browser keeps them and
+revalidates on every visit. Anonymous pages without cookies are `public`
+for PAGE_MAX_AGE seconds. A page with flash messages waiting is always
+rendered.
+"""
+
+import hashlib
+import os
+from datetime import datetime, timezone as dt_timezone
+from functools import lru_cache, wraps
+
+from django.conf import settings
+from django.contrib import messages
+from django.db.models import Max, Subquery
+from django.middleware.csrf import get_token
+from django.template.utils import get_app_template_dirs
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, quote_etag
+
+
+@lru_cache(maxsize=None)
+def templates_version():
+    """(digest, newest mtime) of the template files, computed once per process"""
+    digest = hashlib.sha1()
+    newest = 0
+    dirs = [d for engine in settings.TEMPLATES for d in engine.get('DIRS', [])]
+    for directory in sorted({*map(str, dirs), *map(str, get_app_template_dirs('templates'))}):
+        for root, _, files in sorted(os.walk(directory)):
+            for name in sorted(files):
+                stat = os.stat(os.path.join(root, name))
+                digest.update(f'{root}/{name}:{stat.st_size}:{stat.st_mtime_ns}'.encode())
+                newest = max(newest, stat.st_mtime)
+    return digest.hexdigest(), datetime.fromtimestamp(newest, dt_timezone.utc)
+
+
+def listings_version(request, *args, **kwargs):
+    """(last modified, version) of the available listings; last modified is None if there are none"""
+    from .models import Tombstone, WasteItem
+
+    newest_tombstone = Subquery(Tombstone.objects.order_by('-pk').values('pk')[:1])
+    # One query: the newest available listing (by the status/updated_at index) with the newest tombstone
+    row = (WasteItem.objects.filter(status='available').order_by('-updated_at')
+           .annotate(removed=newest_tombstone).values_list('updated_at', 'removed').first())
+    if row is None:
+        return None, Tombstone.objects.aggregate(last=Max('pk'))['last']
+    return row
+
+
+def item_version(request, pk, *args, **kwargs):
+    """(last modified, version) of one listing, or None if it does not exist"""
+    from .models import WasteItem
+
+    updated = WasteItem.objects.filter(pk=pk).values_list('updated_at', flat=True).first()
+    return (updated, pk) if updated else None
+
+
+def _validators(request, version):
+    """(ETag, Last-Modified datetime) of a page for this viewer"""
+    last_modified, token = version
+    template_digest, templates_modified = templates_version()
+    user = request.user
+    viewer = None
+    if user.is_authenticated:
+        # The logout form embeds a token for this CSRF secret; make sure it exists before hashing it
+        get_token(request)
+        viewer = (user.pk, user.get_username(), getattr(user, 'user_type', ''), request.META.get('CSRF_COOKIE'))
+    parts = repr((last_modified, token, viewer, template_digest))
+    times = [t for t in (last_modified, templates_modified, getattr(user, 'last_login', None)) if t]
+    return quote_etag(hashlib.sha1(parts.encode()).hexdigest()[:24]), max(times)
+
+
+def _cache_headers(request, response, validators):
+    if response.status_code not in (200, 304):
+        return response
+    if validators:
+        etag, last_modified = validators
+        response.headers.setdefault('ETag', etag)
+        response.headers.setdefault('Last-Modified', http_date(last_modified.timestamp()))
+    patch_vary_headers(response, ['Cookie'])
+    if request.user.is_authenticated or response.cookies or not validators:
+        patch_cache_control(response, private=True, no_cache=True)
+    else:
+        patch_cache_control(response, public=True, max_age=getattr(settings, 'PAGE_MAX_AGE', 60))
+    return response
+
+
+def conditional_page(version):
+    """
+    Answer GET/HEAD with 304 Not Modified when `version(request, *args,
+    **kwargs)` -> (last modified, token) and the viewer are unchanged; the
+    view runs only when the page has to be rendered.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapped(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            validators = None
+            if not len(messages.get_messages(request)):
+                current = version(request, *args, **kwargs)
+                if current:
+                    validators = _validators(request, current)
+            if validators:
+                etag, last_modified = validators
+                response = get_conditional_response(request, etag=etag,
+                                                    last_modified=int(last_modified.timestamp()))
+                if response is not None:
+                    return _cache_headers(request, response, validators)
+            return _cache_headers(request, view(request, *args, **kwargs), validators)
+        return wrapped
+    return decorator
@@ -0,0 +1,100 @@
+"""
+Per-user counters kept on the User row.
+
+The dashboard badges read these columns from the signed-in user instead of
+counting rows on every request:
+
+* `items_posted`: listings the user has posted, archived ones included;
+* `pending_matches_received`: pending requests on the user's live listings;
+* `matches_made`: requests the user has made, archived ones included;
+* `transaction_count`: the user's ledger entries.
+
+Every write that changes one of them calls `bump()` in the same transaction:
+save() and the delete receivers in core/models.py, and the bulk paths (API
+batches, CSV import, admin jobs, archival, ledger repair). `bump()` adds
+with F() expressions, so concurrent writers never lose an increment, and
+`User.save()` leaves the columns out so a stale instance cannot write an
+old count back. Generated data and anything else that bypasses these
+paths is brought back in line by `rebuild()` (`manage.py verify_counters`),
+which recounts users in ID ranges and rewrites only the rows that differ.
+"""
+
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import Count, F, Max, Min
+
+from .parallel import id_ranges
+
+FIELDS = ('items_posted', 'pending_matches_received', 'matches_made', 'transaction_count')
+
+
+def bump(changes):
+    """Apply {(user_id, counter): delta}; one UPDATE per user"""
+    from . import auth
+    from .models import User
+
+    by_user = defaultdict(dict)
+    for (user_id, name), delta in changes.items():
+        if delta and user_id is not None:
+            by_user[user_id][name] = by_user[user_id].get(name, 0) + delta
+    if not by_user:
+        return
+    with transaction.atomic(savepoint=False):
+        for user_id, deltas in by_user.items():
+            User.objects.filter(pk=user_id).update(**{name: F(name) + delta for name, delta in deltas.items()})
+    # The signed-in user is served from the cache with its counters
+    auth.forget_on_commit(by_user)
+
+
+def counts(lo, hi):
+    """{user id: {counter: value}} recounted for the users in [lo, hi) that have anything to count"""
+    from .models import ArchivedMatch, ArchivedWasteItem, CreditTransaction, Match, WasteItem
+
+    found = defaultdict(lambda: dict.fromkeys(FIELDS, 0))
+    queries = (
+        ('items_posted', WasteItem.objects.filter(poster_id__gte=lo, poster_id__lt=hi), 'poster_id'),
+        ('items_posted', ArchivedWasteItem.objects.filter(poster_id__gte=lo, poster_id__lt=hi), 'poster_id'),
+        ('pending_matches_received', Match.objects.filter(
+            status='pending', waste_item__poster_id__gte=lo, waste_item__poster_id__lt=hi), 'waste_item__poster_id'),
+        ('matches_made', Match.objects.filter(collector_id__gte=lo, collector_id__lt=hi), 'collector_id'),
+        ('matches_made', ArchivedMatch.objects.filter(collector_id__gte=lo, collector_id__lt=hi), 'collector_id'),
+        ('transaction_count', CreditTransaction.objects.filter(user_id__gte=lo, user_id__lt=hi), 'user_id'),
+    )
+    for name, rows, user_field in queries:
+        for user_id, n in rows.order_by().values(user_field).annotate(n=Count('pk')).values_list(user_field, 'n'):
+            found[user_id][name] += n
+    return found
+
+
+def rebuild(chunk_size=10000, lo=None, hi=None):
+    """
+    Recount the counters of every user (those with IDs in [lo, hi) if given)
+    and fix the ones that are off; returns (users checked, users fixed)
+    """
+    from . import auth
+    from .models import User
+
+    users = User.objects.all()
+    if lo is not None:
+        users = users.filter(pk__gte=lo, pk__lt=hi)
+    bounds = users.aggregate(lo=Min('pk'), hi=Max('pk'))
+    if bounds['lo'] is None:
+        return 0, 0
+    checked = fixed = 0
+    for lo, hi in id_ranges(bounds['lo'], bounds['hi'] + 1, chunk_size):
+        with transaction.atomic():
+            stored = {pk: dict(zip(FIELDS, values)) for pk, *values in User.objects.filter(pk__gte=lo, pk__lt=hi)
+                      .values_list('pk', *FIELDS)}
+            expected = counts(lo, hi)
+            wrong = [pk for pk, values in stored.items() if expected[pk] != values]
+            # Grouped by the values to write, so users with the same counts share one UPDATE
+            groups = defaultdict(list)
+            for pk in wrong:
+                groups[tuple(expected[pk][name] for name in FIELDS)].append(pk)
+            for values, pks in groups.items():
+                User.objects.filter(pk__in=pks).update(**dict(zip(FIELDS, values)))
+            auth.forget_on_commit(wrong)
+        checked += len(stored)
+        fixed += len(wrong)
+    return checked, fixed
@@ -0,0 +1,304 @@
+"""
+Seeded, reproducible synthetic data for performance work.
+
+Rows are built in ID-range chunks. Every chunk draws from its own RNG seeded
+with (seed, table, chunk start), so the output depends only on the seed and
+the requested sizes, never on the number of worker processes. Users and
+listings get explicit primary keys (`id_base + index`), which lets a worker
+reference rows written by another worker without reading them back.
+
+Rows are written in batches (see `RowWriter`); model `save()` methods (and
+the credit logic in `WasteItem.save`) are deliberately bypassed. `finalize`
+then brings everything derived from them in line once: every generated
+user's balance becomes the sum of their transactions, their counters are
+recounted, and the rollups and leaderboards are rebuilt in ID-range chunks
+(folding each chunk in as it was written cost more than the inserts).
+"""
+
+import contextlib
+import itertools
+import random
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth.hashers import make_password
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from . import analytics, counters, leaderboard, places
+from .models import CreditTransaction, Match, User, WasteCategory, WasteItem
+
+PASSWORD = 'password123'
+
+# Ten-slot pattern gives 50% households, 20% farmers, 20% collectors, 10% recyclers
+USER_TYPE_PATTERN = ('household',) * 5 + ('farmer',) * 2 + ('collector',) * 2 + ('recycler',)
+POSTER_SLOTS = tuple(i for i, t in enumerate(USER_TYPE_PATTERN) if t in ('household', 'farmer'))
+COLLECTOR_SLOTS = tuple(i for i, t in enumerate(USER_TYPE_PATTERN) if t == 'collector')
+
+LOCATIONS = (
+    'Machakos Town', 'Mumbuni', 'Athi River', 'Syokimau', 'Mlolongo', 'Kangundo', 'Tala', 'Kathiani',
+    'Mwala', 'Masii', 'Matuu', 'Masinga', 'Kithimani', 'Kalama', 'Mua', 'Wamunyu',
+)
+# Relative weights: town centres post far more than rural wards
+LOCATION_WEIGHTS = (20, 8, 15, 10, 9, 6, 6, 4, 4, 3, 4, 2, 2, 3, 2, 2)
+
+WASTE_TYPES = [code for code, _label in WasteItem.WASTE_TYPES]
+WASTE_TYPE_WEIGHTS = (30, 15, 8, 6, 15, 12, 4, 6, 4)
+STATUSES = ('available', 'pending', 'collected', 'recycled')
+STATUS_WEIGHTS = (40, 15, 35, 10)
+UNITS = ('kg', 'kg', 'kg', 'bags', 'pieces')
+
+LOCATION_CUM_WEIGHTS = tuple(itertools.accumulate(LOCATION_WEIGHTS))
+WASTE_TYPE_CUM_WEIGHTS = tuple(itertools.accumulate(WASTE_TYPE_WEIGHTS))
+STATUS_CUM_WEIGHTS = tuple(itertools.accumulate(STATUS_WEIGHTS))
+
+ACCEPTED_FOR = {'pending': 'accepted', 'collected': 'completed', 'recycled': 'completed'}
+
+
+def chunk_rng(seed, table, lo):
+    return random.Random(f'{seed}:{table}:{lo}')
+
+
+def user_type(index):
+    return USER_TYPE_PATTERN[index % len(USER_TYPE_PATTERN)]
+
+
+def pick_index(rng, count, slots):
+    """
+    Skewed pick of a user index whose type slot is in `slots`: a few heavy
+    users get most of the activity, like real posting behaviour.
+    """
+    cycles = max(1, count // len(USER_TYPE_PATTERN))
+    cycle = min(int(cycles * rng.random() ** 2), cycles - 1)
+    slot = slots[int(rng.random() * len(slots))]
+    index = cycle * len(USER_TYPE_PATTERN) + slot
+    return index if index < count else slot % max(count, 1)
+
+
+@contextlib.contextmanager
+def preserve_timestamps(*models):
+    """Let bulk_create keep explicit created_at/updated_at values"""
+    fields = [
+        f for model in models for f in model._meta.concrete_fields
+        if getattr(f, 'auto_now', False) or getattr(f, 'auto_now_add', False)
+    ]
+    saved = [(f, f.auto_now, f.auto_now_add) for f in fields]
+    for f in fields:
+        f.auto_now = f.auto_now_add = False
+    try:
+        yield
+    finally:
+        for f, auto_now, auto_now_add in saved:
+            f.auto_now, f.auto_now_add = auto_now, auto_now_add
+
+
+class Plan:
+    """Sizes, seed and ID bases shared by every chunk of one run"""
+
+    def __init__(self, users, items, seed=0, prefix='gen', batch_size=2000, days=365):
+        self.users = users
+        self.items = items
+        self.seed = seed
+        self.prefix = prefix
+        self.batch_size = batch_size
+        self.days = days
+        self.now = timezone.now().replace(microsecond=0)
+        self.user_base = (User.objects.order_by('-id').values_list('id', flat=True).first() or 0) + 1
+        self.item_base = (WasteItem.objects.order_by('-id').values_list('id', flat=True).first() or 0) + 1
+        self.password = make_password(PASSWORD)  # One PBKDF2 hash shared by every generated user
+        self.category_ids = list(WasteCategory.objects.order_by('id').values_list('id', flat=True)) or [None]
+
+    def as_args(self):
+        return (self.users, self.items, self.seed, self.prefix, self.batch_size, self.days, self.now,
+                self.user_base, self.item_base, self.password, self.category_ids)
+
+    @classmethod
+    def from_args(cls, args):
+        plan = cls.__new__(cls)
+        (plan.users, plan.items, plan.seed, plan.prefix, plan.batch_size, plan.days, plan.now,
+         plan.user_base, plan.item_base, plan.password, plan.category_ids) = args
+        return plan
+
+
+class RowWriter:
+    """
+    Insert pre-built value tuples for `columns` of `model`.
+
+    Columns that are not supplied get their model default. The default path
+    sends each batch with a single `executemany`; `orm=True` builds model
+    instances and uses `bulk_create` instead, which is portable but spends most
+    of its time preparing values field by field (several times slower than the
+    raw path on SQLite).
+    """
+
+    def __init__(self, model, columns, batch_size, orm=False):
+        self.model = model
+        self.columns = columns
+        self.batch_size = batch_size
+        self.orm = orm
+        missing = [
+            f for f in model._meta.concrete_fields
+            if f.attname not in columns and not f.primary_key
+        ]
+        self.defaults = tuple(f.get_db_prep_save(f.get_default(), connection) for f in missing)
+        names = [model._meta.get_field(c).column for c in columns] + [f.column for f in missing]
+        self.sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+            connection.ops.quote_name(model._meta.db_table),
+            ', '.join(connection.ops.quote_name(name) for name in names),
+            ', '.join(['%s'] * len(names)),
+        )
+
+    def write(self, rows):
+        if self.orm:
+            objs = [self.model(**dict(zip(self.columns, row))) for row in rows]
+            with preserve_timestamps(self.model):
+                self.model.objects.bulk_create(objs, batch_size=self.batch_size)
+            return
+        defaults = self.defaults
+        with connection.cursor() as cursor:
+            for start in range(0, len(rows), self.batch_size):
+                cursor.executemany(self.sql, [row + defaults for row in rows[start:start + self.batch_size]])
+
+
+def cents_to_str(cents):
+    """Exact decimal string for an amount in cents (what the backends store anyway)"""
+    return f'{cents // 100}.{cents % 100:02d}'
+
+
+def db_datetime(value, orm=False):
+    """
+    Datetimes as the raw path hands them to the backend (naive UTC on SQLite).
+    The ORM path converts them itself and wants them aware.
+    """
+    return value.replace(tzinfo=None) if connection.vendor == 'sqlite' and not orm else value
+
+
+USER_COLUMNS = ('id', 'username', 'email', 'password', 'user_type', 'phone', 'location', 'place', 'date_joined',
+                'is_active')
+ITEM_COLUMNS = ('id', 'poster_id', 'title', 'description', 'waste_type', 'category_id', 'quantity', 'unit',
+                'location', 'place', 'status', 'credits_earned', 'estimated_credits', 'credited_at', 'created_at',
+                'updated_at')
+MATCH_COLUMNS = ('waste_item_id', 'collector_id', 'status', 'message', 'completed_at', 'created_at', 'updated_at')
+LEDGER_COLUMNS = ('user_id', 'amount', 'transaction_type', 'reason', 'created_at')
+
+
+def place_ids():
+    """The place ID of each of LOCATIONS, as save() would set it, resolved once per chunk"""
+    return {location: places.place_id(location) for location in LOCATIONS}
+
+
+def generate_users(plan_args, lo, hi, orm=False):
+    plan = Plan.from_args(plan_args)
+    rng = chunk_rng(plan.seed, 'users', lo)
+    now = db_datetime(plan.now, orm)
+    days = plan.days
+    place_of = place_ids()
+    rows = []
+    for index in range(lo, hi):
+        phone = f'07{rng.randint(10000000, 99999999)}'
+        location = rng.choices(LOCATIONS, cum_weights=LOCATION_CUM_WEIGHTS)[0]
+        rows.append((
+            plan.user_base + index,
+            f'{plan.prefix}_{index}',
+            f'{plan.prefix}_{index}@example.com',
+            plan.password,
+            user_type(index),
+            phone,
+            location,
+            place_of[location],
+            now - timedelta(days=days * rng.random()),
+            True,
+        ))
+    with transaction.atomic():
+        RowWriter(User, USER_COLUMNS, plan.batch_size, orm).write(rows)
+    return 'users', len(rows)
+
+
+def generate_items(plan_args, lo, hi, orm=False):
+    """Listings [lo, hi) plus the matches and ledger rows that follow from their status"""
+    plan = Plan.from_args(plan_args)
+    rng = chunk_rng(plan.seed, 'items', lo)
+    now = db_datetime(plan.now, orm)
+    items, matches, ledger = [], [], []
+    rates = WasteItem.CREDIT_RATES
+    category_ids = plan.category_ids
+    max_collectors = max(plan.users // 10, 1)
+    random_ = rng.random
+    choices = rng.choices
+    place_of = place_ids()
+
+    for index in range(lo, hi):
+        poster_id = plan.user_base + pick_index(rng, plan.users, POSTER_SLOTS)
+        waste_type = choices(WASTE_TYPES, cum_weights=WASTE_TYPE_CUM_WEIGHTS)[0]
+        status = choices(STATUSES, cum_weights=STATUS_CUM_WEIGHTS)[0]
+        # Amounts are kept in integer cents so they stay exact without Decimal arithmetic
+        quantity_cents = int(100 * min(rng.lognormvariate(2.3, 0.9), 9999))
+        estimated_cents = round(quantity_cents * rates[waste_type])
+        estimated = cents_to_str(estimated_cents)
+        created = now - timedelta(days=plan.days * random_() ** 1.5)
+        earned = estimated if status in ('collected', 'recycled') else '0.00'
+        item_id = plan.item_base + index
+        title = f'{waste_type.title()} lot #{index}'
+        category_id = category_ids[int(random_() * len(category_ids))]
+        unit = UNITS[int(random_() * len(UNITS))]
+        location = choices(LOCATIONS, cum_weights=LOCATION_CUM_WEIGHTS)[0]
+        updated = created + timedelta(hours=int(72 * random_()))
+
+        # One accepted/completed match for claimed lots, 0-2 pending requests on open ones
+        collectors = set()
+        wanted = min(1 if status in ACCEPTED_FOR else (0, 0, 1, 2)[int(random_() * 4)], max_collectors)
+        while len(collectors) < wanted:
+            collectors.add(plan.user_base + pick_index(rng, plan.users, COLLECTOR_SLOTS))
+        for n, collector_id in enumerate(sorted(collectors)):
+            requested = created + timedelta(hours=1 + int(47 * random_()))
+            match_status = ACCEPTED_FOR.get(status, 'pending') if n == 0 else 'pending'
+            match_updated = max(requested, updated) if n == 0 else requested
+            matches.append((
+                item_id, collector_id, match_status, 'Interested in collecting',
+                match_updated if match_status == 'completed' else None, requested, match_updated,
+            ))
+        credited = None
+        if earned != '0.00':
+            # The award is stamped with its ledger entry's time
+            credited = created + timedelta(days=1 + int(13 * random_()))
+            ledger.append((poster_id, earned, 'credit', f'Credits earned for waste collection: {title}', credited))
+        items.append((
+            item_id, poster_id, title, 'Sorted and ready for pickup', waste_type, category_id,
+            cents_to_str(quantity_cents), unit, location, place_of[location], status, earned, estimated, credited,
+            created, updated,
+        ))
+
+    with transaction.atomic():
+        RowWriter(WasteItem, ITEM_COLUMNS, plan.batch_size, orm).write(items)
+        RowWriter(Match, MATCH_COLUMNS, plan.batch_size, orm).write(matches)
+        RowWriter(CreditTransaction, LEDGER_COLUMNS, plan.batch_size, orm).write(ledger)
+    return 'items', len(items) + len(matches) + len(ledger)
+
+
+def finalize(plan, chunk_size=50000, workers=1):
+    """
+    Sync balances and counters with the generated rows, move sequences past
+    explicit IDs and rebuild the rollups and leaderboards
+    """
+    ledger_total = (
+        CreditTransaction.objects.filter(user=OuterRef('pk'), transaction_type='credit')
+        .order_by().values('user').annotate(total=Sum('amount')).values('total')
+    )
+    User.objects.filter(
+        id__gte=plan.user_base, id__lt=plan.user_base + plan.users,
+    ).update(digital_credits=Coalesce(Subquery(ledger_total), Value(Decimal('0'))))
+    counters.rebuild(lo=plan.user_base, hi=plan.user_base + plan.users)
+
+    sql = connection.ops.sequence_reset_sql(no_style(), [User, WasteItem])
+    if sql:
+        with connection.cursor() as cursor:
+            for statement in sql:
+                cursor.execute(statement)
+
+    # Rows were inserted without save(): recompute what save() would have kept up to date
+    analytics.rebuild(chunk_size=chunk_size, workers=workers)
+    places.invalidate()  # The rebuilt rollups name the generated areas
+    leaderboard.rebuild(chunk_size=chunk_size, workers=workers)
@@ -0,0 +1,221 @@
+"""
+Near-duplicate listing detection.
+
+Every listing gets a `ListingFingerprint`:
+
+* a 64-bit difference hash (dHash) of its image: the photo shrunk to 9x8
+  grey pixels, one bit per "is this pixel brighter than its right-hand
+  neighbour". Re-uploads, rescales and recompressions of the same photo
+  land within a few bits of each other;
+* a MinHash signature of the character 5-shingles of its title and
+  description: SIGNATURE_SIZE minimum hash values whose agreement rate
+  estimates the Jaccard similarity of two listings' shingle sets.
+
+Both are cut into bands and each band is stored as a `DedupBucket` key
+(locality-sensitive hashing). Candidates for a listing are the listings
+that share at least one key with it, found with an index lookup per key
+rather than a comparison against every listing. Text keys include the
+poster, so text bands only match within one poster's listings (short
+generic titles from different people are too often alike to flag on text
+alone). The image hash has
+IMAGE_BANDS bands of 16 bits, so any two photos within IMAGE_BANDS - 1 bits
+share one; the text signature has TEXT_BANDS bands, so pairs above roughly
+(1 / TEXT_BANDS) ** (1 / rows per band) similarity usually share one.
+
+Candidates are then checked against their fingerprints. A pair becomes a
+`DuplicateCandidate` for review in the admin when the images are within
+DEDUP_IMAGE_DISTANCE bits, or when one poster's listings have text at least
+DEDUP_TEXT_SIMILARITY alike. Keys shared by more than
+DEDUP_MAX_BUCKET listings (a stock photo, an empty description) are
+ignored.
+
+`check()` runs when a listing is posted; `scan()` (`manage.py
+scan_duplicates`) fingerprints whatever has not been, imported and
+generated rows included, and checks those.
+"""
+
+import hashlib
+import random
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import transaction
+
+SIGNATURE_SIZE = 32
+TEXT_BANDS = 8
+IMAGE_BANDS = 4
+SHINGLE_SIZE = 5
+# One hash function per signature slot: the shingle's 64-bit hash XOR a fixed random mask. Fixed seed: stored
+# signatures must stay comparable
+_rng = random.Random(20250903)
+_MASKS = tuple(_rng.getrandbits(64) for _ in range(SIGNATURE_SIZE))
+
+
+def image_hash(file):
+    """dHash of an image file as 16 hex digits, or '' if it cannot be read"""
+    from PIL import Image, UnidentifiedImageError
+
+    try:
+        with Image.open(file) as image:
+            pixels = list(image.convert('L').resize((9, 8), Image.LANCZOS).getdata())
+    except (OSError, UnidentifiedImageError, ValueError):
+        return ''
+    bits = 0
+    for row in range(8):
+        for col in range(8):
+            bits = bits << 1 | (pixels[row * 9 + col] > pixels[row * 9 + col + 1])
+    return f'{bits:016x}'
+
+
+def shingles(text):
+    words = ''.join(c if c.isalnum() else ' ' for c in (text or '').lower()).split()
+    text = ' '.join(words)
+    if len(text) <= SHINGLE_SIZE:
+        return {text} if text else set()
+    return {text[i:i + SHINGLE_SIZE] for i in range(len(text) - SHINGLE_SIZE + 1)}
+
+
+def minhash(text):
+    """MinHash signature (SIGNATURE_SIZE ints) of `text`'s shingles, or [] if it has none"""
+    values = [int.from_bytes(hashlib.blake2b(shingle.encode(), digest_size=8).digest()) for shingle in shingles(text)]
+    if not values:
+        return []
+    return [min(map(mask.__xor__, values)) for mask in _MASKS]
+
+
+def similarity(left, right):
+    """Estimated Jaccard similarity of two signatures"""
+    if not left or not right:
+        return 0.0
+    return sum(a == b for a, b in zip(left, right)) / SIGNATURE_SIZE
+
+
+def distance(left, right):
+    """Bits that differ between two image hashes, or None if either is missing"""
+    if not left or not right:
+        return None
+    return (int(left, 16) ^ int(right, 16)).bit_count()
+
+
+def bucket_keys(image, signature, poster_id):
+    """LSH keys: image bands are shared by everyone, text bands only between one poster's listings"""
+    keys = []
+    if image:
+        width = 16 // IMAGE_BANDS  # hex digits per band
+        keys += [f'i{band}:{image[band * width:(band + 1) * width]}' for band in range(IMAGE_BANDS)]
+    if signature:
+        rows = SIGNATURE_SIZE // TEXT_BANDS
+        for band in range(TEXT_BANDS):
+            digest = hashlib.blake2b(repr((poster_id, signature[band * rows:(band + 1) * rows])).encode(),
+                                     digest_size=8)
+            keys.append(f't{band}:{digest.hexdigest()}')
+    return keys
+
+
+def listing_text(item):
+    return f'{item.title} {item.description}'
+
+
+def fingerprint(item):
+    """An unsaved `ListingFingerprint` for `item`"""
+    from .models import ListingFingerprint
+
+    image = ''
+    if item.image:
+        try:
+            with item.image.open('rb') as file:
+                image = image_hash(file)
+        except OSError:
+            pass
+    return ListingFingerprint(item_id=item.pk, poster_id=item.poster_id, image_hash=image,
+                              minhash=minhash(listing_text(item)))
+
+
+def store(fingerprints, replace=False):
+    """Save fingerprints and their bucket keys, replacing any earlier ones if `replace`"""
+    from .models import DedupBucket, ListingFingerprint
+
+    with transaction.atomic(savepoint=False):
+        if replace:
+            pks = [fp.item_id for fp in fingerprints]
+            ListingFingerprint.objects.filter(item_id__in=pks).delete()
+            DedupBucket.objects.filter(item_id__in=pks).delete()
+        ListingFingerprint.objects.bulk_create(fingerprints)
+        DedupBucket.objects.bulk_create([
+            DedupBucket(item_id=fp.item_id, key=key)
+            for fp in fingerprints for key in bucket_keys(fp.image_hash, fp.minhash, fp.poster_id)
+        ])
+
+
+def candidates(fingerprints):
+    """Flag the likely duplicates of these (stored) fingerprints; returns the new `DuplicateCandidate` rows"""
+    from django.db.models import Count
+
+    from .models import DedupBucket, DuplicateCandidate, ListingFingerprint
+
+    keys = {fp.item_id: bucket_keys(fp.image_hash, fp.minhash, fp.poster_id) for fp in fingerprints}
+    wanted = {key for item_keys in keys.values() for key in item_keys}
+    if not wanted:
+        return []
+    # Counting a crowded bucket walks its index entries; reading its members would also build them all here
+    crowded = set(DedupBucket.objects.filter(key__in=wanted).values('key').annotate(n=Count('id'))
+                  .filter(n__gt=getattr(settings, 'DEDUP_MAX_BUCKET', 200)).values_list('key', flat=True))
+    members = defaultdict(set)
+    for key, item_id in DedupBucket.objects.filter(key__in=wanted - crowded).values_list('key', 'item_id'):
+        members[key].add(item_id)
+
+    pairs = set()
+    for fp in fingerprints:
+        for key in keys[fp.item_id]:
+            pairs.update((min(fp.item_id, other), max(fp.item_id, other))
+                         for other in members.get(key, ()) if other != fp.item_id)
+    if not pairs:
+        return []
+    ids = {pk for pair in pairs for pk in pair}
+    stored = {pk: row for pk, *row in ListingFingerprint.objects.filter(item_id__in=ids)
+              .values_list('item_id', 'poster_id', 'image_hash', 'minhash')}
+
+    max_distance = getattr(settings, 'DEDUP_IMAGE_DISTANCE', 3)
+    min_similarity = getattr(settings, 'DEDUP_TEXT_SIMILARITY', 0.7)
+    found = []
+    for older, newer in sorted(pairs):
+        left, right = stored.get(older), stored.get(newer)
+        if left is None or right is None:
+            continue
+        bits = distance(left[1], right[1])
+        text = similarity(left[2], right[2]) if left[0] == right[0] else 0.0
+        if (bits is not None and bits <= max_distance) or text >= min_similarity:
+            found.append(DuplicateCandidate(item_id=newer, duplicate_of_id=older, image_distance=bits,
+                                            text_similarity=round(text, 3)))
+    if not found:
+        return []
+    existing = set(DuplicateCandidate.objects.filter(item_id__in={c.item_id for c in found})
+                   .values_list('item_id', 'duplicate_of_id'))
+    found = [c for c in found if (c.item_id, c.duplicate_of_id) not in existing]
+    DuplicateCandidate.objects.bulk_create(found, ignore_conflicts=True)
+    return found
+
+
+def check(items, replace=False):
+    """Fingerprint newly posted listings and flag what they duplicate; returns the new candidates"""
+    fingerprints = [fingerprint(item) for item in items]
+    store(fingerprints, replace=replace)
+    return candidates(fingerprints)
+
+
+def scan(chunk_size=500, rescan=False):
+    """Fingerprint and check listings without a fingerprint (all with `rescan`); returns (checked, flagged)"""
+    from .models import WasteItem
+
+    pending = WasteItem.objects.all() if rescan else WasteItem.objects.filter(fingerprint__isnull=True)
+    pending = pending.only('pk', 'poster_id', 'title', 'description', 'image').order_by('pk')
+    checked = flagged = 0
+    last = 0
+    while True:
+        items = list(pending.filter(pk__gt=last)[:chunk_size])
+        if not items:
+            break
+        last = items[-1].pk
+        checked += len(items)
+        flagged += len(check(items, replace=rescan))
+    return checked, flagged
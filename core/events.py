@@ -0,0 +1,107 @@
+"""
+Append-only change feed of status transitions and credit awards.
+
+Every change of a listing's or match's status, and every credit award, adds
+a `StatusEvent` in the same transaction as the change itself: from save()
+(WasteItem, Match) and from the bulk admin jobs that update rows in place.
+Rows created in a status (a new listing, a new request) are not events.
+The event id is its sequence number, so a consumer asks for what came after
+the last id it saw instead of polling and diffing the tables.
+
+`read()` returns a batch after a position, oldest first. Events stamped in
+the last EVENT_SETTLE_SECONDS are left for the next read, so one whose
+transaction commits shortly after it was stamped is not skipped.
+Consumers keep their position in `EventCursor` under a name: `consume()`
+hands the next batch to a function and moves the cursor once it returns,
+so a batch is seen at least once.
+
+`compact()` (`manage.py compact_events`, e.g. daily from cron) drops events
+older than EVENT_RETENTION_DAYS that a later event for the same listing or
+match supersedes. A consumer that falls that far behind still ends up with
+the latest status of everything; awards are kept.
+"""
+
+from datetime import timedelta
+
+from django.conf import settings
+from django.db.models import Exists, Max, Min, OuterRef
+from django.utils import timezone
+
+from .parallel import id_ranges
+
+
+def transitions(kind, rows):
+    """Events for [(object_id, user_id, from_status, to_status)] of `kind` ('listing' or 'match')"""
+    from .models import StatusEvent
+
+    StatusEvent.objects.bulk_create([
+        StatusEvent(kind=kind, object_id=object_id, user_id=user_id, from_status=old, to_status=new)
+        for object_id, user_id, old, new in rows if old != new
+    ])
+
+
+def awards(rows):
+    """Events for credits awarded for listings: [(item_id, poster_id, amount)]"""
+    from .models import StatusEvent
+
+    StatusEvent.objects.bulk_create([
+        StatusEvent(kind='award', object_id=item_id, user_id=poster_id, amount=amount)
+        for item_id, poster_id, amount in rows
+    ])
+
+
+def read(after=0, limit=None, kinds=None):
+    """Up to `limit` (EVENT_BATCH_SIZE) settled events after sequence `after`, oldest first"""
+    from .models import StatusEvent
+
+    limit = limit or getattr(settings, 'EVENT_BATCH_SIZE', 500)
+    settled = timezone.now() - timedelta(seconds=getattr(settings, 'EVENT_SETTLE_SECONDS', 2))
+    events = StatusEvent.objects.filter(pk__gt=after).order_by('pk')
+    if kinds:
+        events = events.filter(kind__in=kinds)
+    batch = []
+    for event in events[:limit]:
+        if event.created_at > settled:
+            break
+        batch.append(event)
+    return batch
+
+
+def position(consumer):
+    from .models import EventCursor
+
+    return EventCursor.objects.filter(name=consumer).values_list('position', flat=True).first() or 0
+
+
+def checkpoint(consumer, sequence):
+    from .models import EventCursor
+
+    EventCursor.objects.update_or_create(name=consumer, defaults={'position': sequence})
+
+
+def consume(consumer, handler, limit=None, kinds=None):
+    """Pass `consumer`'s next batch to `handler(events)`, then checkpoint past it; returns the batch"""
+    batch = read(position(consumer), limit=limit, kinds=kinds)
+    if batch:
+        handler(batch)
+        checkpoint(consumer, batch[-1].pk)
+    return batch
+
+
+def compact(chunk_size=5000, now=None):
+    """Delete old events superseded by a later one for the same object; returns the number deleted"""
+    from .models import StatusEvent
+
+    cutoff = (now or timezone.now()) - timedelta(days=getattr(settings, 'EVENT_RETENTION_DAYS', 30))
+    old = StatusEvent.objects.filter(created_at__lt=cutoff).exclude(kind='award')
+    bounds = old.aggregate(lo=Min('pk'), hi=Max('pk'))
+    if bounds['lo'] is None:
+        return 0
+    later = StatusEvent.objects.filter(kind=OuterRef('kind'), object_id=OuterRef('object_id'), pk__gt=OuterRef('pk'))
+    deleted = 0
+    # One segment of the log per statement, so no single delete holds the table for long
+    for lo, hi in id_ranges(bounds['lo'], bounds['hi'] + 1, chunk_size):
+        pks = list(old.filter(pk__gte=lo, pk__lt=hi).filter(Exists(later)).values_list('pk', flat=True))
+        if pks:
+            deleted += StatusEvent.objects.filter(pk__in=pks).delete()[0]
+    return deleted
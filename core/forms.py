@@ -124,11 +124,31 @@ class MatchForm(forms.ModelForm):
 
 from django import forms
 from django.contrib.auth.forms import UserCreationForm
-from .models import User, WasteItem, Match, WasteCategory
+from . import leaderboard, places, refdata
+from .models import PickupSlot, User, WasteItem, Match
+
+
+class CategoryChoiceField(forms.TypedChoiceField):
+    """Category select read from the reference-data cache: building, rendering and validating it run no queries"""
+
+    def __init__(self, empty_label="---------", **kwargs):
+        self.empty_label = empty_label
+        super().__init__(choices=self.category_choices, coerce=refdata.category, empty_value=None, **kwargs)
+
+    def category_choices(self):
+        return [('', self.empty_label), *refdata.get().categories]
+
+
+def canonical_location(value):
+    """The location with its place spelt as in the place index, unless that makes it too long"""
+    canonical = places.canonical(value)
+    return canonical if len(canonical) <= WasteItem._meta.get_field('location').max_length else value
+
 
 class UserRegistrationForm(UserCreationForm):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        self.fields['user_type'].choices = refdata.get().user_types
         # Add Bootstrap classes to all fields
         for field_name, field in self.fields.items():
             field.widget.attrs['class'] = 'form-control'
@@ -144,11 +164,13 @@ class UserRegistrationForm(UserCreationForm):
         }
 
 class WasteItemForm(forms.ModelForm):
+    category = CategoryChoiceField(required=False, label="Category")
+
     def __init__(self, *args, **kwargs):
-        super().__init__(*args, **kwargs)
         # If no categories exist, create a default one
-        if not WasteCategory.objects.exists():
-            WasteCategory.objects.create(name="General Waste", description="General waste materials")
+        refdata.ensure_default_category()
+        super().__init__(*args, **kwargs)
+        self.fields['unit'].widget.choices = [('', 'Select unit...'), *refdata.get().units]
         
         # Add Bootstrap classes and placeholders to all fields
         for field_name, field in self.fields.items():
@@ -169,22 +191,16 @@ class WasteItemForm(forms.ModelForm):
         self.fields['title'].widget.attrs['placeholder'] = 'e.g., Plastic Bottles, Old Newspapers, Metal Cans, E-Waste...'
         self.fields['quantity'].widget.attrs['placeholder'] = 'e.g., 5.0'
         self.fields['location'].widget.attrs['placeholder'] = 'e.g., Nairobi CBD, Westlands, Mombasa Island, Kisumu...'
+        self.fields['location'].widget.attrs.update({'list': 'place-options', 'autocomplete': 'off'})
+
+    def clean_location(self):
+        return canonical_location(self.cleaned_data['location'])
 
     class Meta:
         model = WasteItem
         fields = ['title', 'description', 'category', 'quantity', 'unit', 'location', 'image']
         widgets = {
-            'unit': forms.Select(choices=[
-                ('', 'Select unit...'),  # Added placeholder option
-                ('kg', 'Kilograms (kg)'),
-                ('g', 'Grams (g)'), 
-                ('lbs', 'Pounds (lbs)'),
-                ('pieces', 'Pieces'),
-                ('bags', 'Bags'),
-                ('bottles', 'Bottles'),
-                ('boxes', 'Boxes'),
-                ('liters', 'Liters (L)'),
-            ]),
+            'unit': forms.Select(),
         }
 
 class MatchForm(forms.ModelForm):
@@ -198,4 +214,110 @@ class MatchForm(forms.ModelForm):
     
     class Meta:
         model = Match
-        fields = ['message']
\ No newline at end of file
+        fields = ['message']
+
+class ImpactReportForm(forms.Form):
+    GROUP_CHOICES = (
+        ('year', 'Year'),
+        ('month', 'Month'),
+        ('day', 'Day'),
+        ('area', 'Area'),
+        ('waste_type', 'Waste type'),
+        ('category', 'Category'),
+        ('status', 'Status'),
+    )
+
+    start = forms.DateField(required=False, widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'}))
+    end = forms.DateField(required=False, widget=forms.DateInput(attrs={'type': 'date', 'class': 'form-control'}))
+    group_by = forms.MultipleChoiceField(choices=GROUP_CHOICES, required=False,
+                                         widget=forms.SelectMultiple(attrs={'class': 'form-select'}))
+    area = forms.CharField(required=False, widget=forms.TextInput(attrs={'class': 'form-control'}))
+    waste_type = forms.ChoiceField(choices=(('', 'All'),) + WasteItem.WASTE_TYPES, required=False,
+                                   widget=forms.Select(attrs={'class': 'form-select'}))
+    status = forms.ChoiceField(choices=(('', 'All'),) + WasteItem.STATUS_CHOICES, required=False,
+                               widget=forms.Select(attrs={'class': 'form-select'}))
+    compare = forms.BooleanField(required=False, label='Compare with previous year')
+
+    def clean_group_by(self):
+        return self.cleaned_data['group_by'] or ['month']
+
+
+class LeaderboardForm(forms.Form):
+    board = forms.ChoiceField(choices=leaderboard.BOARDS, required=False,
+                              widget=forms.Select(attrs={'class': 'form-select'}))
+    month = forms.DateField(required=False, input_formats=['%Y-%m'],
+                            widget=forms.DateInput(format='%Y-%m', attrs={'type': 'month', 'class': 'form-control'}))
+    area = forms.CharField(required=False, widget=forms.TextInput(attrs={'class': 'form-control'}),
+                           help_text="Leave empty for the whole county")
+
+    def clean_board(self):
+        return self.cleaned_data['board'] or 'earners'
+
+
+class WasteItemApiForm(forms.Form):
+    """One listing in an API request. Category IDs are checked against `category_ids`, loaded once per batch."""
+    title = WasteItem._meta.get_field('title').formfield()
+    description = WasteItem._meta.get_field('description').formfield()
+    waste_type = WasteItem._meta.get_field('waste_type').formfield(required=False)
+    category = forms.IntegerField(required=False)
+    quantity = WasteItem._meta.get_field('quantity').formfield(min_value=0)
+    unit = WasteItem._meta.get_field('unit').formfield(required=False)
+    location = WasteItem._meta.get_field('location').formfield()
+
+    def __init__(self, *args, category_ids=(), **kwargs):
+        super().__init__(*args, **kwargs)
+        self.category_ids = category_ids
+
+    def clean_waste_type(self):
+        return self.cleaned_data['waste_type'] or WasteItem._meta.get_field('waste_type').default
+
+    def clean_unit(self):
+        return self.cleaned_data['unit'] or WasteItem._meta.get_field('unit').default
+
+    def clean_location(self):
+        return canonical_location(self.cleaned_data['location'])
+
+    def clean_category(self):
+        category = self.cleaned_data['category']
+        if category is not None and category not in self.category_ids:
+            raise forms.ValidationError("Unknown category.")
+        return category
+
+
+class ListingImportForm(forms.Form):
+    file = forms.FileField(
+        label="CSV file",
+        widget=forms.ClearableFileInput(attrs={'class': 'form-control', 'accept': '.csv'}),
+        help_text="Columns: title, description, quantity, location, and optionally waste_type, category, unit",
+    )
+    dry_run = forms.BooleanField(required=False, label="Only check the file, do not import")
+
+
+class VehicleCapacityForm(forms.ModelForm):
+    class Meta:
+        model = User
+        fields = ['vehicle_capacity_kg']
+        labels = {'vehicle_capacity_kg': 'Vehicle capacity (kg)'}
+        widgets = {
+            'vehicle_capacity_kg': forms.NumberInput(attrs={'class': 'form-control', 'step': '0.5', 'min': '0'}),
+        }
+
+
+class PickupSlotForm(forms.ModelForm):
+    class Meta:
+        model = PickupSlot
+        fields = ['start', 'end', 'capacity_kg']
+        labels = {'capacity_kg': 'Capacity (kg)'}
+        widgets = {
+            'start': forms.DateTimeInput(attrs={'type': 'datetime-local', 'class': 'form-control'},
+                                         format='%Y-%m-%dT%H:%M'),
+            'end': forms.DateTimeInput(attrs={'type': 'datetime-local', 'class': 'form-control'},
+                                       format='%Y-%m-%dT%H:%M'),
+            'capacity_kg': forms.NumberInput(attrs={'class': 'form-control', 'step': '0.5', 'min': '0'}),
+        }
+
+    def clean(self):
+        cleaned = super().clean()
+        if cleaned.get('start') and cleaned.get('end') and cleaned['end'] <= cleaned['start']:
+            raise forms.ValidationError("The slot must end after it starts.")
+        return cleaned
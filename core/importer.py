@@ -0,0 +1,202 @@
+"""
+Bulk import of waste listings from CSV.
+
+The file is parsed as a stream, one row at a time, and validated against
+category and unit lookups loaded once per import. Valid rows are collected
+into batches; each batch gets its estimated credits in one pass and is
+written with one multi-row INSERT (`datagen.RowWriter`) plus one rollup
+fold, in its own transaction. Invalid rows are reported by line number and
+skipped, so one bad row never aborts the rest of the file.
+
+Columns: title, description, quantity, location (required) and
+waste_type, category, unit (optional; category is a name or an ID).
+"""
+
+import csv
+import io
+from dataclasses import dataclass, field
+from decimal import Decimal, InvalidOperation
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from . import analytics, counters, places, refdata
+from .datagen import RowWriter
+from .models import WasteItem
+
+REQUIRED_COLUMNS = ('title', 'description', 'quantity', 'location')
+OPTIONAL_COLUMNS = ('waste_type', 'category', 'unit')
+
+# Accepted spellings -> stored unit (the units offered by the listing form)
+UNITS = {
+    'kg': 'kg', 'kgs': 'kg', 'kilograms': 'kg', 'kilogram': 'kg',
+    'g': 'g', 'grams': 'g', 'gram': 'g',
+    'lbs': 'lbs', 'lb': 'lbs', 'pounds': 'lbs',
+    'pieces': 'pieces', 'pcs': 'pieces', 'piece': 'pieces',
+    'bags': 'bags', 'bag': 'bags',
+    'bottles': 'bottles', 'bottle': 'bottles',
+    'boxes': 'boxes', 'box': 'boxes',
+    'liters': 'liters', 'litres': 'liters', 'l': 'liters',
+}
+
+MAX_REPORTED_ERRORS = 1000
+
+COLUMNS = ('poster_id', 'title', 'description', 'waste_type', 'category_id', 'quantity', 'unit', 'location',
+           'place', 'estimated_credits', 'created_at', 'updated_at')
+
+
+@dataclass
+class ImportResult:
+    rows: int = 0
+    created: int = 0
+    invalid: int = 0
+    # [(line number, {column: message})], the first MAX_REPORTED_ERRORS only
+    errors: list = field(default_factory=list)
+
+    def add_error(self, line, messages):
+        self.invalid += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append((line, messages))
+
+
+class Lookups:
+    """Categories, waste types and field limits, read once per import"""
+
+    def __init__(self):
+        data = refdata.get()
+        self.categories = {}
+        for pk, name in sorted(data.categories):
+            self.categories[str(pk)] = pk
+            self.categories.setdefault(name.strip().lower(), pk)
+        self.waste_types = {}
+        for value, label in data.waste_types:
+            self.waste_types[value] = value
+            self.waste_types[label.lower()] = value
+        self.default_waste_type = WasteItem._meta.get_field('waste_type').default
+        self.default_unit = WasteItem._meta.get_field('unit').default
+        self.max_lengths = {name: WasteItem._meta.get_field(name).max_length for name in ('title', 'location')}
+        quantity = WasteItem._meta.get_field('quantity')
+        self.quantity_limit = Decimal(10) ** (quantity.max_digits - quantity.decimal_places)
+        self.quantity_places = quantity.decimal_places
+        self.locations = {}
+
+    def location(self, text):
+        """(canonical spelling, place ID) of a location, resolved once per distinct value"""
+        if text not in self.locations:
+            canonical = places.canonical(text)
+            if len(canonical) > self.max_lengths['location']:
+                canonical = text
+            self.locations[text] = (canonical, places.place_id(canonical, listing=True))
+        return self.locations[text]
+
+
+def clean_row(row, lookups):
+    """(values for WasteItem, {column: message}) for one CSV row"""
+    errors = {}
+    values = {}
+    for name in REQUIRED_COLUMNS:
+        if not (row.get(name) or '').strip():
+            errors[name] = "This field is required."
+    for name, limit in lookups.max_lengths.items():
+        value = (row.get(name) or '').strip()
+        if len(value) > limit:
+            errors[name] = f"Ensure this value has at most {limit} characters (it has {len(value)})."
+        values[name] = value
+    if values['location'] and 'location' not in errors:
+        values['location'], values['place'] = lookups.location(values['location'])
+    values['description'] = (row.get('description') or '').strip()
+
+    quantity = (row.get('quantity') or '').strip()
+    if quantity and 'quantity' not in errors:
+        try:
+            amount = Decimal(quantity)
+        except InvalidOperation:
+            errors['quantity'] = "Enter a number."
+        else:
+            if not amount.is_finite() or amount < 0 or amount >= lookups.quantity_limit:
+                errors['quantity'] = f"Enter a number from 0 up to {lookups.quantity_limit}."
+            elif -amount.as_tuple().exponent > lookups.quantity_places:
+                errors['quantity'] = f"Ensure that there are no more than {lookups.quantity_places} decimal places."
+            values['quantity'] = amount
+
+    waste_type = (row.get('waste_type') or '').strip().lower()
+    values['waste_type'] = lookups.waste_types.get(waste_type) if waste_type else lookups.default_waste_type
+    if values['waste_type'] is None:
+        errors['waste_type'] = f"Unknown waste type {row['waste_type']!r}."
+
+    category = (row.get('category') or '').strip().lower()
+    values['category_id'] = lookups.categories.get(category) if category else None
+    if category and values['category_id'] is None:
+        errors['category'] = f"Unknown category {row['category']!r}."
+
+    unit = (row.get('unit') or '').strip().lower()
+    values['unit'] = UNITS.get(unit) if unit else lookups.default_unit
+    if values['unit'] is None:
+        errors['unit'] = f"Unknown unit {row['unit']!r}."
+    return values, errors
+
+
+def with_estimates(rows):
+    """Estimated credits for a batch of cleaned rows, one rate lookup per row"""
+    rates = {waste_type: Decimal(str(rate)) for waste_type, rate in WasteItem.CREDIT_RATES.items()}
+    default = Decimal('1.0')
+    cent = Decimal('0.01')
+    for values in rows:
+        values['estimated_credits'] = (values['quantity'] * rates.get(values['waste_type'], default)).quantize(cent)
+    return rows
+
+
+def write_batch(rows, poster):
+    """Insert a batch of cleaned rows without per-object save(); returns the number written"""
+    now = timezone.now()
+    stamp = connection.ops.adapt_datetimefield_value(now)
+    rows = with_estimates(rows)
+    with transaction.atomic():
+        RowWriter(WasteItem, COLUMNS, len(rows)).write([
+            (poster.pk, v['title'], v['description'], v['waste_type'], v['category_id'], v['quantity'], v['unit'],
+             v['location'], v['place'], v['estimated_credits'], stamp, stamp)
+            for v in rows
+        ])
+        # The rows bypassed save(), so fold them into the rollups and counters here
+        counters.bump({(poster.pk, 'items_posted'): len(rows)})
+        analytics.apply(analytics.total(
+            analytics.contribution(now, v['location'], v['waste_type'], v['category_id'], 'available',
+                                   v['quantity'], v['unit'], v['estimated_credits'], place=v['place'])
+            for v in rows
+        ))
+    return len(rows)
+
+
+def open_text(fileobj, encoding='utf-8-sig'):
+    """A text stream over an uploaded or opened binary file, decoded as it is read"""
+    if isinstance(fileobj, io.TextIOBase):
+        return fileobj
+    return io.TextIOWrapper(fileobj, encoding=encoding, newline='')
+
+
+def import_listings(fileobj, poster, batch_size=2000, dry_run=False):
+    """Import the listings in a CSV file for `poster`; returns an ImportResult"""
+    result = ImportResult()
+    reader = csv.DictReader(open_text(fileobj))
+    columns = {name.strip().lower() for name in reader.fieldnames or ()}
+    missing = [name for name in REQUIRED_COLUMNS if name not in columns]
+    if missing:
+        result.add_error(1, {'header': f"Missing columns: {', '.join(missing)}"})
+        return result
+    reader.fieldnames = [name.strip().lower() for name in reader.fieldnames]
+
+    lookups = Lookups()
+    batch = []
+    for row in reader:
+        result.rows += 1
+        values, errors = clean_row(row, lookups)
+        if errors:
+            result.add_error(reader.line_num, errors)
+            continue
+        batch.append(values)
+        if len(batch) >= batch_size:
+            result.created += len(batch) if dry_run else write_batch(batch, poster)
+            batch = []
+    if batch:
+        result.created += len(batch) if dry_run else write_batch(batch, poster)
+    return result
@@ -0,0 +1,108 @@
+"""
+Per-request performance counters.
+
+The stats for the request currently being handled live in a context variable so
+the SQL execute wrapper and the template render hook can find them without
+threading the request object through the ORM or the template engine.
+"""
+
+import contextvars
+import time
+
+from django.template.backends import django as django_backend
+
+_current = contextvars.ContextVar('request_stats', default=None)
+
+
+class RequestStats:
+    """Counters collected while a single request is handled"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.view_name = ''
+        self.query_count = 0
+        self.sql_time = 0.0
+        self.slowest_sql = ''
+        self.slowest_sql_time = 0.0
+        self.template_time = 0.0
+        self.template_depth = 0
+
+    @property
+    def total_time(self):
+        return time.perf_counter() - self.started
+
+    def record_query(self, sql, duration):
+        self.query_count += 1
+        self.sql_time += duration
+        if duration > self.slowest_sql_time:
+            self.slowest_sql_time = duration
+            self.slowest_sql = sql
+
+    def server_timing(self):
+        """Render the stats as a `Server-Timing` header value"""
+        return ', '.join([
+            f'db;dur={self.sql_time * 1000:.1f};desc="{self.query_count} queries"',
+            f'tpl;dur={self.template_time * 1000:.1f}',
+            f'total;dur={self.total_time * 1000:.1f}',
+        ])
+
+    def as_log_fields(self):
+        return {
+            'view': self.view_name,
+            'queries': self.query_count,
+            'sql_ms': round(self.sql_time * 1000, 1),
+            'slowest_sql_ms': round(self.slowest_sql_time * 1000, 1),
+            'slowest_sql': self.slowest_sql[:200],
+            'template_ms': round(self.template_time * 1000, 1),
+            'total_ms': round(self.total_time * 1000, 1),
+        }
+
+
+def current_stats():
+    """Stats of the request being handled, or None outside a request"""
+    return _current.get()
+
+
+def start_request():
+    stats = RequestStats()
+    token = _current.set(stats)
+    return stats, token
+
+
+def finish_request(token):
+    _current.reset(token)
+
+
+def sql_execute_wrapper(execute, sql, params, many, context):
+    """`connection.execute_wrapper` hook that times every statement"""
+    stats = _current.get()
+    if stats is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        stats.record_query(sql, time.perf_counter() - start)
+
+
+_original_render = django_backend.Template.render
+
+
+def _timed_render(self, context=None, request=None):
+    stats = _current.get()
+    if stats is None or stats.template_depth:
+        # Nested renders are already covered by the outer timer
+        return _original_render(self, context, request)
+    stats.template_depth += 1
+    start = time.perf_counter()
+    try:
+        return _original_render(self, context, request)
+    finally:
+        stats.template_depth -= 1
+        stats.template_time += time.perf_counter() - start
+
+
+def install_template_timer():
+    """Time top-level template renders (`render()` / `render_to_string()`)"""
+    if django_backend.Template.render is not _timed_render:
+        django_backend.Template.render = _timed_render
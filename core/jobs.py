@@ -0,0 +1,285 @@
+"""
+Chunked bulk operations behind the admin actions.
+
+An `AdminJob` stores the selected primary keys. `run_job` walks them in
+ascending order, one chunk per transaction, and saves the last key of each
+chunk as its checkpoint, so an interrupted job resumes where it stopped.
+Operations work on a whole chunk with set-based UPDATEs and a bulk ledger
+insert instead of calling save() / award_credits() per row.
+
+A running job holds a lease: every chunk moves its `updated_at`, and it can
+only be claimed again (`resume`) once that is ADMIN_JOB_LEASE_SECONDS old.
+Each chunk also starts by checking the checkpoint is still the one its
+worker left, and its progress is only written if that still holds; if
+another worker has moved it, the chunk rolls back and the worker stops, so two workers never apply the same chunk.
+"""
+
+import logging
+import threading
+from collections import Counter, defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Case, DecimalField, F, Q, Value, When
+from django.utils import timezone
+
+from . import analytics, auth, counters, events, leaderboard, metrics, sync
+from .models import AdminJob, CreditTransaction, Match, User, WasteItem
+
+logger = logging.getLogger(__name__)
+
+
+class LeaseLost(Exception):
+    """Another worker claimed the job"""
+
+
+class AwardedConcurrently(Exception):
+    """Some of the items were awarded between reading and updating them"""
+
+# kind -> function(ids, dry_run) returning the number of rows affected
+OPERATIONS = {}
+
+
+def operation(kind):
+    def register(func):
+        OPERATIONS[kind] = func
+        return func
+    return register
+
+
+def _credit_rate():
+    return Case(
+        *[When(waste_type=waste_type, then=Value(Decimal(str(rate))))
+          for waste_type, rate in WasteItem.CREDIT_RATES.items()],
+        default=Value(Decimal('1.0')),
+        output_field=DecimalField(max_digits=8, decimal_places=2),
+    )
+
+
+def _add_balances(balances):
+    """Add credits to many users with one parameterised statement"""
+    field = User._meta.get_field('digital_credits')
+    quote = connection.ops.quote_name
+    sql = (f'UPDATE {quote(User._meta.db_table)} SET {quote(field.column)} = {quote(field.column)} + %s '
+           f'WHERE {quote(User._meta.pk.column)} = %s')
+    params = [
+        (connection.ops.adapt_decimalfield_value(amount, field.max_digits, field.decimal_places), user_id)
+        for user_id, amount in balances.items()
+    ]
+    with connection.cursor() as cursor:
+        cursor.executemany(sql, params)
+    # Bypassed User.save(), so drop the cached users here
+    auth.forget_on_commit(balances)
+
+
+def award_items(items, dry_run=False):
+    """
+    Bulk equivalent of `WasteItem.award_credits` for collected `items` that
+    have not earned anything yet: one UPDATE for the items, one statement for
+    the posters' balances, one ledger insert and one leaderboard upsert.
+    Callers wrap it in `analytics.track` so the rollups see the new credits.
+    The items are locked while they are read, and the balances and ledger
+    are only written if the UPDATE changed every one of them.
+    """
+    with transaction.atomic(savepoint=False):
+        return _award_items(items, dry_run)
+
+
+def _award_items(items, dry_run):
+    unawarded = Q(status='collected', credits_earned=0)
+    rows = list(items.select_for_update().filter(unawarded).values_list(
+        'pk', 'poster_id', 'title', 'estimated_credits', 'quantity', 'waste_type', 'place', 'location'))
+    amounts = {}
+    awarded = []
+    ledger = []
+    balances = defaultdict(Decimal)
+    scores = defaultdict(Decimal)
+    for pk, poster_id, title, estimated, quantity, waste_type, place, location in rows:
+        amount = estimated if estimated > 0 else quantity * Decimal(str(WasteItem.CREDIT_RATES.get(waste_type, 1.0)))
+        if amount <= 0:
+            continue
+        amounts[pk] = amount
+        awarded.append((pk, poster_id, amount))
+        balances[poster_id] += amount
+        scores[poster_id, analytics.place_key(place, location)] += amount
+        ledger.append(CreditTransaction(
+            user_id=poster_id, amount=amount, transaction_type='credit',
+            reason=f"Credits earned for waste collection: {title}",
+        ))
+    if dry_run or not amounts:
+        return len(amounts)
+
+    # Same rule as the loop above, evaluated in SQL; only items still unawarded
+    now = timezone.now()
+    updated = WasteItem.objects.filter(unawarded, pk__in=amounts).update(
+        credits_earned=Case(
+            When(estimated_credits__gt=0, then=F('estimated_credits')),
+            default=F('quantity') * _credit_rate(),
+        ),
+        credited_at=now,
+        updated_at=now,
+    )
+    if updated != len(amounts):
+        # Awarded by someone else since the read: roll back rather than credit anyone twice
+        raise AwardedConcurrently(
+            f"{len(amounts) - updated} of {len(amounts)} items were awarded concurrently")
+    _add_balances(balances)
+    CreditTransaction.objects.bulk_create(ledger)
+    counters.bump(Counter((entry.user_id, 'transaction_count') for entry in ledger))
+    events.awards(awarded)
+    leaderboard.record('earners', scores, now)
+    metrics.CREDIT_TRANSACTIONS.inc(len(ledger), type='credit')
+    metrics.CREDIT_AMOUNT.inc(sum(amounts.values()), type='credit')
+    return len(amounts)
+
+
+@operation('mark_collected')
+def mark_collected(ids, dry_run):
+    items = WasteItem.objects.filter(pk__in=ids).exclude(status__in=('collected', 'recycled'))
+    rows = list(items.values_list('pk', 'poster_id', 'status', 'place', 'location'))
+    changed = [pk for pk, _, _, _, _ in rows]
+    if dry_run or not changed:
+        return len(changed)
+    sync.record('listing', [(pk, analytics.place_key(place, location), None)
+                            for pk, _, status, place, location in rows if status == 'available'])
+    with analytics.track(WasteItem.objects.filter(pk__in=changed)):
+        WasteItem.objects.filter(pk__in=changed).update(status='collected', updated_at=timezone.now())
+        events.transitions('listing', [(pk, poster_id, status, 'collected') for pk, poster_id, status, _, _ in rows])
+        award_items(WasteItem.objects.filter(pk__in=changed))
+    accepted = list(Match.objects.filter(waste_item_id__in=changed, status='accepted')
+                    .values_list('pk', 'collector_id', 'waste_item__place', 'waste_item__location'))
+    collections = Counter((collector_id, analytics.place_key(place, location))
+                          for _, collector_id, place, location in accepted)
+    now = timezone.now()
+    completed = Match.objects.filter(pk__in=[pk for pk, _, _, _ in accepted]).update(
+        status='completed', completed_at=now, updated_at=now)
+    events.transitions('match', [(pk, collector_id, 'accepted', 'completed') for pk, collector_id, _, _ in accepted])
+    leaderboard.record('collectors', collections, now)
+    if completed:
+        metrics.MATCH_TRANSITIONS.inc(completed, from_status='accepted', to_status='completed')
+    return len(changed)
+
+
+@operation('award_credits')
+def award_credits(ids, dry_run):
+    items = WasteItem.objects.filter(pk__in=ids)
+    if dry_run:
+        return award_items(items, dry_run=True)
+    with analytics.track(items):
+        return award_items(items)
+
+
+@operation('recompute_estimates')
+def recompute_estimates(ids, dry_run):
+    items = WasteItem.objects.filter(pk__in=ids)
+    if dry_run:
+        return items.exclude(estimated_credits=F('quantity') * _credit_rate()).count()
+    with analytics.track(items):
+        return items.update(estimated_credits=F('quantity') * _credit_rate(), updated_at=timezone.now())
+
+
+@operation('reject_stale_matches')
+def reject_stale_matches(ids, dry_run):
+    cutoff = timezone.now() - timedelta(days=getattr(settings, 'STALE_MATCH_DAYS', 14))
+    matches = Match.objects.filter(pk__in=ids, status='pending', created_at__lt=cutoff)
+    if dry_run:
+        return matches.count()
+    stale = list(matches.values_list('pk', 'collector_id', 'waste_item__poster_id'))
+    rejected = Match.objects.filter(pk__in=[pk for pk, _, _ in stale]).update(status='rejected',
+                                                                              updated_at=timezone.now())
+    events.transitions('match', [(pk, collector_id, 'pending', 'rejected') for pk, collector_id, _ in stale])
+    waiting = Counter(poster_id for _, _, poster_id in stale)
+    counters.bump({(poster_id, 'pending_matches_received'): -n for poster_id, n in waiting.items()})
+    if rejected:
+        metrics.MATCH_TRANSITIONS.inc(rejected, from_status='pending', to_status='rejected')
+    return rejected
+
+
+def create_job(kind, queryset, user=None, dry_run=False):
+    """Record a job over the rows of `queryset` and, by default, start it in a thread"""
+    return _queue(kind, sorted(queryset.values_list('pk', flat=True)), user, dry_run)
+
+
+def rerun_for_real(job, user=None):
+    """Queue the rows of a finished dry run again, this time applying the changes"""
+    return _queue(job.kind, job.params.get('ids', []), user, dry_run=False)
+
+
+def _queue(kind, ids, user, dry_run):
+    job = AdminJob.objects.create(kind=kind, params={'ids': ids}, dry_run=dry_run, total=len(ids), created_by=user)
+    if getattr(settings, 'ADMIN_JOBS_IN_THREAD', True):
+        transaction.on_commit(lambda: start_in_background(job.pk))
+    return job
+
+
+def start_in_background(job_id, resume=False):
+    thread = threading.Thread(target=_run_in_thread, args=(job_id, resume), name=f'admin-job-{job_id}', daemon=True)
+    thread.start()
+    return thread
+
+
+def _run_in_thread(job_id, resume):
+    try:
+        run_job(job_id, resume=resume)
+    finally:
+        connection.close()
+
+
+def claimable(resume=False, now=None):
+    """Jobs a worker may claim: queued ones, and with `resume` failed ones and running ones whose lease ran out"""
+    if not resume:
+        return Q(status='queued')
+    expired = (now or timezone.now()) - timedelta(seconds=getattr(settings, 'ADMIN_JOB_LEASE_SECONDS', 300))
+    return Q(status__in=('queued', 'failed')) | Q(status='running', updated_at__lt=expired)
+
+
+def run_job(job_id, chunk_size=None, resume=False):
+    """
+    Process a queued job (or, with `resume`, a failed one or a running one
+    whose worker stopped renewing its lease) chunk by chunk. Returns the job,
+    or None if another worker owns it.
+    """
+    chunk_size = chunk_size or getattr(settings, 'ADMIN_JOB_CHUNK_SIZE', 500)
+    if not AdminJob.objects.filter(claimable(resume), pk=job_id).update(status='running', updated_at=timezone.now()):
+        return None
+
+    job = AdminJob.objects.get(pk=job_id)
+    func = OPERATIONS[job.kind]
+    ids = [pk for pk in job.params.get('ids', []) if pk > job.checkpoint]
+    checkpoint = job.checkpoint
+    try:
+        for start in range(0, len(ids), chunk_size):
+            chunk = ids[start:start + chunk_size]
+            with transaction.atomic():
+                # Renew the lease, and take the write lock before reading the chunk's rows
+                if not AdminJob.objects.filter(pk=job.pk, status='running', checkpoint=checkpoint).update(
+                        updated_at=timezone.now()):
+                    raise LeaseLost
+                affected = func(chunk, job.dry_run)
+                # Progress commits with the chunk's changes, so a restart never redoes a chunk
+                if not AdminJob.objects.filter(pk=job.pk, checkpoint=checkpoint).update(
+                        processed=F('processed') + len(chunk), affected=F('affected') + affected,
+                        checkpoint=chunk[-1], updated_at=timezone.now()):
+                    raise LeaseLost
+            checkpoint = chunk[-1]
+    except LeaseLost:
+        logger.warning("admin job lease lost job=%s kind=%s after pk %s", job.pk, job.kind, checkpoint)
+        return None
+    except Exception as exc:
+        logger.exception("admin job failed job=%s kind=%s", job.pk, job.kind)
+        job.refresh_from_db()
+        job.status = 'failed'
+        job.log += f"{timezone.now():%Y-%m-%d %H:%M:%S} failed after pk {job.checkpoint}: {exc!r}\n"
+        job.save(update_fields=['status', 'log', 'updated_at'])
+        return job
+
+    job.refresh_from_db()
+    job.status = 'completed'
+    job.finished_at = timezone.now()
+    job.log += f"{job.finished_at:%Y-%m-%d %H:%M:%S} {'would affect' if job.dry_run else 'affected'} {job.affected} rows\n"
+    job.save(update_fields=['status', 'finished_at', 'log', 'updated_at'])
+    logger.info("admin job completed job=%s kind=%s processed=%s affected=%s dry_run=%s",
+                job.pk, job.kind, job.processed, job.affected, job.dry_run)
+    return job
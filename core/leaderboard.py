@@ -0,0 +1,239 @@
+"""
+Leaderboards: top posters by credits earned and top collectors by completed
+collections, per month and per place.
+
+`LeaderboardScore` keeps one running score per (board, month, place, user),
+plus a county-wide copy under place ''. The place is the listing's place key
+(`analytics.place_key`: its place ID, or its area text when it has none), the
+same key the impact rollups use. Credit awards and match completions add to
+the scores as they happen, so a page view never sums the ledger:
+
+* top K reads the first K entries of the (board, month, place, -score) index;
+* a user's rank is one more than the number of scores above theirs in the
+  same window, a range count on that same index.
+
+Scores count in the month of the award (`WasteItem.credited_at`) or the
+completion (`Match.completed_at`), both when they are recorded and when they
+are rebuilt. Paths that award credits or complete matches without save()
+stamp those and call `record` themselves; `rebuild` recomputes everything
+from the waste items and matches, with the table locked (as
+`analytics.rebuild` does) so no score recorded meanwhile is lost.
+"""
+
+from collections import defaultdict
+from decimal import Decimal
+
+from django.db import IntegrityError, connection, transaction
+from django.db.models import Count, F, Max, Min, Sum
+from django.db.models.functions import TruncMonth
+from django.utils import timezone
+
+from . import places
+from .analytics import lock_table, place_key
+from .parallel import id_ranges, run_chunks
+
+BOARDS = (
+    ('earners', 'Top earners'),
+    ('collectors', 'Top collectors'),
+)
+ALL_PLACES = ''
+
+
+def month_of(value=None):
+    """First day of the (local) month of a datetime, a date or, by default, now"""
+    if value is None:
+        value = timezone.now()
+    if hasattr(value, 'hour'):
+        value = timezone.localdate(value) if timezone.is_aware(value) else value.date()
+    return value.replace(day=1)
+
+
+def _windows(board, period, place, user_id):
+    return [(board, period, place, user_id), (board, period, ALL_PLACES, user_id)]
+
+
+def record(board, scores, when=None):
+    """Add `scores` ({(user_id, place key): amount}) to `board` for the month of `when`"""
+    period = month_of(when)
+    rows = defaultdict(Decimal)
+    for (user_id, place), amount in scores.items():
+        for key in _windows(board, period, place, user_id):
+            rows[key] += Decimal(str(amount))
+    apply(rows)
+
+
+def apply(rows):
+    """Add {(board, period, place, user_id): amount} to the stored scores"""
+    rows = {key: amount for key, amount in rows.items() if amount}
+    if not rows:
+        return
+    if connection.vendor not in ('sqlite', 'postgresql'):
+        for key, amount in rows.items():
+            _apply_one(key, amount)
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(_upsert_sql(), _row_params(rows))
+
+
+KEY_FIELDS = ('board', 'period', 'place', 'user')
+
+
+def _upsert_sql():
+    from .models import LeaderboardScore
+
+    quote = connection.ops.quote_name
+    table = quote(LeaderboardScore._meta.db_table)
+    keys = [quote(LeaderboardScore._meta.get_field(name).column) for name in KEY_FIELDS]
+    score = quote(LeaderboardScore._meta.get_field('score').column)
+    return (
+        f'INSERT INTO {table} ({", ".join(keys)}, {score}) VALUES (%s, %s, %s, %s, %s) '
+        f'ON CONFLICT ({", ".join(keys)}) DO UPDATE SET {score} = {table}.{score} + excluded.{score}'
+    )
+
+
+def _row_params(rows):
+    from .models import LeaderboardScore
+
+    field = LeaderboardScore._meta.get_field('score')
+    adapt_amount = connection.ops.adapt_decimalfield_value
+    periods = {}
+    for (board, period, place, user_id), amount in rows.items():
+        if period not in periods:
+            periods[period] = connection.ops.adapt_datefield_value(period)
+        yield board, periods[period], place, user_id, adapt_amount(amount, field.max_digits, field.decimal_places)
+
+
+def _lookup(key):
+    return dict(zip(('board', 'period', 'place', 'user_id'), key))
+
+
+def _apply_one(key, amount):
+    """UPDATE, then INSERT if the row does not exist yet (databases without ON CONFLICT)"""
+    from .models import LeaderboardScore
+
+    rows = LeaderboardScore.objects.filter(**_lookup(key))
+    if rows.update(score=F('score') + amount):
+        return
+    try:
+        with transaction.atomic():
+            LeaderboardScore.objects.create(**_lookup(key), score=amount)
+    except IntegrityError:
+        rows.update(score=F('score') + amount)
+
+
+def window(board, period=None, place=ALL_PLACES):
+    from .models import LeaderboardScore
+
+    return LeaderboardScore.objects.filter(board=board, period=month_of(period), place=place)
+
+
+def top(board, period=None, place=ALL_PLACES, limit=10):
+    """The `limit` highest scores of a window, best first, with their users"""
+    return list(
+        window(board, period, place).filter(score__gt=0)
+        .select_related('user').order_by('-score', 'user_id')[:limit]
+    )
+
+
+def rank(board, user, period=None, place=ALL_PLACES):
+    """(rank, score) of `user` in a window (equal scores share a rank), or None if unranked"""
+    scores = window(board, period, place)
+    score = scores.filter(user=user).values_list('score', flat=True).first()
+    if not score or score <= 0:
+        return None
+    return scores.filter(score__gt=score).count() + 1, score
+
+
+def aggregate(items, completed=None):
+    """
+    Scores that the waste items in `items` account for: their posters' earned
+    credits in the month they were awarded and their collectors' completed
+    matches in the month they were completed. `completed` overrides the query
+    for the latter: (collector_id, place, location, month, score) rows.
+    """
+    from .models import Match
+
+    rows = defaultdict(Decimal)
+    # Few distinct places and months per chunk: normalise each once
+    keys, months = {}, {}
+
+    def add(board, row, user_id):
+        where = row['place'], row['location']
+        key = keys.get(where) or keys.setdefault(where, place_key(*where))
+        month = months.get(row['month']) or months.setdefault(row['month'], month_of(row['month']))
+        rows[board, month, key, user_id] += row['score']
+        rows[board, month, ALL_PLACES, user_id] += row['score']
+
+    earned = (
+        items.filter(credits_earned__gt=0).order_by()
+        .values('poster_id', 'place', 'location', month=TruncMonth('credited_at'))
+        .annotate(score=Sum('credits_earned'))
+    )
+    for row in earned:
+        add('earners', row, row['poster_id'])
+    if completed is None:
+        completed = (
+            Match.objects.filter(status='completed', waste_item__in=items).order_by()
+            .values('collector_id', place=F('waste_item__place'), location=F('waste_item__location'),
+                    month=TruncMonth('completed_at'))
+            .annotate(score=Count('pk'))
+        )
+    for row in completed:
+        add('collectors', row, row['collector_id'])
+    return dict(rows)
+
+
+def aggregate_range(lo, hi):
+    from .models import WasteItem
+
+    return aggregate(WasteItem.objects.filter(pk__gte=lo, pk__lt=hi))
+
+
+def aggregate_archived_range(lo, hi):
+    from .models import ArchivedMatch, ArchivedWasteItem
+
+    # Completed matches are archived with their listing's location and their completion time; resolve
+    # each location to its place once
+    completed = list(
+        ArchivedMatch.objects.filter(status='completed', waste_item_ref__gte=lo, waste_item_ref__lt=hi).order_by()
+        .values('collector_id', 'location', month=TruncMonth('collected_at'))
+        .annotate(score=Count('pk'))
+    )
+    resolved = {}
+    for row in completed:
+        location = row['location']
+        row['place'] = resolved.get(location) or resolved.setdefault(location, places.place_id(location))
+    return aggregate(ArchivedWasteItem.objects.filter(pk__gte=lo, pk__lt=hi), completed)
+
+
+def rebuild(chunk_size=50000, workers=1):
+    """
+    Recompute every board from the waste items and matches, live and
+    archived, in ID-range chunks (optionally in parallel) and swap the result
+    in with one transaction, holding the table locked from before the scan.
+    Returns the number of scores written.
+    """
+    from .models import ArchivedWasteItem, LeaderboardScore, WasteItem
+
+    with transaction.atomic():
+        lock_table(LeaderboardScore)
+        LeaderboardScore.objects.all().delete()
+        totals = defaultdict(Decimal)
+        for model, func in ((WasteItem, aggregate_range), (ArchivedWasteItem, aggregate_archived_range)):
+            bounds = model.objects.aggregate(lo=Min('pk'), hi=Max('pk'))
+            if bounds['lo'] is None:
+                continue
+            chunks = id_ranges(bounds['lo'], bounds['hi'] + 1, chunk_size)
+            for chunk_rows in run_chunks(func, chunks, workers=workers):
+                for key, amount in chunk_rows.items():
+                    totals[key] += amount
+
+        if connection.vendor in ('sqlite', 'postgresql'):
+            # Into an empty table the upsert is a plain batched INSERT, without a model instance per row
+            apply(totals)
+        else:
+            LeaderboardScore.objects.bulk_create(
+                [LeaderboardScore(**_lookup(key), score=amount) for key, amount in totals.items() if amount],
+                batch_size=1000,
+            )
+    return len(totals)
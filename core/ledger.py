@@ -0,0 +1,107 @@
+"""
+Ledger reconciliation: `User.digital_credits` against the CreditTransaction history.
+
+A balance is a cached total of the user's ledger, SUM(credit) - SUM(debit).
+It drifts when something writes one without the other (sample data, direct
+edits in the admin, lost updates before `add_credits` became an UPDATE with
+F()). `reconcile()` (`manage.py reconcile_ledger`) walks the users in ID
+ranges, optionally across a process pool, with one grouped ledger query
+and one balance query per range. Each range returns only its counts, its
+largest drifts and the ids to repair, so memory is bounded by the range
+size, not the number of users.
+
+With `fix`, each drifting user gets a compensating ledger entry for the
+difference. The balance is what users have seen and spent, so the ledger
+moves to meet it, not the other way round. Repairs run in the calling
+process, one range per transaction as the results come in (SQLite has a
+single writer anyway); they lock the users' rows and read them again
+first, so a concurrent `add_credits` is never undone.
+"""
+
+import heapq
+from dataclasses import dataclass, field
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Max, Min, Q, Sum
+
+from . import counters
+from .parallel import id_ranges, run_chunks
+
+REASON = "Ledger reconciliation"
+CENT = Decimal('0.01')
+
+
+@dataclass
+class Report:
+    users: int = 0
+    drifting: int = 0
+    total_drift: Decimal = Decimal('0')  # Sum of absolute differences
+    repaired: int = 0
+    # The largest drifts: (abs drift, user id, balance, ledger total)
+    largest: list = field(default_factory=list)
+
+
+def ledger_totals(transactions):
+    """{user id: SUM(credit) - SUM(debit)} over a CreditTransaction queryset, in one grouped query"""
+    rows = (transactions.order_by().values('user_id')
+            .annotate(credit=Sum('amount', filter=Q(transaction_type='credit')),
+                      debit=Sum('amount', filter=Q(transaction_type='debit'))))
+    return {row['user_id']: ((row['credit'] or 0) - (row['debit'] or 0)).quantize(CENT) for row in rows}
+
+
+def drifts(lo, hi):
+    """[(user id, balance, ledger total)] of the users in [lo, hi) whose balance is off, and how many were checked"""
+    from .models import CreditTransaction, User
+
+    balances = dict(User.objects.filter(pk__gte=lo, pk__lt=hi).values_list('pk', 'digital_credits'))
+    totals = ledger_totals(CreditTransaction.objects.filter(user_id__gte=lo, user_id__lt=hi))
+    found = [(pk, balance, totals.get(pk, Decimal('0.00'))) for pk, balance in balances.items()]
+    return [row for row in found if row[1] != row[2]], len(balances)
+
+
+def repair(user_ids):
+    """Add compensating ledger entries so these users' ledgers sum to their balances; returns how many got one"""
+    from .models import CreditTransaction, User
+
+    with transaction.atomic():
+        balances = dict(User.objects.select_for_update().filter(pk__in=user_ids).values_list('pk', 'digital_credits'))
+        totals = ledger_totals(CreditTransaction.objects.filter(user_id__in=list(balances)))
+        entries = []
+        for pk, balance in balances.items():
+            difference = balance - totals.get(pk, Decimal('0.00'))
+            if difference:
+                entries.append(CreditTransaction(user_id=pk, amount=abs(difference), reason=REASON,
+                                                 transaction_type='credit' if difference > 0 else 'debit'))
+        CreditTransaction.objects.bulk_create(entries)
+        counters.bump({(entry.user_id, 'transaction_count'): 1 for entry in entries})
+    return len(entries)
+
+
+def reconcile_range(lo, hi, keep=20):
+    """A Report for the users in [lo, hi), and the ids of those drifting"""
+    found, checked = drifts(lo, hi)
+    report = Report(users=checked, drifting=len(found))
+    report.total_drift = sum((abs(balance - total) for _, balance, total in found), Decimal('0.00'))
+    report.largest = heapq.nlargest(keep, ((abs(balance - total), pk, balance, total) for pk, balance, total in found))
+    return report, [pk for pk, _, _ in found]
+
+
+def reconcile(chunk_size=10000, workers=1, fix=False, keep=20):
+    """Reconcile every user, `chunk_size` IDs per range across `workers` processes; returns a Report"""
+    from .models import User
+
+    report = Report(total_drift=Decimal('0.00'))
+    bounds = User.objects.aggregate(lo=Min('pk'), hi=Max('pk'))
+    if bounds['lo'] is None:
+        return report
+    chunks = [(lo, hi, keep) for lo, hi in id_ranges(bounds['lo'], bounds['hi'] + 1, chunk_size)]
+    for chunk, drifting in run_chunks(reconcile_range, chunks, workers=workers):
+        if fix and drifting:
+            chunk.repaired = repair(drifting)
+        report.users += chunk.users
+        report.drifting += chunk.drifting
+        report.total_drift += chunk.total_drift
+        report.repaired += chunk.repaired
+        report.largest = heapq.nlargest(keep, report.largest + chunk.largest)
+    return report
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core import archive
+
+
+class Command(BaseCommand):
+    help = "Move listings and matches finished more than ARCHIVE_AFTER_DAYS ago into the archive tables"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=None,
+            help='Rows moved per transaction (default: ARCHIVE_CHUNK_SIZE)'
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        items, matches = archive.archive(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Archived {items} listings and {matches} matches in {time.perf_counter() - started:.1f}s"
+        ))
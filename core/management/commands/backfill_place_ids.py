@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core import places
+
+
+class Command(BaseCommand):
+    help = "Set the canonical place ID of listings and users saved before place IDs existed"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=5000,
+            help='Rows read and updated per transaction (default: 5000)'
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        updated = places.backfill(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Set the place of {updated} rows in {time.perf_counter() - started:.1f}s"
+        ))
@@ -0,0 +1,60 @@
+import json
+import logging
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings, setup_test_environment
+
+from core import benchmark
+
+
+class Command(BaseCommand):
+    help = "Seed a benchmark dataset and drive a realistic traffic mix, reporting latency percentiles as JSON"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500, help='Total scenarios to run (default: 500)')
+        parser.add_argument('--concurrency', type=int, default=8, help='Worker threads (default: 8)')
+        parser.add_argument(
+            '--url',
+            help='Base URL of a running server (e.g. http://127.0.0.1:8000). '
+                 'Defaults to the in-process Django test client.'
+        )
+        parser.add_argument('--posters', type=int, default=20, help='Benchmark posters to seed (default: 20)')
+        parser.add_argument('--collectors', type=int, default=20, help='Benchmark collectors to seed (default: 20)')
+        parser.add_argument('--items', type=int, default=500, help='Benchmark listings to seed (default: 500)')
+        parser.add_argument('--seed', type=int, help='Random seed for a reproducible dataset and traffic mix')
+        parser.add_argument('--output', help='Write the JSON report to this file instead of stdout')
+        parser.add_argument(
+            '--admission-control', action='store_true',
+            help='Keep admission control on in-process (off by default: every test client shares one IP)'
+        )
+
+    def handle(self, *args, **options):
+        if not options['url']:
+            setup_test_environment()  # Lets the test client reach ALLOWED_HOSTS
+        logging.getLogger('core.requests').setLevel(logging.WARNING)
+
+        benchmark.seed(options['posters'], options['collectors'], options['items'], seed_value=options['seed'])
+        bench = benchmark.Benchmark(
+            requests=options['requests'],
+            concurrency=options['concurrency'],
+            base_url=options['url'],
+            seed_value=options['seed'],
+        )
+        enabled = getattr(settings, 'ADMISSION_CONTROL_ENABLED', True) and (options['url'] or options['admission_control'])
+        with override_settings(ADMISSION_CONTROL_ENABLED=bool(enabled)):
+            report = bench.run()
+        report['config'] = {
+            key: options[key] for key in ('requests', 'concurrency', 'url', 'posters', 'collectors', 'items', 'seed')
+        }
+
+        output = json.dumps(report, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as fh:
+                fh.write(output + '\n')
+            self.stdout.write(self.style.SUCCESS(
+                f"✅ {report['requests']} requests, {report['rps']} req/s, p99 {report['p99_ms']} ms "
+                f"→ {options['output']}"
+            ))
+        else:
+            self.stdout.write(output)
@@ -0,0 +1,41 @@
+import json
+import logging
+
+from django.core.management.base import BaseCommand
+
+from core import benchmark
+
+
+class Command(BaseCommand):
+    help = "Measure concurrent downloads of large uploaded images, reporting throughput and latency as JSON"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--files', type=int, default=4, help='Images to create under MEDIA_ROOT (default: 4)')
+        parser.add_argument('--size-mb', type=float, default=5, help='Size of each image in MB (default: 5)')
+        parser.add_argument('--requests', type=int, default=200, help='Downloads per variant (default: 200)')
+        parser.add_argument('--concurrency', type=int, default=8, help='Concurrent downloads (default: 8)')
+        parser.add_argument('--range-kb', type=int, default=1024, help='Size of the ranged reads (default: 1024)')
+        parser.add_argument(
+            '--url',
+            help='Base URL of a running server sharing MEDIA_ROOT (e.g. http://127.0.0.1:8000). '
+                 'Defaults to calling the views in-process.'
+        )
+        parser.add_argument('--output', help='Write the JSON report to this file instead of stdout')
+
+    def handle(self, *args, **options):
+        logging.getLogger('django.request').setLevel(logging.ERROR)
+        report = benchmark.MediaBenchmark(
+            files=options['files'],
+            size_mb=options['size_mb'],
+            requests=options['requests'],
+            concurrency=options['concurrency'],
+            range_kb=options['range_kb'],
+            base_url=options['url'],
+        ).run()
+        output = json.dumps(report, indent=2, sort_keys=True)
+        if options['output']:
+            with open(options['output'], 'w') as fh:
+                fh.write(output + '\n')
+            self.stdout.write(self.style.SUCCESS(f"✅ {len(report)} variants → {options['output']}"))
+        else:
+            self.stdout.write(output)
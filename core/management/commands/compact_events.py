@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core import events
+
+
+class Command(BaseCommand):
+    help = "Drop status events older than EVENT_RETENTION_DAYS that a later event for the same object supersedes"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=5000,
+            help='Event ids compacted per statement (default: 5000)'
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        deleted = events.compact(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Compacted {deleted} status events in {time.perf_counter() - started:.1f}s"
+        ))
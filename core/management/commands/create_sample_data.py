@@ -4,6 +4,7 @@ from django.core.files.base import ContentFile
 import random
 from datetime import timedelta
 from django.utils import timezone
+from core import analytics
 from core.models import WasteItem, WasteCategory, Match
 
 class Command(BaseCommand):
@@ -152,10 +153,13 @@ class Command(BaseCommand):
                     credits_earned=round(random.uniform(5.0, 100.0), 2) if status == 'collected' else 0
                 )
                 
-                # Set created_at to random past date for realism
+                # Set created_at to random past date for realism (a plain UPDATE,
+                # so WasteItem.save() and its credit logic do not run a second time)
                 days_ago = random.randint(0, 30)
                 waste_item.created_at = timezone.now() - timedelta(days=days_ago)
-                waste_item.save()
+                backdated = WasteItem.objects.filter(pk=waste_item.pk)
+                with analytics.track(backdated):
+                    backdated.update(created_at=waste_item.created_at)
                 
                 waste_items.append(waste_item)
                 self.stdout.write(f"✅ Created waste item: {waste_item.title}")
@@ -0,0 +1,75 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from core import datagen, parallel
+from core.models import User
+
+
+class Command(BaseCommand):
+    help = "Generate a large, reproducible synthetic dataset with bulk inserts (for performance work)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10000, help='Users to generate (default: 10000)')
+        parser.add_argument(
+            '--items',
+            type=int,
+            default=100000,
+            help='Listings to generate; matches and ledger rows follow from listing status (default: 100000)'
+        )
+        parser.add_argument('--seed', type=int, default=0, help='Random seed (default: 0)')
+        parser.add_argument('--prefix', default='gen', help='Username prefix for generated users (default: gen)')
+        parser.add_argument('--batch-size', type=int, default=2000, help='Rows per INSERT (default: 2000)')
+        parser.add_argument('--chunk-size', type=int, default=20000, help='IDs per work unit (default: 20000)')
+        parser.add_argument('--workers', type=int, default=1, help='Worker processes (default: 1)')
+        parser.add_argument(
+            '--orm',
+            action='store_true',
+            help='Insert through bulk_create instead of raw executemany batches (portable, much slower)'
+        )
+        parser.add_argument(
+            '--fast',
+            action='store_true',
+            help='SQLite only: turn off fsync and use WAL while generating'
+        )
+
+    def handle(self, *args, **options):
+        prefix = options['prefix']
+        if User.objects.filter(username__startswith=f'{prefix}_').exists():
+            raise CommandError(f"Users with prefix '{prefix}_' already exist; pick another --prefix")
+
+        if options['fast'] and connection.vendor == 'sqlite':
+            with connection.cursor() as cursor:
+                cursor.execute('PRAGMA journal_mode=WAL')
+                cursor.execute('PRAGMA synchronous=OFF')
+
+        plan = datagen.Plan(
+            users=options['users'], items=options['items'], seed=options['seed'], prefix=prefix,
+            batch_size=options['batch_size'],
+        )
+        plan_args = plan.as_args()
+        chunk_size = options['chunk_size']
+        self.stdout.write(
+            f"=== Generating {plan.users} users and {plan.items} listings "
+            f"(seed {plan.seed}, {options['workers']} worker(s)) ==="
+        )
+
+        started = time.perf_counter()
+        rows = 0
+        # Users first: listing chunks reference them by ID
+        for phase, func, count in (
+            ('users', datagen.generate_users, plan.users),
+            ('items', datagen.generate_items, plan.items),
+        ):
+            chunks = [(plan_args, lo, hi, options['orm']) for lo, hi in parallel.id_ranges(0, count, chunk_size)]
+            for _table, written in parallel.run_chunks(func, chunks, workers=options['workers']):
+                rows += written
+                elapsed = time.perf_counter() - started
+                self.stdout.write(f"  {phase}: {rows} rows, {rows / elapsed:,.0f} rows/s")
+
+        datagen.finalize(plan, chunk_size=chunk_size, workers=options['workers'])
+        elapsed = time.perf_counter() - started
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ {rows} rows in {elapsed:.1f}s ({rows / elapsed:,.0f} rows/s)"
+        ))
@@ -0,0 +1,46 @@
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core import importer
+from core.models import User
+
+
+class Command(BaseCommand):
+    help = "Import waste listings from a CSV file (title, description, quantity, location, waste_type, category, unit)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help="CSV file to import, or - for standard input")
+        parser.add_argument('--user', required=True, help="Username of the poster the listings belong to")
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=2000,
+            help='Valid rows written per transaction (default: 2000)'
+        )
+        parser.add_argument('--dry-run', action='store_true', help="Validate only, write nothing")
+
+    def handle(self, *args, **options):
+        try:
+            poster = User.objects.get(username=options['user'])
+        except User.DoesNotExist:
+            raise CommandError(f"No user named {options['user']!r}")
+
+        started = time.perf_counter()
+        if options['path'] == '-':
+            result = importer.import_listings(sys.stdin.buffer, poster, options['batch_size'], options['dry_run'])
+        else:
+            with open(options['path'], 'rb') as fh:
+                result = importer.import_listings(fh, poster, options['batch_size'], options['dry_run'])
+
+        for line, errors in result.errors:
+            self.stderr.write(f"line {line}: " + '; '.join(f"{name}: {message}" for name, message in errors.items()))
+        if result.invalid > len(result.errors):
+            self.stderr.write(f"... and {result.invalid - len(result.errors)} more invalid rows")
+        verb = "Would import" if options['dry_run'] else "Imported"
+        style = self.style.SUCCESS if not result.invalid else self.style.WARNING
+        self.stdout.write(style(
+            f"{'✅' if not result.invalid else '⚠️'} {verb} {result.created} of {result.rows} rows "
+            f"({result.invalid} invalid) in {time.perf_counter() - started:.1f}s"
+        ))
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core import scheduling
+
+
+class Command(BaseCommand):
+    help = "Replan every collector's accepted matches into their pickup slots (moves missed pickups forward)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=200,
+            help='Collectors replanned per batch (default: 200)'
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        collectors, moved = scheduling.replan_all(chunk_size=options['chunk_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Replanned {collectors} collectors, {moved} matches moved, in {time.perf_counter() - started:.1f}s"
+        ))
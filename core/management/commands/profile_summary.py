@@ -0,0 +1,88 @@
+import collections
+import io
+import pstats
+
+from django.core.management.base import BaseCommand
+
+from core import profiling
+from core.urls import urlpatterns
+
+
+class Command(BaseCommand):
+    help = "Merge spooled request profiles and summarise the top functions per URL name"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=15, help='Functions to show per URL name (default: 15)')
+        parser.add_argument('--url-name', help='Only summarise this URL name')
+        parser.add_argument(
+            '--sort',
+            default='cumulative',
+            choices=['cumulative', 'tottime', 'ncalls'],
+            help='pstats sort key for cProfile output (default: cumulative)'
+        )
+        parser.add_argument(
+            '--issue-token',
+            action='store_true',
+            help='Print a signed X-Profile-Token header value and exit'
+        )
+
+    def handle(self, *args, **options):
+        if options['issue_token']:
+            self.stdout.write(profiling.make_token())
+            return
+
+        spool = profiling.spool_dir()
+        url_names = [p.name for p in urlpatterns if p.name]
+        if options['url_name']:
+            url_names = [options['url_name']]
+
+        self.stdout.write(f"=== Profile summary ({spool}) ===")
+        for url_name in url_names:
+            directory = spool / profiling.safe_view_name(url_name)
+            prof_files = sorted(directory.glob('*.prof')) if directory.is_dir() else []
+            collapsed_files = sorted(directory.glob('*.collapsed')) if directory.is_dir() else []
+
+            if not prof_files and not collapsed_files:
+                self.stdout.write(f"\n{url_name}: no profiles")
+                continue
+
+            self.stdout.write(self.style.SUCCESS(
+                f"\n{url_name}: {len(prof_files)} cProfile, {len(collapsed_files)} sampled"
+            ))
+            if prof_files:
+                self.summarise_pstats(prof_files, options['sort'], options['top'])
+            if collapsed_files:
+                self.summarise_collapsed(collapsed_files, options['top'])
+
+    def summarise_pstats(self, files, sort, top):
+        out = io.StringIO()
+        stats = pstats.Stats(str(files[0]), stream=out)
+        for path in files[1:]:
+            stats.add(str(path))
+        stats.strip_dirs().sort_stats(sort).print_stats(top)
+        self.stdout.write(out.getvalue())
+
+    def summarise_collapsed(self, files, top):
+        """Self samples (leaf frame) and inclusive samples per function"""
+        own = collections.Counter()
+        inclusive = collections.Counter()
+        total = 0
+        for path in files:
+            with open(path) as fh:
+                for line in fh:
+                    stack, _, count = line.rstrip('\n').rpartition(' ')
+                    if not stack:
+                        continue
+                    count = int(count)
+                    frames = stack.split(';')
+                    total += count
+                    own[frames[-1]] += count
+                    for frame in set(frames):
+                        inclusive[frame] += count
+
+        self.stdout.write(f"  {total} samples")
+        self.stdout.write("  self%   incl%  function")
+        for frame, count in own.most_common(top):
+            self.stdout.write(
+                f"  {100 * count / total:5.1f}  {100 * inclusive[frame] / total:6.1f}  {frame}"
+            )
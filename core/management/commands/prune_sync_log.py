@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from core import sync
+
+
+class Command(BaseCommand):
+    help = "Delete sync tombstones and replayed offline actions older than SYNC_RETENTION_DAYS"
+
+    def handle(self, *args, **options):
+        deleted = sync.prune()
+        self.stdout.write(self.style.SUCCESS(f"✅ Deleted {deleted} sync log rows"))
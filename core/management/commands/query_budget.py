@@ -0,0 +1,52 @@
+import logging
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import setup_test_environment
+
+from core import query_budget
+
+
+class Command(BaseCommand):
+    help = "Report the SQL query count of every view at several data sizes and compare it to the baseline"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            type=int,
+            nargs='+',
+            default=[5, 50],
+            help='Numbers of seeded listings/matches/transactions to measure at (default: 5 50)'
+        )
+        parser.add_argument(
+            '--write-baseline',
+            action='store_true',
+            help='Overwrite query_budget_baseline.json with the measured counts'
+        )
+
+    def handle(self, *args, **options):
+        sizes = options['sizes']
+        # Seeded rows are rolled back; the test environment lets the test client talk to the app
+        setup_test_environment()
+        logging.getLogger('core.requests').setLevel(logging.WARNING)
+
+        self.stdout.write(f"=== Query budget report (N = {', '.join(map(str, sizes))}) ===")
+        report = query_budget.run(sizes)
+        baseline = {} if options['write_baseline'] else query_budget.load_baseline()
+
+        width = max(len(key) for key in report)
+        self.stdout.write(f"{'view':<{width}}  " + '  '.join(f"N={n:<5}" for n in sizes) + '  budget')
+        for key, per_size in sorted(report.items()):
+            counts = '  '.join(f"{per_size[n]:<7}" for n in sizes)
+            self.stdout.write(f"{key:<{width}}  {counts}  {baseline.get(key, '-')}")
+
+        if options['write_baseline']:
+            query_budget.write_baseline(report)
+            self.stdout.write(self.style.SUCCESS(f"Baseline written to {query_budget.BASELINE_PATH}"))
+            return
+
+        found = query_budget.problems(report, baseline)
+        for problem in found:
+            self.stdout.write(self.style.ERROR(f"✗ {problem}"))
+        if found:
+            raise CommandError(f"{len(found)} view(s) over budget")
+        self.stdout.write(self.style.SUCCESS("✓ Every view is within its query budget"))
@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core import leaderboard
+
+
+class Command(BaseCommand):
+    help = "Recompute the earner and collector leaderboards from all waste items and matches"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=50000,
+            help='Waste item IDs aggregated per query (default: 50000)'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Processes aggregating chunks in parallel (default: 1)'
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        scores = leaderboard.rebuild(chunk_size=options['chunk_size'], workers=options['workers'])
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Wrote {scores} leaderboard scores in {time.perf_counter() - started:.1f}s"
+        ))
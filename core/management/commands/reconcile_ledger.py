@@ -0,0 +1,45 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core import ledger
+
+
+class Command(BaseCommand):
+    help = "Compare every user's credit balance with their ledger and optionally repair the drift"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=10000,
+            help='User IDs reconciled per range (default: 10000)'
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Processes reconciling ranges in parallel (default: 1)'
+        )
+        parser.add_argument(
+            '--repair',
+            action='store_true',
+            help='Add compensating ledger entries so each ledger sums to its balance'
+        )
+        parser.add_argument(
+            '--show',
+            type=int,
+            default=10,
+            help='How many of the largest drifts to list (default: 10)'
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        report = ledger.reconcile(chunk_size=options['chunk_size'], workers=options['workers'],
+                                  fix=options['repair'], keep=options['show'])
+        for drift, user_id, balance, total in report.largest:
+            self.stdout.write(f"user {user_id}: balance {balance}, ledger {total} (off by {balance - total})")
+        summary = f"Checked {report.users} users: {report.drifting} drifting by {report.total_drift} credits in total"
+        if options['repair']:
+            summary += f", {report.repaired} repaired"
+        self.stdout.write(self.style.SUCCESS(f"✅ {summary}, in {time.perf_counter() - started:.1f}s"))
@@ -0,0 +1,41 @@
+from django.core.management.base import BaseCommand
+
+from core import jobs
+from core.models import AdminJob
+
+
+class Command(BaseCommand):
+    help = "Run queued admin jobs in the foreground, or resume jobs interrupted by a restart"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--job',
+            type=int,
+            nargs='+',
+            help='Only run these job IDs'
+        )
+        parser.add_argument(
+            '--resume',
+            action='store_true',
+            help='Also pick up failed jobs and running ones whose lease expired, continuing from their checkpoint'
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            help='Rows per transaction (default: ADMIN_JOB_CHUNK_SIZE or 500)'
+        )
+
+    def handle(self, *args, **options):
+        pending = AdminJob.objects.filter(jobs.claimable(options['resume'])).order_by('pk')
+        if options['job']:
+            pending = pending.filter(pk__in=options['job'])
+
+        for job_id in pending.values_list('pk', flat=True):
+            job = jobs.run_job(job_id, chunk_size=options['chunk_size'], resume=options['resume'])
+            if job is None:
+                continue
+            style = self.style.SUCCESS if job.status == 'completed' else self.style.ERROR
+            self.stdout.write(style(
+                f"Job #{job.pk} {job.kind}{' (dry run)' if job.dry_run else ''}: {job.status}, "
+                f"{job.processed}/{job.total} processed, {job.affected} affected"
+            ))
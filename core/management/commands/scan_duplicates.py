@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from core import dedup
+
+
+class Command(BaseCommand):
+    help = "Fingerprint listings that have not been and queue their likely duplicates for review"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=500,
+            help='Listings fingerprinted and checked per batch (default: 500)'
+        )
+        parser.add_argument(
+            '--rescan',
+            action='store_true',
+            help='Fingerprint and check every listing again'
+        )
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        checked, flagged = dedup.scan(chunk_size=options['chunk_size'], rescan=options['rescan'])
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Checked {checked} listings, queued {flagged} possible duplicates for review "
+            f"in {time.perf_counter() - started:.1f}s"
+        ))
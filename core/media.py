@@ -0,0 +1,184 @@
+"""
+Serving uploaded media (MEDIA_URL) in production.
+
+MEDIA_SERVE_MODE picks who sends the bytes:
+
+* 'django' (default): a streaming `FileResponse` read in MEDIA_BLOCK_SIZE
+  chunks; WSGI servers with `wsgi.file_wrapper` (gunicorn, uWSGI) hand the
+  open file to sendfile(2) instead. A single `Range: bytes=...` gets
+  206 Partial Content (or 416), honouring `If-Range`.
+* 'x-accel': an empty response with `X-Accel-Redirect` under
+  MEDIA_ACCEL_PREFIX, for an nginx `internal` location to send the file
+  (nginx does ranges and sendfile; use its gzip_static for .gz files).
+* 'x-sendfile': an empty response with `X-Sendfile` (Apache mod_xsendfile,
+  lighttpd).
+
+In every mode Django picks the file first: a `.webp` derivative next to a
+JPEG or PNG for clients that accept WebP, and (except with x-accel) a
+precompressed `.br` / `.gz` sibling for clients that accept that coding.
+It answers If-None-Match / If-Modified-Since itself. Upload names are
+unique per upload (see `models.waste_image_path`), so responses are
+cached as immutable.
+"""
+
+import mimetypes
+import os
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.exceptions import SuspiciousFileOperation
+from django.http import FileResponse, Http404, HttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response, patch_cache_control, patch_vary_headers
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+from django.views.decorators.http import require_safe
+
+from .middleware import accepted_encodings
+
+# Derivative (served to clients that accept image/webp) looked for next to an original
+DERIVATIVES = {'.jpg': '.webp', '.jpeg': '.webp', '.png': '.webp'}
+PRECOMPRESSED = (('br', '.br'), ('gzip', '.gz'))
+
+
+def resolve(path, accept='', accept_encoding='', mode='django'):
+    """(file to send, content type, content encoding, vary) for a media path, or None if there is none"""
+    try:
+        fullpath = safe_join(settings.MEDIA_ROOT, path)
+    except SuspiciousFileOperation:
+        return None
+    if not os.path.isfile(fullpath):
+        return None
+    vary = []
+    stem, extension = os.path.splitext(fullpath)
+    derivative = DERIVATIVES.get(extension.lower())
+    if derivative and os.path.isfile(stem + derivative):
+        vary.append('Accept')
+        if 'image/webp' in accept:
+            fullpath = stem + derivative
+    content_type = mimetypes.guess_type(fullpath)[0] or 'application/octet-stream'
+
+    encoding = None
+    if mode != 'x-accel':
+        variants = [(coding, fullpath + suffix) for coding, suffix in PRECOMPRESSED
+                    if os.path.isfile(fullpath + suffix)]
+        if variants:
+            vary.append('Accept-Encoding')
+            accepted = accepted_encodings(accept_encoding)
+            encoding, fullpath = next(((coding, variant) for coding, variant in variants if coding in accepted),
+                                      (None, fullpath))
+    return fullpath, content_type, encoding, vary
+
+
+def parse_range(header, size):
+    """
+    (first, last) byte of a single `bytes=` range, or None to send the whole
+    file (no header, several ranges, or not bytes). Raises ValueError if the
+    range cannot be satisfied.
+    """
+    unit, _, ranges = (header or '').partition('=')
+    if unit.strip().lower() != 'bytes' or ',' in ranges:
+        return None
+    first, _, last = ranges.strip().partition('-')
+    try:
+        if not first:
+            length = int(last)
+            if length <= 0:
+                raise ValueError
+            return max(size - length, 0), size - 1
+        first, last = int(first), int(last) if last else size - 1
+    except ValueError:
+        return None
+    if first >= size or last < first:
+        raise ValueError("Range not satisfiable")
+    return first, min(last, size - 1)
+
+
+class FileSlice:
+    """`length` bytes of an open file from its current position, read like a file"""
+
+    def __init__(self, file, length):
+        self.file = file
+        self.remaining = length
+
+    def read(self, size=-1):
+        if self.remaining <= 0:
+            return b''
+        size = self.remaining if size is None or size < 0 else min(size, self.remaining)
+        data = self.file.read(size)
+        self.remaining -= len(data)
+        return data
+
+    def close(self):
+        self.file.close()
+
+
+def _wanted_range(request, size, etag, last_modified):
+    header = request.headers.get('Range')
+    if_range = request.headers.get('If-Range')
+    if not header or (if_range and if_range != etag and parse_http_date_safe(if_range) != last_modified):
+        return None
+    return parse_range(header, size)
+
+
+def _send_file(request, fullpath, content_type, size, etag, last_modified):
+    try:
+        wanted = _wanted_range(request, size, etag, last_modified)
+    except ValueError:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+        return response
+    first, last = wanted or (0, size - 1)
+    length = max(last - first + 1, 0)
+    if request.method == 'HEAD':
+        response = HttpResponse(content_type=content_type)
+    else:
+        file = open(fullpath, 'rb')
+        file.seek(first)
+        # Up to the end of the file: pass the file itself, so file_wrapper can sendfile() it
+        body = file if last == size - 1 else FileSlice(file, length)
+        response = FileResponse(body, content_type=content_type)
+        response.block_size = getattr(settings, 'MEDIA_BLOCK_SIZE', 256 * 1024)
+    response['Content-Length'] = str(length)
+    if wanted:
+        response.status_code = 206
+        response['Content-Range'] = f'bytes {first}-{last}/{size}'
+    return response
+
+
+def _offload(mode, fullpath, content_type):
+    response = HttpResponse(content_type=content_type)
+    if mode == 'x-accel':
+        relative = os.path.relpath(fullpath, settings.MEDIA_ROOT).replace(os.sep, '/')
+        response['X-Accel-Redirect'] = quote(getattr(settings, 'MEDIA_ACCEL_PREFIX', '/protected-media/') + relative)
+    else:
+        response['X-Sendfile'] = fullpath
+    return response
+
+
+@require_safe
+def serve(request, path):
+    mode = getattr(settings, 'MEDIA_SERVE_MODE', 'django')
+    found = resolve(path, request.headers.get('Accept', ''), request.headers.get('Accept-Encoding', ''), mode)
+    if found is None:
+        raise Http404("No such file")
+    fullpath, content_type, encoding, vary = found
+    stat = os.stat(fullpath)
+    etag = quote_etag(f'{stat.st_mtime_ns:x}-{stat.st_size:x}')
+    last_modified = int(stat.st_mtime)
+
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        if mode in ('x-accel', 'x-sendfile'):
+            response = _offload(mode, fullpath, content_type)
+        else:
+            response = _send_file(request, fullpath, content_type, stat.st_size, etag, last_modified)
+            response['Accept-Ranges'] = 'bytes'
+        if encoding and response.status_code in (200, 206):
+            response['Content-Encoding'] = encoding
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    if vary:
+        patch_vary_headers(response, vary)
+    patch_cache_control(response, public=True, immutable=True,
+                        max_age=getattr(settings, 'MEDIA_MAX_AGE', 365 * 24 * 3600))
+    return response
@@ -0,0 +1,280 @@
+"""
+In-process metrics registry exposed at `/metrics` in Prometheus text format.
+
+Counters and histograms are kept per process. When `METRICS_MULTIPROC_DIR` is
+set (one directory shared by all gunicorn workers) every worker writes its
+values into its own mmap-backed file and the scrape sums the files, so the
+numbers are correct whichever worker answers the scrape. Without it the values
+live in a plain dict, which is enough for `runserver` and the tests.
+
+Gauges that describe database state (waste items per status) are computed at
+scrape time with a single grouped query instead of being tracked in memory.
+"""
+
+import glob
+import json
+import mmap
+import os
+import struct
+import threading
+from collections import defaultdict
+
+from django.conf import settings
+from django.db.models import Count
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_lock = threading.Lock()
+
+
+class DictValues:
+    """Values of the current process only"""
+
+    def __init__(self):
+        self._values = defaultdict(float)
+
+    def inc(self, key, amount):
+        with _lock:
+            self._values[key] += amount
+
+    def items(self):
+        with _lock:
+            return list(self._values.items())
+
+
+class MmapValues:
+    """
+    Values of one worker, stored in a memory-mapped file.
+
+    Layout: an 8 byte header holding the number of used bytes, followed by
+    entries of `uint32 key length | key (padded to 8 bytes) | float64 value`.
+    Entries are only ever appended, so readers in other processes can scan the
+    file without locking.
+    """
+
+    INITIAL_SIZE = 64 * 1024
+
+    def __init__(self, path):
+        self.path = path
+        self._positions = {}
+        exists = os.path.exists(path)
+        with open(path, 'ab') as fh:
+            if not exists or os.path.getsize(path) < self.INITIAL_SIZE:
+                fh.truncate(self.INITIAL_SIZE)
+        self._file = open(path, 'r+b')
+        self._map = mmap.mmap(self._file.fileno(), 0)
+        self._used = struct.unpack_from('Q', self._map, 0)[0] or 8
+        for key, _value, offset in self._scan(self._map, self._used):
+            self._positions[key] = offset
+
+    @staticmethod
+    def _scan(buf, used):
+        pos = 8
+        while pos < used:
+            (length,) = struct.unpack_from('I', buf, pos)
+            key = bytes(buf[pos + 4:pos + 4 + length]).decode()
+            value_offset = pos + 4 + length + (-(4 + length) % 8)
+            (value,) = struct.unpack_from('d', buf, value_offset)
+            yield key, value, value_offset
+            pos = value_offset + 8
+
+    @classmethod
+    def read_file(cls, path):
+        with open(path, 'rb') as fh:
+            data = fh.read()
+        if len(data) < 8:
+            return []
+        used = struct.unpack_from('Q', data, 0)[0]
+        return [(key, value) for key, value, _ in cls._scan(data, used)]
+
+    def _append(self, key):
+        encoded = key.encode()
+        padding = -(4 + len(encoded)) % 8
+        size = 4 + len(encoded) + padding + 8
+        if self._used + size > len(self._map):
+            new_size = max(len(self._map) * 2, self._used + size)
+            self._map.close()
+            self._file.truncate(new_size)
+            self._map = mmap.mmap(self._file.fileno(), 0)
+        struct.pack_into('I', self._map, self._used, len(encoded))
+        self._map[self._used + 4:self._used + 4 + len(encoded)] = encoded
+        offset = self._used + 4 + len(encoded) + padding
+        struct.pack_into('d', self._map, offset, 0.0)
+        self._used = offset + 8
+        struct.pack_into('Q', self._map, 0, self._used)
+        self._positions[key] = offset
+        return offset
+
+    def inc(self, key, amount):
+        with _lock:
+            offset = self._positions.get(key)
+            if offset is None:
+                offset = self._append(key)
+            (value,) = struct.unpack_from('d', self._map, offset)
+            struct.pack_into('d', self._map, offset, value + amount)
+
+    def items(self):
+        with _lock:
+            return [(key, value) for key, value, _ in self._scan(self._map, self._used)]
+
+
+_values = None
+_values_pid = None
+
+
+def get_values():
+    """Storage for this process (re-opened after a fork)"""
+    global _values, _values_pid
+    if _values is None or _values_pid != os.getpid():
+        directory = getattr(settings, 'METRICS_MULTIPROC_DIR', None)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+            _values = MmapValues(os.path.join(directory, f'metrics-{os.getpid()}.db'))
+        else:
+            _values = DictValues()
+        _values_pid = os.getpid()
+    return _values
+
+
+def collect_values():
+    """Values summed across every worker"""
+    directory = getattr(settings, 'METRICS_MULTIPROC_DIR', None)
+    if not directory:
+        return get_values().items()
+    totals = defaultdict(float)
+    for path in glob.glob(os.path.join(directory, 'metrics-*.db')):
+        for key, value in MmapValues.read_file(path):
+            totals[key] += value
+    return list(totals.items())
+
+
+def _key(sample, labels):
+    return json.dumps([sample, sorted(labels.items())])
+
+
+class Metric:
+    kind = None
+
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        REGISTRY[name] = self
+
+    def _labels(self, labels):
+        return {name: str(labels.get(name, '')) for name in self.labelnames}
+
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def inc(self, amount=1, **labels):
+        get_values().inc(_key(self.name + '_total', self._labels(labels)), float(amount))
+
+
+class Histogram(Metric):
+    kind = 'histogram'
+
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, **labels):
+        labels = self._labels(labels)
+        values = get_values()
+        # Only the first matching bucket is stored; the exposition cumulates them
+        bound = next((b for b in self.buckets if value <= b), '+Inf')
+        values.inc(_key(self.name + '_bucket', dict(labels, le=str(bound))), 1.0)
+        values.inc(_key(self.name + '_sum', labels), float(value))
+        values.inc(_key(self.name + '_count', labels), 1.0)
+
+
+REGISTRY = {}
+
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'Request latency by view', ['view', 'method'],
+)
+REQUESTS = Counter('http_requests', 'Requests by view and status class', ['view', 'status'])
+DB_QUERIES = Counter('db_queries', 'ORM queries executed by view', ['view'])
+DB_TIME = Counter('db_query_seconds', 'Time spent in SQL by view', ['view'])
+CACHE_REQUESTS = Counter('cache_requests', 'Cache lookups by cache and result (hit/miss)', ['cache', 'result'])
+CREDIT_TRANSACTIONS = Counter('credit_transactions', 'Ledger entries written', ['type'])
+CREDIT_AMOUNT = Counter('credit_transaction_amount', 'Credits moved through the ledger', ['type'])
+ADMISSION_REJECTED = Counter('admission_rejected', 'Requests refused by admission control', ['view', 'reason'])
+MATCH_TRANSITIONS = Counter('match_transitions', 'Match status transitions', ['from_status', 'to_status'])
+
+
+def observe_request(request, response, stats):
+    view = stats.view_name or 'unresolved'
+    REQUEST_LATENCY.observe(stats.total_time, view=view, method=request.method)
+    REQUESTS.inc(view=view, status=f'{response.status_code // 100}xx')
+    DB_QUERIES.inc(stats.query_count, view=view)
+    DB_TIME.inc(stats.sql_time, view=view)
+
+
+def record_cache_lookup(cache_name, hit):
+    CACHE_REQUESTS.inc(cache=cache_name, result='hit' if hit else 'miss')
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in labels) + '}'
+
+
+def _format_value(value):
+    return repr(float(value)) if value != int(value) else f'{int(value)}'
+
+
+def _db_gauges():
+    from .models import WasteItem
+
+    lines = [
+        '# HELP waste_items Waste items by status',
+        '# TYPE waste_items gauge',
+    ]
+    counts = dict(WasteItem.objects.order_by().values_list('status').annotate(n=Count('id')))
+    for status, _label in WasteItem.STATUS_CHOICES:
+        lines.append(f'waste_items{{status="{status}"}} {counts.get(status, 0)}')
+    return lines
+
+
+def render_latest():
+    """All metrics in Prometheus text exposition format"""
+    samples = defaultdict(list)
+    for key, value in collect_values():
+        sample, labels = json.loads(key)
+        samples[sample].append((tuple(tuple(pair) for pair in labels), value))
+
+    lines = []
+    for metric in REGISTRY.values():
+        lines.append(f'# HELP {metric.name} {metric.documentation}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        if metric.kind == 'counter':
+            for labels, value in sorted(samples.get(metric.name + '_total', [])):
+                lines.append(f'{metric.name}_total{_format_labels(labels)} {_format_value(value)}')
+            continue
+
+        # Histogram: turn the stored per-bucket counts into cumulative buckets
+        buckets = defaultdict(dict)
+        for labels, value in samples.get(metric.name + '_bucket', []):
+            labels = dict(labels)
+            bound = labels.pop('le')
+            buckets[tuple(sorted(labels.items()))][bound] = value
+        for labels, per_bound in sorted(buckets.items()):
+            running = 0.0
+            for bound in [str(b) for b in metric.buckets] + ['+Inf']:
+                running += per_bound.get(bound, 0.0)
+                lines.append(
+                    f'{metric.name}_bucket{_format_labels(labels + (("le", bound),))} {_format_value(running)}'
+                )
+        for suffix in ('_sum', '_count'):
+            for labels, value in sorted(samples.get(metric.name + suffix, [])):
+                lines.append(f'{metric.name}{suffix}{_format_labels(labels)} {_format_value(value)}')
+
+    lines.extend(_db_gauges())
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,173 @@
+import logging
+from contextlib import ExitStack
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connections
+from django.utils.cache import patch_vary_headers
+from django.utils.text import compress_string
+
+try:
+    import brotli
+except ImportError:  # Optional: gzip only
+    brotli = None
+
+from . import admission, instrumentation, metrics, profiling, routers
+
+logger = logging.getLogger('core.requests')
+
+# Characters of the slowest statement kept in the log line (extra['perf'] keeps 200).
+# It is the last field and runs to the end of the line, on one line.
+LOG_SQL_CHARS = 120
+
+
+class RequestInstrumentationMiddleware:
+    """
+    Record query count, SQL time, the slowest statement, template render time
+    and the view name for every request. The numbers are sent back in a
+    `Server-Timing` header and written as one log line per request.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        instrumentation.install_template_timer()
+
+    def __call__(self, request):
+        stats, token = instrumentation.start_request()
+        request.perf_stats = stats
+        try:
+            with ExitStack() as stack:
+                for connection in connections.all():
+                    # Cache lookups are counted in cache_requests, not as the request's SQL
+                    if connection.alias != routers.CACHE_DATABASE:
+                        stack.enter_context(connection.execute_wrapper(instrumentation.sql_execute_wrapper))
+                response = self.get_response(request)
+        finally:
+            instrumentation.finish_request(token)
+
+        response['Server-Timing'] = stats.server_timing()
+        metrics.observe_request(request, response, stats)
+        fields = stats.as_log_fields()
+        logger.info(
+            'method=%s path=%s status=%s view=%s queries=%d sql_ms=%.1f template_ms=%.1f total_ms=%.1f '
+            'slowest_sql_ms=%.1f slowest_sql=%s',
+            request.method, request.path, response.status_code, fields['view'], fields['queries'],
+            fields['sql_ms'], fields['template_ms'], fields['total_ms'],
+            fields['slowest_sql_ms'], ' '.join(fields['slowest_sql'].split())[:LOG_SQL_CHARS],
+            extra={'perf': dict(fields, method=request.method, path=request.path, status=response.status_code)},
+        )
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        stats = getattr(request, 'perf_stats', None)
+        if stats is not None and request.resolver_match is not None:
+            stats.view_name = request.resolver_match.view_name
+        return None
+
+
+class SamplingProfilerMiddleware:
+    """
+    Profile a sampled fraction of requests (or any request with a signed
+    `X-Profile-Token` header) and spool the result per view. Disabled unless
+    `PROFILER_ENABLED` is set.
+    """
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'PROFILER_ENABLED', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        if not profiling.should_profile(request):
+            return self.get_response(request)
+
+        with profiling.RequestProfiler() as profiler:
+            response = self.get_response(request)
+
+        match = request.resolver_match
+        try:
+            profiler.write(match.view_name if match else '')
+        except OSError:
+            logger.exception("could not write profile for %s", request.path)
+        return response
+
+
+class AdmissionControlMiddleware:
+    """
+    Rate limits, concurrency limits and load shedding for the views named in
+    ADMISSION_RULES (see core/admission.py). Refused requests get a 429 or
+    503 before the view runs.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        try:
+            with admission.in_flight():
+                response = self.get_response(request)
+        finally:
+            admission.release(request)
+        admission.observe(getattr(request, 'perf_stats', None))
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        if not getattr(settings, 'ADMISSION_CONTROL_ENABLED', True) or request.resolver_match is None:
+            return None
+        return admission.admit(request, request.resolver_match.url_name)
+
+
+def accepted_encodings(header):
+    """{coding: q} from an Accept-Encoding header, without the refused (q=0) ones"""
+    accepted = {}
+    for part in header.split(','):
+        coding, _, params = part.strip().partition(';')
+        quality = 1.0
+        if params.strip().startswith('q='):
+            try:
+                quality = float(params.strip()[2:])
+            except ValueError:
+                continue
+        if coding and quality > 0:
+            accepted[coding.strip().lower()] = quality
+    return accepted
+
+
+class CompressionMiddleware:
+    """
+    Compress JSON responses with brotli (when the `brotli` package is
+    installed) or gzip, whichever the client prefers. HTML is left alone:
+    its pages carry CSRF tokens next to user input (BREACH).
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.min_length = getattr(settings, 'COMPRESS_MIN_LENGTH', 200)
+
+    def __call__(self, request):
+        response = self.get_response(request)
+        if (
+            response.streaming
+            or response.has_header('Content-Encoding')
+            or not response.get('Content-Type', '').startswith('application/json')
+        ):
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if len(response.content) < self.min_length:
+            return response
+
+        accepted = accepted_encodings(request.META.get('HTTP_ACCEPT_ENCODING', ''))
+        candidates = [coding for coding in ('br', 'gzip') if coding in accepted and (coding != 'br' or brotli)]
+        if not candidates:
+            return response
+        coding = max(candidates, key=lambda c: accepted[c])  # Ties go to brotli, the smaller of the two
+        if coding == 'br':
+            compressed = brotli.compress(response.content, quality=getattr(settings, 'BROTLI_QUALITY', 5))
+        else:
+            compressed = compress_string(response.content)
+        if len(compressed) >= len(response.content):
+            return response
+        response.content = compressed
+        response['Content-Length'] = str(len(compressed))
+        response['Content-Encoding'] = coding
+        return response
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.6 on 2026-10-19 13:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0004_wasteitem_estimated_credits_credittransaction'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='user',
+            name='user_type',
+            field=models.CharField(choices=[('household', 'Household'), ('farmer', 'Farmer'), ('collector', 'Waste Collector (Youth/Women)'), ('recycler', 'Recycler/Processor')], db_index=True, default='household', max_length=20),
+        ),
+        migrations.AddIndex(
+            model_name='credittransaction',
+            index=models.Index(fields=['created_at'], name='credittx_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='credittransaction',
+            index=models.Index(fields=['user', 'created_at'], name='credittx_user_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='credittransaction',
+            index=models.Index(fields=['transaction_type'], name='credittx_type_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='match',
+            index=models.Index(fields=['created_at'], name='match_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='match',
+            index=models.Index(fields=['status', 'created_at'], name='match_status_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='wasteitem',
+            index=models.Index(fields=['created_at'], name='wasteitem_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='wasteitem',
+            index=models.Index(fields=['status', 'created_at'], name='wasteitem_status_created_idx'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.2.6 on 2026-10-19 13:18
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0006_adminjob'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImpactRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('grain', models.CharField(choices=[('day', 'Day'), ('month', 'Month')], default='day', max_length=5)),
+                ('day', models.DateField()),
+                ('area', models.CharField(max_length=100)),
+                ('waste_type', models.CharField(choices=[('plastic', 'Plastic'), ('paper', 'Paper/Cardboard'), ('metal', 'Metal'), ('glass', 'Glass'), ('organic', 'Organic/Food Waste'), ('agricultural', 'Agricultural Residues'), ('e-waste', 'E-Waste'), ('textile', 'Textile'), ('other', 'Other')], max_length=20)),
+                ('status', models.CharField(choices=[('available', 'Available'), ('pending', 'Pending Pickup'), ('collected', 'Collected'), ('recycled', 'Recycled')], max_length=20)),
+                ('items', models.IntegerField(default=0)),
+                ('weight_kg', models.DecimalField(decimal_places=3, default=0, max_digits=14)),
+                ('estimated_credits', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('credits_earned', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='core.wastecategory')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['area', 'grain', 'day'], name='impactrollup_area_day_idx')],
+                'constraints': [models.UniqueConstraint(fields=('grain', 'day', 'area', 'waste_type', 'category', 'status'), name='impactrollup_key'), models.UniqueConstraint(condition=models.Q(('category__isnull', True)), fields=('grain', 'day', 'area', 'waste_type', 'status'), name='impactrollup_uncategorised_key')],
+            },
+        ),
+    ]
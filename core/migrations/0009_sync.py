@@ -0,0 +1,72 @@
+# Generated by Django 5.2.6 on 2026-10-19 14:07
+
+import django.core.serializers.json
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0008_leaderboardscore'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OfflineAction',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=64)),
+                ('kind', models.CharField(max_length=20)),
+                ('status_code', models.PositiveSmallIntegerField(default=0)),
+                ('response', models.JSONField(default=dict, encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('created_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='Tombstone',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('listing', 'Listing'), ('match', 'Match')], max_length=10)),
+                ('object_id', models.BigIntegerField()),
+                ('area', models.CharField(blank=True, help_text='Area of a removed listing', max_length=100)),
+                ('removed_at', models.DateTimeField(auto_now_add=True, db_index=True)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='match',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.AddIndex(
+            model_name='match',
+            index=models.Index(fields=['collector', 'updated_at', 'id'], name='match_collector_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='wasteitem',
+            index=models.Index(fields=['status', 'updated_at', 'id'], name='wasteitem_status_updated_idx'),
+        ),
+        migrations.AddField(
+            model_name='offlineaction',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='offline_actions', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddField(
+            model_name='tombstone',
+            name='user',
+            field=models.ForeignKey(blank=True, db_index=False, help_text='Collector of a removed match', null=True, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddConstraint(
+            model_name='offlineaction',
+            constraint=models.UniqueConstraint(fields=('user', 'key'), name='offline_action_key'),
+        ),
+        migrations.AddIndex(
+            model_name='tombstone',
+            index=models.Index(fields=['kind', 'area', 'id'], name='tombstone_area_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='tombstone',
+            index=models.Index(fields=['user', 'id'], name='tombstone_user_idx'),
+        ),
+    ]
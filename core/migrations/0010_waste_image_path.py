@@ -0,0 +1,19 @@
+# Generated by Django 5.2.6 on 2026-10-19 14:11
+
+import core.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0009_sync'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='wasteitem',
+            name='image',
+            field=models.ImageField(blank=True, null=True, upload_to=core.models.waste_image_path),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-19 14:32
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0010_waste_image_path'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='place',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=64),
+        ),
+        migrations.AddField(
+            model_name='wasteitem',
+            name='place',
+            field=models.CharField(blank=True, db_index=True, default='', editable=False, max_length=64),
+        ),
+    ]
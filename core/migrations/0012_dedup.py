@@ -0,0 +1,54 @@
+# Generated by Django 5.2.6 on 2026-10-19 14:38
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0011_place_ids'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ListingFingerprint',
+            fields=[
+                ('item', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='fingerprint', serialize=False, to='core.wasteitem')),
+                ('image_hash', models.CharField(blank=True, help_text='dHash of the image in hex', max_length=16)),
+                ('minhash', models.JSONField(default=list, help_text='MinHash signature of the title and description')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('poster', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='DedupBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=24)),
+                ('item', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.wasteitem')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['key', 'item'], name='dedupbucket_key_idx'), models.Index(fields=['item'], name='dedupbucket_item_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='DuplicateCandidate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('image_distance', models.PositiveSmallIntegerField(blank=True, help_text='Bits by which the image hashes differ', null=True)),
+                ('text_similarity', models.FloatField(default=0, help_text='Estimated Jaccard similarity of the text')),
+                ('status', models.CharField(choices=[('pending', 'Pending review'), ('confirmed', 'Confirmed duplicate'), ('dismissed', 'Not a duplicate')], default='pending', max_length=20)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('reviewed_at', models.DateTimeField(blank=True, null=True)),
+                ('duplicate_of', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='core.wasteitem')),
+                ('item', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='duplicate_candidates', to='core.wasteitem')),
+                ('reviewed_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['status', 'created_at'], name='duplicate_status_idx')],
+                'constraints': [models.UniqueConstraint(fields=('item', 'duplicate_of'), name='duplicate_candidate_pair')],
+            },
+        ),
+    ]
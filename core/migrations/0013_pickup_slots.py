@@ -0,0 +1,48 @@
+# Generated by Django 5.2.6 on 2026-10-19 14:58
+
+import django.core.validators
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0012_dedup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='vehicle_capacity_kg',
+            field=models.DecimalField(decimal_places=2, default=0, help_text='What a collector can carry in one pickup slot', max_digits=8, validators=[django.core.validators.MinValueValidator(0)]),
+        ),
+        migrations.CreateModel(
+            name='PickupSlot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start', models.DateTimeField()),
+                ('end', models.DateTimeField()),
+                ('capacity_kg', models.DecimalField(blank=True, decimal_places=2, help_text="Leave empty to use the collector's vehicle capacity", max_digits=8, null=True, validators=[django.core.validators.MinValueValidator(0)])),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('collector', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='pickup_slots', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['start'],
+            },
+        ),
+        migrations.AddField(
+            model_name='match',
+            name='slot',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='matches', to='core.pickupslot'),
+        ),
+        migrations.AddIndex(
+            model_name='pickupslot',
+            index=models.Index(fields=['collector', 'end'], name='pickupslot_collector_end_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='pickupslot',
+            constraint=models.CheckConstraint(condition=models.Q(('end__gt', models.F('start'))), name='pickupslot_ends_after_start'),
+        ),
+    ]
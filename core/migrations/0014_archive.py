@@ -0,0 +1,62 @@
+# Generated by Django 5.2.6 on 2026-10-19 15:04
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0013_pickup_slots'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedMatch',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('waste_item_ref', models.BigIntegerField(db_index=True, help_text='ID of the listing, live or archived')),
+                ('waste_item_title', models.CharField(max_length=200)),
+                ('location', models.CharField(max_length=200)),
+                ('status', models.CharField(choices=[('pending', 'Pending'), ('accepted', 'Accepted'), ('rejected', 'Rejected'), ('completed', 'Completed')], max_length=20)),
+                ('message', models.TextField(blank=True)),
+                ('pickup_start', models.DateTimeField(blank=True, null=True)),
+                ('pickup_end', models.DateTimeField(blank=True, null=True)),
+                ('collected_at', models.DateTimeField(blank=True, help_text='When the listing was last updated', null=True)),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('collector', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='archived_matches', to=settings.AUTH_USER_MODEL)),
+                ('poster', models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['collector', 'id'], name='archived_match_collector_idx'), models.Index(fields=['poster', 'id'], name='archived_match_poster_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedWasteItem',
+            fields=[
+                ('id', models.BigIntegerField(primary_key=True, serialize=False)),
+                ('title', models.CharField(max_length=200)),
+                ('description', models.TextField()),
+                ('waste_type', models.CharField(choices=[('plastic', 'Plastic'), ('paper', 'Paper/Cardboard'), ('metal', 'Metal'), ('glass', 'Glass'), ('organic', 'Organic/Food Waste'), ('agricultural', 'Agricultural Residues'), ('e-waste', 'E-Waste'), ('textile', 'Textile'), ('other', 'Other')], max_length=20)),
+                ('quantity', models.DecimalField(decimal_places=2, max_digits=10)),
+                ('unit', models.CharField(max_length=20)),
+                ('location', models.CharField(max_length=200)),
+                ('place', models.CharField(blank=True, default='', max_length=64)),
+                ('image', models.ImageField(blank=True, null=True, upload_to='')),
+                ('status', models.CharField(choices=[('available', 'Available'), ('pending', 'Pending Pickup'), ('collected', 'Collected'), ('recycled', 'Recycled')], max_length=20)),
+                ('credits_earned', models.DecimalField(decimal_places=2, default=0, max_digits=8)),
+                ('estimated_credits', models.DecimalField(decimal_places=2, default=0, max_digits=8)),
+                ('created_at', models.DateTimeField()),
+                ('updated_at', models.DateTimeField()),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='core.wastecategory')),
+                ('poster', models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='archived_waste_items', to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'indexes': [models.Index(fields=['poster', 'id'], name='archived_item_poster_idx')],
+            },
+        ),
+    ]
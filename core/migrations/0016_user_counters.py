@@ -0,0 +1,33 @@
+# Generated by Django 5.2.6 on 2026-10-19 15:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0015_status_events'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='items_posted',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='matches_made',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='pending_matches_received',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='transaction_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 5.2.6 on 2026-10-19 16:27
+
+from django.db import migrations, models
+
+
+def key_existing_rows_by_area(apps, schema_editor):
+    # Rows written before place keys keep their area text as the key (unique, as it was);
+    # `manage.py rebuild_rollups` then moves them onto place IDs
+    ImpactRollup = apps.get_model('core', 'ImpactRollup')
+    ImpactRollup.objects.update(place=models.F('area'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_user_counters'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='impactrollup',
+            name='impactrollup_key',
+        ),
+        migrations.RemoveConstraint(
+            model_name='impactrollup',
+            name='impactrollup_uncategorised_key',
+        ),
+        migrations.RemoveIndex(
+            model_name='impactrollup',
+            name='impactrollup_area_day_idx',
+        ),
+        migrations.AddField(
+            model_name='impactrollup',
+            name='place',
+            field=models.CharField(default='', max_length=100),
+        ),
+        migrations.RunPython(key_existing_rows_by_area, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='impactrollup',
+            index=models.Index(fields=['place', 'grain', 'day'], name='impactrollup_place_day_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='impactrollup',
+            constraint=models.UniqueConstraint(fields=('grain', 'day', 'place', 'waste_type', 'category', 'status'), name='impactrollup_place_key'),
+        ),
+        migrations.AddConstraint(
+            model_name='impactrollup',
+            constraint=models.UniqueConstraint(condition=models.Q(('category__isnull', True)), fields=('grain', 'day', 'place', 'waste_type', 'status'), name='impactrollup_uncategorised_place_key'),
+        ),
+    ]
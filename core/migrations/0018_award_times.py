@@ -0,0 +1,44 @@
+# Generated by Django 5.2.6 on 2026-10-19 16:30
+
+from django.db import migrations, models
+
+
+def stamp_existing_awards(apps, schema_editor):
+    # Before these fields the leaderboards took the listing's last update as the award time
+    for name in ('WasteItem', 'ArchivedWasteItem'):
+        apps.get_model('core', name).objects.filter(credits_earned__gt=0).update(credited_at=models.F('updated_at'))
+    Match = apps.get_model('core', 'Match')
+    WasteItem = apps.get_model('core', 'WasteItem')
+    Match.objects.filter(status='completed').update(completed_at=models.Subquery(
+        WasteItem.objects.filter(pk=models.OuterRef('waste_item_id')).values('updated_at')[:1]))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_rollup_place'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='archivedwasteitem',
+            name='credited_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='match',
+            name='completed_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='wasteitem',
+            name='credited_at',
+            field=models.DateTimeField(blank=True, editable=False, null=True),
+        ),
+        migrations.AlterField(
+            model_name='archivedmatch',
+            name='collected_at',
+            field=models.DateTimeField(blank=True, help_text='When the match was completed', null=True),
+        ),
+        migrations.RunPython(stamp_existing_awards, migrations.RunPython.noop),
+    ]
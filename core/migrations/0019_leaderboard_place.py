@@ -0,0 +1,41 @@
+# Generated by Django 5.2.6 on 2026-10-19 16:34
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_award_times'),
+    ]
+
+    operations = [
+        migrations.RemoveConstraint(
+            model_name='leaderboardscore',
+            name='leaderboard_key',
+        ),
+        migrations.RemoveIndex(
+            model_name='leaderboardscore',
+            name='leaderboard_rank_idx',
+        ),
+        # Scores written before place keys keep their area text as the key; `manage.py rebuild_leaderboards`
+        # then moves them onto place IDs
+        migrations.RenameField(
+            model_name='leaderboardscore',
+            old_name='area',
+            new_name='place',
+        ),
+        migrations.AlterField(
+            model_name='tombstone',
+            name='area',
+            field=models.CharField(blank=True, help_text='Place key of a removed listing', max_length=100),
+        ),
+        migrations.AddIndex(
+            model_name='leaderboardscore',
+            index=models.Index(fields=['board', 'period', 'place', '-score', 'user'], name='leaderboard_rank_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='leaderboardscore',
+            constraint=models.UniqueConstraint(fields=('board', 'period', 'place', 'user'), name='leaderboard_key'),
+        ),
+    ]
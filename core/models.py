@@ -1,7 +1,18 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
 from django.contrib.auth.models import AbstractUser
+from django.core.serializers.json import DjangoJSONEncoder
 from django.core.validators import MinValueValidator
+from django.utils import timezone
 from decimal import Decimal
+import logging
+import os
+import uuid
+
+from . import analytics, counters, events, leaderboard, metrics, places, refdata, scheduling, sync
+
+logger = logging.getLogger(__name__)
 
 
 class User(AbstractUser):
@@ -12,11 +23,24 @@ class User(AbstractUser):
         ('recycler', 'Recycler/Processor'),
     )
 
-    user_type = models.CharField(max_length=20, choices=USER_TYPES, default='household')
+    user_type = models.CharField(max_length=20, choices=USER_TYPES, default='household', db_index=True)
     phone = models.CharField(max_length=15, blank=True)
     address = models.TextField(blank=True)
     location = models.CharField(max_length=200, blank=True, help_text="Location in Machakos County")
+    # Canonical place of `location` (core/places.py), kept in step by save()
+    place = models.CharField(max_length=64, blank=True, default='', db_index=True, editable=False)
     digital_credits = models.DecimalField(max_digits=10, decimal_places=2, default=0, validators=[MinValueValidator(0)])
+    vehicle_capacity_kg = models.DecimalField(max_digits=8, decimal_places=2, default=0,
+                                              validators=[MinValueValidator(0)],
+                                              help_text="What a collector can carry in one pickup slot")
+    # Kept by core/counters.py with F() updates; save() never writes them
+    items_posted = models.PositiveIntegerField(default=0, editable=False)
+    pending_matches_received = models.PositiveIntegerField(default=0, editable=False)
+    matches_made = models.PositiveIntegerField(default=0, editable=False)
+    transaction_count = models.PositiveIntegerField(default=0, editable=False)
+
+    # Columns only ever changed with F() updates (add_credits, deduct_credits, jobs, counters)
+    SQL_MAINTAINED = ('digital_credits', *counters.FIELDS)
 
     # Add related_name to avoid clashes
     groups = models.ManyToManyField(
@@ -39,45 +63,70 @@ class User(AbstractUser):
     def __str__(self):
         return f"{self.username} ({self.get_user_type_display()})"
 
+    def get_user_type_display(self):
+        return refdata.get().user_type_labels.get(self.user_type, self.user_type)
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'location' in update_fields:
+            self.place = places.place_id(self.location)
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'place'}
+        if update_fields is None and not self._state.adding:
+            # A cached or long-lived instance holds an old balance and old counts, both moved with F();
+            # never write them back unless named in update_fields
+            kwargs['update_fields'] = [f.name for f in self._meta.concrete_fields
+                                       if not f.primary_key and f.name not in self.SQL_MAINTAINED]
+        super().save(*args, **kwargs)
+
     def add_credits(self, amount, reason=""):
         """Add credits to user account and create transaction record"""
-        print(f"Adding credits: {amount} for user: {self.username}")  # Debug
+        from . import auth
 
         # Ensure amount is Decimal
         if not isinstance(amount, Decimal):
             amount = Decimal(str(amount))
 
-        print(f"User credits before: {self.digital_credits}")  # Debug
-
+        balance_before = self.digital_credits
+        # Added in SQL, with the ledger entry in the same transaction: a read-modify-write of
+        # this instance would lose a concurrent change to the balance
+        with transaction.atomic(savepoint=False):
+            User.objects.filter(pk=self.pk).update(digital_credits=models.F('digital_credits') + amount)
+            entry = CreditTransaction.objects.create(
+                user=self,
+                amount=amount,
+                transaction_type='credit',
+                reason=reason
+            )
         self.digital_credits += amount
-        self.save()
-
-        # Create transaction record
-        transaction = CreditTransaction.objects.create(
-            user=self,
-            amount=amount,
-            transaction_type='credit',
-            reason=reason
-        )
+        auth.forget_on_commit([self.pk])
 
-        print(f"User credits after: {self.digital_credits}")  # Debug
-        print(f"Transaction created: {transaction}")  # Debug
+        if logger.isEnabledFor(logging.DEBUG):
+            logger.debug(
+                "credits added user=%s amount=%s before=%s after=%s transaction=%s",
+                self.pk, amount, balance_before, self.digital_credits, entry.pk,
+            )
 
         return True
 
     def deduct_credits(self, amount, reason=""):
         """Deduct credits from user account if sufficient balance"""
-        if self.digital_credits >= amount:
-            self.digital_credits -= amount
-            self.save()
+        from . import auth
+
+        with transaction.atomic(savepoint=False):
+            # The balance check and the deduction are one statement, so two deductions cannot overdraw
+            if not User.objects.filter(pk=self.pk, digital_credits__gte=amount).update(
+                    digital_credits=models.F('digital_credits') - amount):
+                return False
             CreditTransaction.objects.create(
                 user=self,
                 amount=amount,
                 transaction_type='debit',
                 reason=reason
             )
-            return True
-        return False
+        self.digital_credits -= amount
+        auth.forget_on_commit([self.pk])
+        return True
 
     def get_credit_balance(self):
         """Get current credit balance"""
@@ -88,6 +137,14 @@ class User(AbstractUser):
         return self.credit_transactions.all()
 
 
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def forget_cached_user(sender, instance, **kwargs):
+    from .auth import forget_on_commit
+
+    forget_on_commit([instance.pk])
+
+
 class CreditTransaction(models.Model):
     TRANSACTION_TYPES = (
         ('credit', 'Credit'),
@@ -102,10 +159,25 @@ class CreditTransaction(models.Model):
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['created_at'], name='credittx_created_idx'),
+            models.Index(fields=['user', 'created_at'], name='credittx_user_created_idx'),
+            models.Index(fields=['transaction_type'], name='credittx_type_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.transaction_type}: {self.amount} - {self.reason}"
 
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        with transaction.atomic(savepoint=False):
+            super().save(*args, **kwargs)
+            if adding:
+                counters.bump({(self.user_id, 'transaction_count'): 1})
+        if adding:
+            metrics.CREDIT_TRANSACTIONS.inc(type=self.transaction_type)
+            metrics.CREDIT_AMOUNT.inc(self.amount, type=self.transaction_type)
+
 
 class WasteCategory(models.Model):
     name = models.CharField(max_length=100)
@@ -115,6 +187,24 @@ class WasteCategory(models.Model):
         return self.name
 
 
+@receiver(post_delete, sender=CreditTransaction)
+def uncount_transaction(sender, instance, **kwargs):
+    counters.bump({(instance.user_id, 'transaction_count'): -1})
+
+
+@receiver(post_save, sender=WasteCategory)
+@receiver(post_delete, sender=WasteCategory)
+def invalidate_refdata(sender, **kwargs):
+    refdata.invalidate()
+    # And again once committed: a process that reloaded in between read the old rows
+    transaction.on_commit(refdata.invalidate)
+
+
+def waste_image_path(instance, filename):
+    """A new name for every upload: a media URL's bytes never change, so clients may cache them for good"""
+    return f"waste_images/{uuid.uuid4().hex}{os.path.splitext(filename)[1].lower()}"
+
+
 class WasteItem(models.Model):
     WASTE_TYPES = (
         ('plastic', 'Plastic'),
@@ -128,6 +218,18 @@ class WasteItem(models.Model):
         ('other', 'Other'),
     )
 
+    # Offered by the listing form; the column itself stays free text
+    UNIT_CHOICES = (
+        ('kg', 'Kilograms (kg)'),
+        ('g', 'Grams (g)'),
+        ('lbs', 'Pounds (lbs)'),
+        ('pieces', 'Pieces'),
+        ('bags', 'Bags'),
+        ('bottles', 'Bottles'),
+        ('boxes', 'Boxes'),
+        ('liters', 'Liters (L)'),
+    )
+
     STATUS_CHOICES = (
         ('available', 'Available'),
         ('pending', 'Pending Pickup'),
@@ -135,6 +237,23 @@ class WasteItem(models.Model):
         ('recycled', 'Recycled'),
     )
 
+    # Credits per unit of quantity for each waste type
+    CREDIT_RATES = {
+        'plastic': 2.0,
+        'paper': 1.5,
+        'metal': 3.0,
+        'glass': 1.0,
+        'organic': 0.5,
+        'agricultural': 0.3,
+        'e-waste': 5.0,
+        'textile': 1.0,
+        'other': 1.0,
+    }
+
+    # Fields that decide an item's contribution to the ImpactRollup table
+    ROLLUP_FIELDS = ('created_at', 'location', 'place', 'waste_type', 'category_id', 'status', 'unit', 'quantity',
+                     'estimated_credits', 'credits_earned')
+
     poster = models.ForeignKey(User, on_delete=models.CASCADE, related_name='waste_items')
     title = models.CharField(max_length=200)
     description = models.TextField()
@@ -143,30 +262,48 @@ class WasteItem(models.Model):
     quantity = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(0)])
     unit = models.CharField(max_length=20, default='kg')
     location = models.CharField(max_length=200)
-    image = models.ImageField(upload_to='waste_images/', blank=True, null=True)
+    # Canonical place of `location` (core/places.py), kept in step by save()
+    place = models.CharField(max_length=64, blank=True, default='', db_index=True, editable=False)
+    image = models.ImageField(upload_to=waste_image_path, blank=True, null=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='available')
     credits_earned = models.DecimalField(max_digits=8, decimal_places=2, default=0, validators=[MinValueValidator(0)])
     estimated_credits = models.DecimalField(max_digits=8, decimal_places=2, default=0, validators=[MinValueValidator(0)])
+    # When credits_earned was awarded: the month the earners leaderboard counts them in
+    credited_at = models.DateTimeField(null=True, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['created_at'], name='wasteitem_created_idx'),
+            models.Index(fields=['status', 'created_at'], name='wasteitem_status_created_idx'),
+            # Delta sync reads available listings in (updated_at, id) order
+            models.Index(fields=['status', 'updated_at', 'id'], name='wasteitem_status_updated_idx'),
+        ]
+
     def __str__(self):
         return f"{self.title} - {self.poster.username}"
 
+    def get_waste_type_display(self):
+        return refdata.get().waste_type_labels.get(self.waste_type, self.waste_type)
+
+    def get_unit_display(self):
+        return refdata.get().unit_labels.get(self.unit, self.unit)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored rollup contribution so save() can move it
+        if all(name in field_names for name in cls.ROLLUP_FIELDS):
+            instance._rollup_snapshot = analytics.snapshot(instance)
+        # And the stored status, for the event feed
+        if 'status' in field_names:
+            instance._loaded_status = values[field_names.index('status')]
+        return instance
+
     def calculate_estimated_credits(self):
         """Calculate estimated credits based on waste type and quantity"""
-        credit_rates = {
-            'plastic': 2.0,
-            'paper': 1.5,
-            'metal': 3.0,
-            'glass': 1.0,
-            'organic': 0.5,
-            'agricultural': 0.3,
-            'e-waste': 5.0,
-            'textile': 1.0,
-            'other': 1.0,
-        }
-        rate = credit_rates.get(self.waste_type, 1.0)
+        rate = self.CREDIT_RATES.get(self.waste_type, 1.0)
 
         rate_decimal = Decimal(str(rate))
         self.estimated_credits = self.quantity * rate_decimal
@@ -174,8 +311,6 @@ class WasteItem(models.Model):
 
     def award_credits(self):
         """Award credits to the poster when waste is collected"""
-        print(f"Awarding credits for: {self.title}, Status: {self.status}, Credits earned: {self.credits_earned}")  # Debug
-
         if self.status == 'collected' and self.credits_earned == 0:
             # Use the estimated credits or calculate fresh
             if self.estimated_credits > 0:
@@ -183,21 +318,26 @@ class WasteItem(models.Model):
             else:
                 credit_amount = self.calculate_estimated_credits()
 
-            print(f"Credit amount to award: {credit_amount}")  # Debug
-
             self.credits_earned = credit_amount
-
-            # Add credits to user account
-            success = self.poster.add_credits(
-                credit_amount,
-                reason=f"Credits earned for waste collection: {self.title}"
-            )
-
-            print(f"Add credits success: {success}")  # Debug
-            self.save()
+            self.credited_at = timezone.now()
+
+            with transaction.atomic(savepoint=False):
+                # Add credits to user account
+                success = self.poster.add_credits(
+                    credit_amount,
+                    reason=f"Credits earned for waste collection: {self.title}"
+                )
+                scores = {(self.poster_id, analytics.place_key(self.place, self.location)): credit_amount}
+                leaderboard.record('earners', scores, self.credited_at)
+                events.awards([(self.pk, self.poster_id, credit_amount)])
+
+                logger.debug("credits awarded item=%s amount=%s success=%s", self.pk, credit_amount, success)
+                self.save()
             return credit_amount
 
-        print("No credits awarded - conditions not met")  # Debug
+        logger.debug(
+            "no credits awarded item=%s status=%s credits_earned=%s", self.pk, self.status, self.credits_earned
+        )
         return 0
 
     def save(self, *args, **kwargs):
@@ -205,11 +345,84 @@ class WasteItem(models.Model):
         if not self.pk or 'quantity' in kwargs.get('update_fields', []) or 'waste_type' in kwargs.get('update_fields', []):
             self.calculate_estimated_credits()
 
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'location' in update_fields:
+            self.place = places.place_id(self.location, listing=True)
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'place'}
+
         # Auto-award credits when status changes to collected
         if self.status == 'collected' and self.credits_earned == 0:
             self.award_credits()
+        elif self.credits_earned and self.credited_at is None:
+            # Credits set directly (sample data, admin edits) count from when they are saved
+            self.credited_at = timezone.now()
+
+        previous_status = getattr(self, '_loaded_status', None)
+        with transaction.atomic(savepoint=False):
+            adding = self._state.adding
+            previous = self._stored_rollup_snapshot()
+            super().save(*args, **kwargs)
+            if adding:
+                counters.bump({(self.poster_id, 'items_posted'): 1})
+            current = analytics.snapshot(self)
+            analytics.apply(analytics.difference(current, previous))
+            for day, place, waste_type, category_id, status in previous:
+                # Leaving the available list (or its place) removes the listing from offline copies
+                if status == 'available' and (self.status != 'available'
+                                              or analytics.place_key(self.place, self.location) != place):
+                    sync.record('listing', [(self.pk, place, None)])
+            if previous_status is not None:
+                events.transitions('listing', [(self.pk, self.poster_id, previous_status, self.status)])
+        self._rollup_snapshot = current
+        self._loaded_status = self.status
+
+    def _stored_rollup_snapshot(self):
+        if self._state.adding:
+            return {}
+        if hasattr(self, '_rollup_snapshot'):
+            return self._rollup_snapshot
+        # Loaded with only()/defer(): read the stored row
+        stored = WasteItem.objects.filter(pk=self.pk).first()
+        return analytics.snapshot(stored) if stored else {}
+
+
+@receiver(pre_delete, sender=WasteItem)
+def remove_from_rollups(sender, instance, **kwargs):
+    # Runs inside the delete's transaction; read the stored row, the instance may be stale
+    analytics.apply(analytics.difference({}, analytics.aggregate(WasteItem.objects.filter(pk=instance.pk))))
+    if instance.status == 'available':
+        sync.record('listing', [(instance.pk, analytics.place_key(instance.place, instance.location), None)])
+    counters.bump({(instance.poster_id, 'items_posted'): -1})
+
+
+class PickupSlot(models.Model):
+    """A time window in which a collector can do pickups; accepted matches are packed into them by core.scheduling"""
+    collector = models.ForeignKey(User, on_delete=models.CASCADE, related_name='pickup_slots')
+    start = models.DateTimeField()
+    end = models.DateTimeField()
+    capacity_kg = models.DecimalField(max_digits=8, decimal_places=2, null=True, blank=True,
+                                      validators=[MinValueValidator(0)],
+                                      help_text="Leave empty to use the collector's vehicle capacity")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['start']
+        indexes = [
+            models.Index(fields=['collector', 'end'], name='pickupslot_collector_end_idx'),
+        ]
+        constraints = [
+            models.CheckConstraint(condition=models.Q(end__gt=models.F('start')), name='pickupslot_ends_after_start'),
+        ]
+
+    def __str__(self):
+        return f"{self.collector_id}: {self.start:%Y-%m-%d %H:%M}-{self.end:%H:%M}"
 
-        super().save(*args, **kwargs)
+
+@receiver(post_save, sender=PickupSlot)
+@receiver(post_delete, sender=PickupSlot)
+def replan_slot_owner(sender, instance, **kwargs):
+    scheduling.replan([instance.collector_id])
 
 
 class Match(models.Model):
@@ -224,14 +437,58 @@ class Match(models.Model):
     collector = models.ForeignKey(User, on_delete=models.CASCADE)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     message = models.TextField(blank=True)
+    # Pickup slot the match is planned into while accepted (core/scheduling.py)
+    slot = models.ForeignKey(PickupSlot, on_delete=models.SET_NULL, null=True, blank=True, related_name='matches')
+    # When the collection was completed: the month the collectors leaderboard counts it in
+    completed_at = models.DateTimeField(null=True, blank=True, editable=False)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         unique_together = ['waste_item', 'collector']
+        indexes = [
+            models.Index(fields=['created_at'], name='match_created_idx'),
+            models.Index(fields=['status', 'created_at'], name='match_status_created_idx'),
+            models.Index(fields=['collector', 'updated_at', 'id'], name='match_collector_updated_idx'),
+        ]
 
     def __str__(self):
         return f"Match: {self.waste_item.title} - {self.collector.username}"
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember the stored status so save() can tell when it changes
+        if 'status' in field_names:
+            instance._loaded_status = values[field_names.index('status')]
+        return instance
+
+    def save(self, *args, **kwargs):
+        previous_status = getattr(self, '_loaded_status', None)
+        completing = self.status == 'completed' and previous_status != 'completed'
+        if completing and self.completed_at is None:
+            self.completed_at = timezone.now()
+        with transaction.atomic(savepoint=False):
+            adding = self._state.adding
+            super().save(*args, **kwargs)
+            pending = (self.status == 'pending') - (previous_status == 'pending')
+            counters.bump({
+                (self.collector_id, 'matches_made'): int(adding),
+                (self.waste_item.poster_id if pending else None, 'pending_matches_received'): pending,
+            })
+            if previous_status is not None:
+                events.transitions('match', [(self.pk, self.collector_id, previous_status, self.status)])
+            if completing:
+                item = self.waste_item
+                leaderboard.record('collectors', {(self.collector_id, analytics.place_key(item.place, item.location)): 1},
+                                   self.completed_at)
+            # Entering or leaving the accepted state changes what the collector has to fit into their slots
+            if self.status != previous_status and 'accepted' in (self.status, previous_status):
+                self.slot_id = scheduling.replan([self.collector_id]).get(self.pk, self.slot_id)
+        if self.status != previous_status:
+            metrics.MATCH_TRANSITIONS.inc(from_status=previous_status or 'new', to_status=self.status)
+            self._loaded_status = self.status
+
     def accept_match(self):
         """Accept the match and update waste item status"""
         if self.status == 'pending':
@@ -245,24 +502,350 @@ class Match(models.Model):
     
     def complete_match(self):
         """Complete the match and award credits"""
-        print(f"DEBUG complete_match: Starting for match {self.id}, status: {self.status}")
-    
         if self.status == 'accepted':
             self.status = 'completed'
             self.waste_item.status = 'collected'
-        
-            print(f"DEBUG: Status changed - match: {self.status}, waste: {self.waste_item.status}")
-        
-        # Award credits to the waste poster
+
+            # Award credits to the waste poster
             credits_awarded = self.waste_item.award_credits()
-        
-            print(f"DEBUG: Credits awarded: {credits_awarded}")
-        
+
             self.waste_item.save()
             self.save()
-        
-            print(f"DEBUG: Match and waste item saved successfully")
+
+            logger.debug("match completed match=%s credits_awarded=%s", self.pk, credits_awarded)
             return True, credits_awarded
-    
-        print(f"DEBUG: Cannot complete - match status is {self.status}")
-        return False, 0
\ No newline at end of file
+
+        logger.debug("match not completed match=%s status=%s", self.pk, self.status)
+        return False, 0
+
+@receiver(pre_delete, sender=Match)
+def remove_from_offline_copies(sender, instance, **kwargs):
+    sync.record('match', [(instance.pk, None, instance.collector_id)])
+    counters.bump({
+        (instance.collector_id, 'matches_made'): -1,
+        (instance.waste_item.poster_id if instance.status == 'pending' else None, 'pending_matches_received'): -1,
+    })
+
+
+@receiver(post_delete, sender=Match)
+def free_pickup_slot(sender, instance, **kwargs):
+    if instance.slot_id is not None:
+        scheduling.replan([instance.collector_id])
+
+
+class AdminJob(models.Model):
+    """A bulk admin action processed in chunks outside the request"""
+
+    KINDS = (
+        ('mark_collected', 'Mark waste items collected'),
+        ('award_credits', 'Award credits for collected items'),
+        ('recompute_estimates', 'Recompute estimated credits'),
+        ('reject_stale_matches', 'Reject stale pending matches'),
+    )
+
+    STATUS_CHOICES = (
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    )
+
+    kind = models.CharField(max_length=30, choices=KINDS)
+    params = models.JSONField(default=dict, blank=True)
+    dry_run = models.BooleanField(default=False)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='queued', db_index=True)
+    total = models.PositiveIntegerField(default=0)
+    processed = models.PositiveIntegerField(default=0)
+    affected = models.PositiveIntegerField(default=0)
+    checkpoint = models.BigIntegerField(default=0, help_text="Highest primary key already processed")
+    log = models.TextField(blank=True)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+
+    def __str__(self):
+        mode = " (dry run)" if self.dry_run else ""
+        return f"{self.get_kind_display()}{mode} #{self.pk}: {self.processed}/{self.total}"
+
+    @property
+    def progress(self):
+        return round(100 * self.processed / self.total, 1) if self.total else 100.0
+
+
+class ImpactRollup(models.Model):
+    """
+    Running totals of waste items per (day, place, waste_type, category, status),
+    kept up to date by WasteItem.save() and the bulk paths in core.analytics.
+    `place` is a place ID, or area text for items without one; `area` is its name.
+    Every total is stored at day grain and again at month grain (day = the 1st)
+    so long-range reports read a few rows per month. Reports read only this
+    table; rebuild it with `manage.py rebuild_rollups`.
+    """
+
+    GRAINS = (
+        ('day', 'Day'),
+        ('month', 'Month'),
+    )
+
+    grain = models.CharField(max_length=5, choices=GRAINS, default='day')
+    day = models.DateField()
+    place = models.CharField(max_length=100, default='')
+    area = models.CharField(max_length=100)
+    waste_type = models.CharField(max_length=20, choices=WasteItem.WASTE_TYPES)
+    category = models.ForeignKey(WasteCategory, on_delete=models.SET_NULL, null=True, blank=True)
+    status = models.CharField(max_length=20, choices=WasteItem.STATUS_CHOICES)
+    items = models.IntegerField(default=0)
+    weight_kg = models.DecimalField(max_digits=14, decimal_places=3, default=0)
+    estimated_credits = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    credits_earned = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['grain', 'day', 'place', 'waste_type', 'category', 'status'],
+                                    name='impactrollup_place_key'),
+            # NULLs never collide in the constraint above
+            models.UniqueConstraint(fields=['grain', 'day', 'place', 'waste_type', 'status'],
+                                    condition=models.Q(category__isnull=True),
+                                    name='impactrollup_uncategorised_place_key'),
+        ]
+        indexes = [
+            models.Index(fields=['place', 'grain', 'day'], name='impactrollup_place_day_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.day} ({self.grain}) {self.area} {self.waste_type} {self.status}: {self.items}"
+
+
+class LeaderboardScore(models.Model):
+    """
+    A user's running score on one leaderboard window: credits earned (earners)
+    or completed collections (collectors) in a month, in one place (a place key,
+    see analytics.place_key) or county-wide (place ''). Maintained by core.leaderboard; rebuild it with
+    `manage.py rebuild_leaderboards`.
+    """
+
+    board = models.CharField(max_length=20, choices=leaderboard.BOARDS)
+    period = models.DateField(help_text="First day of the month")
+    place = models.CharField(max_length=100, blank=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='leaderboard_scores')
+    score = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['board', 'period', 'place', 'user'], name='leaderboard_key'),
+        ]
+        indexes = [
+            # Top K and rank counts are both walks of one window in score order
+            models.Index(fields=['board', 'period', 'place', '-score', 'user'], name='leaderboard_rank_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.board} {self.period:%Y-%m} {self.place or 'all places'}: {self.user_id} {self.score}"
+
+
+class Tombstone(models.Model):
+    """A listing or match that left an offline client's copy (see core/sync.py)"""
+    KINDS = (
+        ('listing', 'Listing'),
+        ('match', 'Match'),
+    )
+
+    kind = models.CharField(max_length=10, choices=KINDS)
+    object_id = models.BigIntegerField()
+    area = models.CharField(max_length=100, blank=True, help_text="Place key of a removed listing")
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, db_index=False,
+                             related_name='+', help_text="Collector of a removed match")
+    removed_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['kind', 'area', 'id'], name='tombstone_area_idx'),
+            models.Index(fields=['user', 'id'], name='tombstone_user_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.kind} {self.object_id} removed {self.removed_at:%Y-%m-%d %H:%M}"
+
+
+class OfflineAction(models.Model):
+    """The outcome of an action replayed by an offline client, kept under its idempotency key"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name='offline_actions')
+    key = models.CharField(max_length=64)
+    kind = models.CharField(max_length=20)
+    status_code = models.PositiveSmallIntegerField(default=0)
+    response = models.JSONField(default=dict, encoder=DjangoJSONEncoder)
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='offline_action_key'),
+        ]
+
+    def __str__(self):
+        return f"{self.user} {self.kind} {self.key}"
+
+
+class ListingFingerprint(models.Model):
+    """Image hash and text signature of a listing, for near-duplicate detection (see core/dedup.py)"""
+    item = models.OneToOneField(WasteItem, on_delete=models.CASCADE, primary_key=True, related_name='fingerprint')
+    poster = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False, related_name='+')
+    image_hash = models.CharField(max_length=16, blank=True, help_text="dHash of the image in hex")
+    minhash = models.JSONField(default=list, help_text="MinHash signature of the title and description")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Fingerprint of {self.item_id}"
+
+
+class DedupBucket(models.Model):
+    """One band of a listing's fingerprint; listings sharing a key are duplicate candidates"""
+    item = models.ForeignKey(WasteItem, on_delete=models.CASCADE, db_index=False, related_name='+')
+    key = models.CharField(max_length=24)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['key', 'item'], name='dedupbucket_key_idx'),
+            models.Index(fields=['item'], name='dedupbucket_item_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.key}: {self.item_id}"
+
+
+class DuplicateCandidate(models.Model):
+    """A listing that looks like a repost of an earlier one, waiting for review"""
+    STATUS_CHOICES = (
+        ('pending', 'Pending review'),
+        ('confirmed', 'Confirmed duplicate'),
+        ('dismissed', 'Not a duplicate'),
+    )
+
+    item = models.ForeignKey(WasteItem, on_delete=models.CASCADE, related_name='duplicate_candidates')
+    duplicate_of = models.ForeignKey(WasteItem, on_delete=models.CASCADE, related_name='+')
+    image_distance = models.PositiveSmallIntegerField(null=True, blank=True,
+                                                      help_text="Bits by which the image hashes differ")
+    text_similarity = models.FloatField(default=0, help_text="Estimated Jaccard similarity of the text")
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    reviewed_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+    reviewed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['item', 'duplicate_of'], name='duplicate_candidate_pair'),
+        ]
+        indexes = [
+            models.Index(fields=['status', 'created_at'], name='duplicate_status_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.item_id} duplicates {self.duplicate_of_id}? ({self.status})"
+
+
+class ArchivedWasteItem(models.Model):
+    """A collected or recycled listing moved out of WasteItem by core.archive, under its original id"""
+    id = models.BigIntegerField(primary_key=True)
+    poster = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False, related_name='archived_waste_items')
+    title = models.CharField(max_length=200)
+    description = models.TextField()
+    waste_type = models.CharField(max_length=20, choices=WasteItem.WASTE_TYPES)
+    category = models.ForeignKey(WasteCategory, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    quantity = models.DecimalField(max_digits=10, decimal_places=2)
+    unit = models.CharField(max_length=20)
+    location = models.CharField(max_length=200)
+    place = models.CharField(max_length=64, blank=True, default='')
+    image = models.ImageField(max_length=100, blank=True, null=True)
+    status = models.CharField(max_length=20, choices=WasteItem.STATUS_CHOICES)
+    credits_earned = models.DecimalField(max_digits=8, decimal_places=2, default=0)
+    estimated_credits = models.DecimalField(max_digits=8, decimal_places=2, default=0)
+    credited_at = models.DateTimeField(null=True, blank=True)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['poster', 'id'], name='archived_item_poster_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.title} - {self.poster.username} (archived)"
+
+    get_waste_type_display = WasteItem.get_waste_type_display
+    get_unit_display = WasteItem.get_unit_display
+
+
+class ArchivedMatch(models.Model):
+    """
+    A rejected or completed match moved out of Match by core.archive, under
+    its original id, with what history views show of its listing (which may
+    still be live or archived itself).
+    """
+    id = models.BigIntegerField(primary_key=True)
+    waste_item_ref = models.BigIntegerField(db_index=True, help_text="ID of the listing, live or archived")
+    waste_item_title = models.CharField(max_length=200)
+    location = models.CharField(max_length=200)
+    poster = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, db_index=False,
+                               related_name='+')
+    collector = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False, related_name='archived_matches')
+    status = models.CharField(max_length=20, choices=Match.STATUS_CHOICES)
+    message = models.TextField(blank=True)
+    pickup_start = models.DateTimeField(null=True, blank=True)
+    pickup_end = models.DateTimeField(null=True, blank=True)
+    collected_at = models.DateTimeField(null=True, blank=True, help_text="When the match was completed")
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['collector', 'id'], name='archived_match_collector_idx'),
+            models.Index(fields=['poster', 'id'], name='archived_match_poster_idx'),
+        ]
+
+    def __str__(self):
+        return f"Match: {self.waste_item_title} - {self.collector_id} (archived)"
+
+
+class StatusEvent(models.Model):
+    """A listing or match status change, or a credit award, in the change feed (see core/events.py)"""
+    KINDS = (
+        ('listing', 'Listing'),
+        ('match', 'Match'),
+        ('award', 'Credit award'),
+    )
+
+    # The id is the event's sequence number
+    id = models.BigAutoField(primary_key=True)
+    kind = models.CharField(max_length=10, choices=KINDS)
+    object_id = models.BigIntegerField(help_text="The listing (of an award too) or match")
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, db_index=False,
+                             related_name='+', help_text="Poster of a listing or award, collector of a match")
+    from_status = models.CharField(max_length=20, blank=True)
+    to_status = models.CharField(max_length=20, blank=True)
+    amount = models.DecimalField(max_digits=8, decimal_places=2, null=True, blank=True, help_text="Credits awarded")
+    created_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['kind', 'object_id', 'id'], name='statusevent_object_idx'),
+        ]
+
+    def __str__(self):
+        if self.kind == 'award':
+            return f"#{self.pk} award {self.amount} for listing {self.object_id}"
+        return f"#{self.pk} {self.kind} {self.object_id}: {self.from_status} -> {self.to_status}"
+
+
+class EventCursor(models.Model):
+    """How far a consumer of the status events has read"""
+    name = models.CharField(max_length=50, unique=True)
+    position = models.BigIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} at #{self.position}"
@@ -0,0 +1,46 @@
+"""
+Helpers for spreading database work over a process pool.
+
+Work is split into contiguous ID ranges; each range is handled by one call of a
+module-level function in a worker process with its own database connection.
+"""
+
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.db import connections
+
+
+def id_ranges(start, stop, chunk_size):
+    """Split [start, stop) into (lo, hi) ranges of at most `chunk_size` IDs"""
+    return [(lo, min(lo + chunk_size, stop)) for lo in range(start, stop, chunk_size)]
+
+
+def _init_worker(sqlite_timeout):
+    django.setup()
+    for connection in connections.all():
+        if connection.vendor == 'sqlite':
+            # Workers queue up behind SQLite's single writer instead of failing
+            connection.settings_dict.setdefault('OPTIONS', {})['timeout'] = sqlite_timeout
+
+
+def run_chunks(func, chunks, workers=1, sqlite_timeout=120):
+    """
+    Call `func(*chunk)` for every chunk, in a pool of `workers` processes when
+    workers > 1, and yield the results in submission order.
+    """
+    if workers <= 1:
+        for chunk in chunks:
+            yield func(*chunk)
+        return
+
+    # Open connections must not be inherited by forked workers
+    connections.close_all()
+    context = multiprocessing.get_context('fork' if 'fork' in multiprocessing.get_all_start_methods() else 'spawn')
+    with ProcessPoolExecutor(
+        max_workers=workers, mp_context=context, initializer=_init_worker, initargs=(sqlite_timeout,),
+    ) as pool:
+        futures = [pool.submit(func, *chunk) for chunk in chunks]
+        for future in futures:
+            yield future.result()
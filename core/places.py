@@ -0,0 +1,277 @@
+"""
+Place index for location autocomplete and canonical place IDs.
+
+The index holds the Machakos County sub-counties, wards, sub-locations and
+landmarks in GAZETTEER plus every area that listings already use (from the
+rollup table, weighted by listing count). Every word-suffix of every name
+("athi river", "river") goes into one sorted array, so a prefix lookup is
+two bisects; when that finds too little, the one-edit variants of the query
+are looked up the same way, which is what makes "machakso" or "mavko" work.
+
+`index()` builds it on first use and rebuilds it when a location nobody has
+seen before is saved (`place_id()` bumps a version in the default cache),
+at most every PLACES_RELOAD_SECONDS.
+
+`place_id(location)` is stored in the `place` column of listings and users: 'ward:mua',
+'subcounty:machakos-town', or 'area:<slug>' for places outside the
+gazetteer, taken from the text before the first comma.
+"""
+
+import threading
+import time
+import unicodedata
+from bisect import bisect_left
+from dataclasses import dataclass
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.text import slugify
+
+VERSION_KEY = 'core.places.version'
+
+# Sub-counties and their wards, then sub-locations and landmarks: (kind, name, sub-county)
+SUBCOUNTY_WARDS = {
+    'Machakos Town': ('Kalama', 'Mua', 'Mutitini', 'Machakos Central', 'Mumbuni North', 'Muvuti/Kiima-Kimwe',
+                      'Kola'),
+    'Mavoko': ('Athi River', 'Kinanie', 'Muthwani', 'Syokimau/Mulolongo'),
+    'Masinga': ('Kivaa', 'Masinga Central', 'Ekalakala', 'Muthesya', 'Ndithini'),
+    'Yatta': ('Ndalani', 'Matuu', 'Kithimani', 'Ikombe', 'Katangi'),
+    'Kangundo': ('Kangundo North', 'Kangundo Central', 'Kangundo East', 'Kangundo West'),
+    'Matungulu': ('Tala', 'Matungulu North', 'Matungulu East', 'Matungulu West', 'Kyeleni'),
+    'Kathiani': ('Mitaboni', 'Kathiani Central', 'Upper Kaewa/Iveti', 'Lower Kaewa/Kaani'),
+    'Mwala': ('Mbiuni', 'Makutano/Mwala', 'Masii', 'Muthetheni', 'Wamunyu', 'Kibauni'),
+}
+GAZETTEER = (
+    *(('subcounty', name, name) for name in SUBCOUNTY_WARDS),
+    *(('ward', ward, name) for name, wards in SUBCOUNTY_WARDS.items() for ward in wards),
+    ('sublocation', 'Kyumbi', 'Machakos Town'),
+    ('sublocation', 'Katoloni', 'Machakos Town'),
+    ('sublocation', 'Kimutwa', 'Kathiani'),
+    ('sublocation', 'Mlolongo', 'Mavoko'),
+    ('sublocation', 'Syokimau', 'Mavoko'),
+    ('sublocation', 'Katani', 'Mavoko'),
+    ('sublocation', 'Lukenya', 'Mavoko'),
+    ('sublocation', 'Kangundo Town', 'Kangundo'),
+    ('sublocation', 'Matuu Town', 'Yatta'),
+    ('sublocation', 'Kathiani Town', 'Kathiani'),
+    ('landmark', "Machakos People's Park", 'Machakos Town'),
+    ('landmark', 'Machakos Level 5 Hospital', 'Machakos Town'),
+    ('landmark', 'Machakos University', 'Machakos Town'),
+    ('landmark', 'Kenyatta Stadium', 'Machakos Town'),
+    ('landmark', 'Machakos Bus Park', 'Machakos Town'),
+    ('landmark', 'Maruba Dam', 'Machakos Town'),
+    ('landmark', 'Konza Technopolis', 'Mavoko'),
+    ('landmark', 'Daystar University', 'Mavoko'),
+    ('landmark', 'Athi River EPZ', 'Mavoko'),
+    ('landmark', 'Masinga Dam', 'Masinga'),
+    ('landmark', 'Tala Market', 'Matungulu'),
+)
+KIND_ORDER = {'subcounty': 0, 'ward': 1, 'sublocation': 2, 'landmark': 3, 'area': 4}
+
+
+def normalise(text):
+    """'Syokimau/Mulolongo ' -> 'syokimau mulolongo': lower case, ASCII letters and digits, single spaces"""
+    text = unicodedata.normalize('NFKD', text or '').encode('ascii', 'ignore').decode().lower()
+    return ' '.join(''.join(c if c.isalnum() else ' ' for c in text).split())
+
+
+def slug(name):
+    return slugify(normalise(name))
+
+
+def first_part(location):
+    return (location or '').split(',')[0]
+
+
+GAZETTEER_NAMES = {f'{kind}:{slug(name)}': name for kind, name, _ in GAZETTEER}
+
+
+def name(place_id):
+    """Display name of a place ID: the gazetteer's spelling, else one made from its slug; None if not an ID"""
+    kind, colon, rest = place_id.partition(':')
+    if not colon or kind not in KIND_ORDER:
+        return None
+    return GAZETTEER_NAMES.get(place_id) or rest.replace('-', ' ').title()[:100]
+
+
+@dataclass(frozen=True)
+class Place:
+    id: str
+    name: str
+    kind: str
+    subcounty: str
+    listings: int = 0
+
+
+class PlaceIndex:
+    def __init__(self, places):
+        self.places = tuple(places)
+        entries = sorted(
+            (' '.join(words[start:]), start, i)
+            for i, place in enumerate(self.places)
+            for words in [normalise(place.name).split()]
+            for start in range(len(words))
+        )
+        self.keys = [key for key, _, _ in entries]
+        self.targets = [(i, start) for _, start, i in entries]
+        self.by_name = {}
+        for i, place in enumerate(self.places):
+            self.by_name.setdefault(normalise(place.name), i)
+        self.by_id = {place.id: place for place in self.places}
+
+    def _prefixed(self, prefix):
+        lo = bisect_left(self.keys, prefix)
+        hi = bisect_left(self.keys, prefix + '\x7f', lo)
+        return self.targets[lo:hi]
+
+    def _next_chars(self, head):
+        """The characters that follow `head` in some key, by skipping from one to the next"""
+        keys, lo, size = self.keys, bisect_left(self.keys, head), len(head)
+        while lo < len(keys) and keys[lo].startswith(head):
+            if len(keys[lo]) == size:
+                lo += 1
+                continue
+            c = keys[lo][size]
+            yield c
+            lo = bisect_left(keys, head + chr(ord(c) + 1), lo)
+
+    def _variants(self, query):
+        """Strings one edit (delete, swap, replace, insert) away from `query` that can still prefix a key"""
+        variants = {query[:i] + query[i + 1:] for i in range(len(query))}
+        variants |= {query[:i] + query[i + 1] + query[i] + query[i + 2:] for i in range(len(query) - 1)}
+        for i in range(len(query) + 1):
+            head = query[:i]
+            for c in self._next_chars(head):
+                variants.add(head + c + query[i:])
+                if i < len(query):
+                    variants.add(head + c + query[i + 1:])
+        variants.discard(query)
+        return variants
+
+    def search(self, query, limit=10):
+        """Places whose name (or a later word of it) starts with `query`, allowing one typo, best first"""
+        query = normalise(query)
+        if not query:
+            return []
+        found = {}
+        for i, start in self._prefixed(query):
+            found[i] = min(found.get(i, (9, 9)), (0, start > 0))
+        if len(found) < limit and len(query) >= 3:
+            for variant in self._variants(query):
+                for i, start in self._prefixed(variant):
+                    if i not in found:
+                        found[i] = (1, start > 0)
+        ranked = sorted(found, key=lambda i: (*found[i], KIND_ORDER[self.places[i].kind],
+                                              -self.places[i].listings, self.places[i].name))
+        return [self.places[i] for i in ranked[:limit]]
+
+    def resolve(self, location):
+        """The place a location names: its whole text, else the part before the first comma, exactly or with one typo"""
+        for text in (location, first_part(location)):
+            i = self.by_name.get(normalise(text))
+            if i is not None:
+                return self.places[i]
+        name = normalise(first_part(location))
+        if len(name) >= 4:
+            close = [place for place in self.search(name, limit=2) if normalise(place.name) in self._variants(name)]
+            if len(close) == 1:
+                return close[0]
+        return None
+
+
+_lock = threading.Lock()
+_current = None  # (PlaceIndex, version, monotonic time built)
+
+
+def load():
+    """Build the index: the gazetteer plus the areas listings use, weighted by listing count"""
+    from django.db.models import Sum
+
+    from .models import ImpactRollup
+
+    areas = dict(ImpactRollup.objects.order_by().values_list('area').annotate(items=Sum('items')))
+    counts = {}
+    for area, items in areas.items():
+        counts[normalise(area)] = counts.get(normalise(area), 0) + (items or 0)
+    places = [Place(f'{kind}:{slug(name)}', name, kind, subcounty, counts.pop(normalise(name), 0))
+              for kind, name, subcounty in GAZETTEER]
+    known = {normalise(place.name) for place in places}
+    for area in sorted(areas):
+        key = normalise(area)
+        if key and key not in known and area != 'Unknown':
+            known.add(key)
+            places.append(Place(f'area:{slug(area)}', area, 'area', '', counts.get(key, 0)))
+    return PlaceIndex(places)
+
+
+def index():
+    """The current index, built on first use and rebuilt (at most every PLACES_RELOAD_SECONDS) after a change"""
+    global _current
+    version = cache.get(VERSION_KEY, 0)
+    current = _current
+    if current is not None and (
+        current[1] == version
+        or time.monotonic() - current[2] < getattr(settings, 'PLACES_RELOAD_SECONDS', 30)
+    ):
+        return current[0]
+    with _lock:
+        if _current is None or _current is current:
+            _current = (load(), version, time.monotonic())
+        return _current[0]
+
+
+def invalidate():
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, time.time_ns(), None)
+
+
+def canonical(location):
+    """`location` with its first part spelt the way the index spells it: 'machakos twn, stage' -> 'Machakos Town, stage'"""
+    head, comma, rest = (location or '').partition(',')
+    place = index().resolve(head)
+    return place.name + comma + rest if place else location
+
+
+def place_id(location, listing=False):
+    """
+    Canonical place ID of a free-text location ('' if it is empty). For a
+    `listing` somewhere the index has not seen, the index is rebuilt soon.
+    """
+    name = ' '.join(first_part(location).split())
+    if not name:
+        return ''
+    place = index().resolve(location)
+    if place is not None:
+        return place.id
+    if listing:
+        invalidate()
+    return f'area:{slug(name)}'[:64]
+
+
+def backfill(chunk_size=5000):
+    """Fill in `place` on listings and users saved before it existed; returns the number of rows updated"""
+    from django.db import transaction
+
+    from .models import User, WasteItem
+
+    resolved = {}
+    updated = 0
+    for model in (WasteItem, User):
+        pending = model.objects.filter(place='').exclude(location='')
+        last = 0
+        while True:
+            rows = list(pending.filter(pk__gt=last).order_by('pk').values_list('pk', 'location')[:chunk_size])
+            if not rows:
+                break
+            last = rows[-1][0]
+            groups = {}
+            for pk, location in rows:
+                if location not in resolved:
+                    resolved[location] = place_id(location)
+                groups.setdefault(resolved[location], []).append(pk)
+            with transaction.atomic():
+                for place, pks in groups.items():
+                    updated += model.objects.filter(pk__in=pks).update(place=place)
+    return updated
@@ -0,0 +1,218 @@
+"""
+Query-budget harness.
+
+Seeds N listings, matches and ledger rows, then calls every URL in
+`core/urls.py` as each kind of user and counts the SQL queries each request
+runs. A view that stays within budget runs the same number of queries whatever
+N is; the counts are compared against the checked-in baseline in
+`query_budget_baseline.json`. Used by the test suite and by
+`manage.py query_budget`.
+
+Every named URL in `core.urls.urlpatterns` needs at least one entry in CASES
+or a reason in EXEMPT; `uncovered()` lists the ones that have neither.
+"""
+
+import hashlib
+import itertools
+import json
+from decimal import Decimal
+from pathlib import Path
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from . import places, refdata
+from .auth import CachedModelBackend
+from .models import CreditTransaction, Match, User, WasteCategory, WasteItem
+
+BASELINE_PATH = Path(__file__).resolve().parent / 'query_budget_baseline.json'
+
+USER_KINDS = ('anonymous', 'household', 'collector', 'admin')
+
+LOCATION = 'Machakos Town'
+
+
+class Rollback(Exception):
+    pass
+
+
+def seed(n):
+    """Create the fixed cast of users plus N rows of each kind of data they can see"""
+    category = WasteCategory.objects.create(name='Plastic', description='Plastic bottles')
+    users = {
+        'household': User.objects.create_user('qb_household', password='pass12345', user_type='household',
+                                              location=LOCATION),
+        'collector': User.objects.create_user('qb_collector', password='pass12345', user_type='collector',
+                                              location=LOCATION),
+        'admin': User.objects.create_superuser('qb_admin', 'admin@example.com', 'pass12345'),
+    }
+    poster, collector = users['household'], users['collector']
+
+    def item(title, status='available', owner=poster):
+        return WasteItem.objects.create(
+            poster=owner, title=title, description='Sorted and bagged', waste_type='plastic',
+            category=category, quantity=Decimal('10'), unit='kg', location=LOCATION, status=status,
+        )
+
+    for i in range(n):
+        other = User.objects.create_user(f'qb_collector_{i}', password='pass12345', user_type='collector')
+        Match.objects.create(waste_item=item(f'Listing {i}'), collector=other, status='pending')
+        Match.objects.create(waste_item=item(f'Accepted {i}', status='pending'), collector=collector,
+                             status='accepted')
+        poster.add_credits(Decimal('5'), reason=f'Seed credit {i}')
+    CreditTransaction.objects.create(user=collector, amount=Decimal('1'), transaction_type='credit', reason='Seed')
+
+    targets = {
+        'request_item': item('Request target'),
+        'accept_match': Match.objects.create(waste_item=item('Accept target'), collector=collector),
+        'reject_match': Match.objects.create(waste_item=item('Reject target'), collector=collector),
+        'complete_match': Match.objects.create(waste_item=item('Complete target', status='pending'),
+                                               collector=collector, status='accepted'),
+        'detail_item': item('Detail target'),
+        'api_accept_match': Match.objects.create(waste_item=item('API accept target'), collector=collector),
+    }
+    # Reference data and the place index are loaded once per process, not per request
+    refdata.get()
+    places.index()
+    return users, targets
+
+
+_posted = itertools.count()
+
+
+def post_waste_data():
+    # A new lot each time: the same text from the same poster would be flagged as a repost
+    lot = hashlib.md5(str(next(_posted)).encode()).hexdigest()
+    return {
+        'title': 'Budget bottles', 'description': f'Lot {lot}', 'quantity': '3', 'unit': 'kg',
+        'location': LOCATION, 'waste_type': 'plastic',
+    }
+
+
+def session_data():
+    return json.dumps({'username': 'qb_household', 'password': 'pass12345'})
+
+
+def import_data():
+    rows = ''.join(f'Imported {next(_posted)},Bagged bottles,4,{LOCATION},plastic\n' for _ in range(3))
+    csv = 'title,description,quantity,location,waste_type\n' + rows
+    return {'file': SimpleUploadedFile('listings.csv', csv.encode(), content_type='text/csv')}
+
+
+# (url name, HTTP method, kwargs built from the seeded targets, POST data);
+# data given as a string is sent as a JSON body
+CASES = (
+    ('home', 'get', lambda t: {}, None),
+    ('register', 'get', lambda t: {}, None),
+    ('login', 'get', lambda t: {}, None),
+    ('dashboard', 'get', lambda t: {}, None),
+    ('post_waste', 'get', lambda t: {}, None),
+    ('post_waste', 'post', lambda t: {}, post_waste_data),
+    ('import_waste', 'get', lambda t: {}, None),
+    ('waste_list', 'get', lambda t: {}, None),
+    ('waste_detail', 'get', lambda t: {'pk': t['detail_item'].pk}, None),
+    ('user_credits', 'get', lambda t: {}, None),
+    ('pickup_schedule', 'get', lambda t: {}, None),
+    ('request_match', 'get', lambda t: {'waste_item_id': t['request_item'].pk}, None),
+    ('manage_match', 'get', lambda t: {'pk': t['accept_match'].pk, 'action': 'accept'}, None),
+    ('manage_match', 'get', lambda t: {'pk': t['reject_match'].pk, 'action': 'reject'}, None),
+    ('manage_match', 'get', lambda t: {'pk': t['complete_match'].pk, 'action': 'complete'}, None),
+    ('complete_waste', 'get', lambda t: {'pk': t['complete_match'].pk}, None),
+    ('test_award', 'get', lambda t: {'waste_id': t['detail_item'].pk}, None),
+    ('metrics', 'get', lambda t: {}, None),
+    ('impact_report', 'get', lambda t: {}, None),
+    ('leaderboard', 'get', lambda t: {}, None),
+    ('api_session', 'post', lambda t: {}, session_data),
+    ('api_waste_items', 'get', lambda t: {}, None),
+    ('api_waste_item', 'get', lambda t: {'pk': t['detail_item'].pk}, None),
+    ('api_import_waste_items', 'post', lambda t: {}, import_data),
+    ('api_matches', 'get', lambda t: {}, None),
+    ('api_match_action', 'post', lambda t: {'pk': t['api_accept_match'].pk, 'action': 'accept'}, None),
+    ('api_credits', 'get', lambda t: {}, None),
+    ('api_dashboard', 'get', lambda t: {}, None),
+    ('api_sync', 'get', lambda t: {}, None),
+    ('api_places', 'get', lambda t: {}, None),
+    ('logout', 'post', lambda t: {}, None),
+)
+
+# URL names deliberately left out of CASES, with the reason
+EXEMPT = {}
+
+
+def uncovered():
+    """Named URLs in core/urls.py with neither a case nor an exemption"""
+    from .urls import urlpatterns
+
+    covered = {url_name for url_name, *_ in CASES} | set(EXEMPT)
+    return sorted({pattern.name for pattern in urlpatterns if pattern.name} - covered)
+
+
+def case_key(url_name, method, kwargs, user_kind):
+    action = kwargs.get('action')
+    name = f'{url_name}[{action}]' if action else url_name
+    return f'{name} {method.upper()} {user_kind}'
+
+
+def measure(n):
+    """Query count of every case at size N, rolled back afterwards"""
+    counts = {}
+    try:
+        # Every request comes from one address in quick succession: rate limits would answer some of them
+        with override_settings(ADMISSION_CONTROL_ENABLED=False), transaction.atomic():
+            users, targets = seed(n)
+            for user_kind in USER_KINDS:
+                for url_name, method, make_kwargs, make_data in CASES:
+                    kwargs = make_kwargs(targets)
+                    client = Client()
+                    if user_kind != 'anonymous':
+                        client.force_login(users[user_kind])
+                        # Steady state: after a session's first request its user comes from the cache
+                        CachedModelBackend().get_user(users[user_kind].pk)
+                    url = reverse(url_name, kwargs=kwargs)
+                    data = make_data() if make_data else None
+                    options = {'content_type': 'application/json'} if isinstance(data, str) else {}
+                    with CaptureQueriesContext(connection) as queries:
+                        getattr(client, method)(url, data, **options)
+                    counts[case_key(url_name, method, kwargs, user_kind)] = len(queries.captured_queries)
+            raise Rollback
+    except Rollback:
+        pass
+    return counts
+
+
+def run(sizes):
+    """{case: {size: query count}} for each size"""
+    report = {}
+    for n in sizes:
+        for key, count in measure(n).items():
+            report.setdefault(key, {})[n] = count
+    return report
+
+
+def load_baseline():
+    with open(BASELINE_PATH) as fh:
+        return json.load(fh)
+
+
+def write_baseline(report):
+    baseline = {key: max(per_size.values()) for key, per_size in sorted(report.items())}
+    with open(BASELINE_PATH, 'w') as fh:
+        json.dump(baseline, fh, indent=2, sort_keys=True)
+        fh.write('\n')
+
+
+def problems(report, baseline):
+    """Cases whose query count grows with N or exceeds the baseline"""
+    found = []
+    for key, per_size in sorted(report.items()):
+        if len(set(per_size.values())) > 1:
+            found.append(f'{key}: query count grows with N {per_size}')
+        budget = baseline.get(key)
+        if budget is None:
+            found.append(f'{key}: no baseline')
+        elif max(per_size.values()) > budget:
+            found.append(f'{key}: {max(per_size.values())} queries, budget is {budget}')
+    return found
@@ -0,0 +1,119 @@
+"""
+Reference data: waste categories and the choice lists (waste types, units,
+user types), loaded once per process.
+
+`get()` returns an immutable `RefData` snapshot. Saving or deleting a
+`WasteCategory` bumps a version number in the default cache (see the
+receivers in core/models.py); each process compares its copy's version with
+the cached one at most every REFDATA_CHECK_SECONDS and reloads when it has
+moved. The cache is shared by every process (see settings.CACHES), so an
+edit reaches all workers within REFDATA_CHECK_SECONDS.
+"""
+
+import threading
+import time
+from dataclasses import dataclass
+from types import MappingProxyType
+
+from django.conf import settings
+from django.core.cache import cache
+
+from . import metrics
+
+VERSION_KEY = 'core.refdata.version'
+DEFAULT_CATEGORY = ('General Waste', 'General waste materials')
+
+_lock = threading.Lock()
+_current = None  # (RefData, monotonic time its version was last checked)
+
+
+@dataclass(frozen=True)
+class RefData:
+    version: int
+    categories: tuple      # ((pk, name), ...) by name
+    waste_types: tuple     # ((value, label), ...)
+    units: tuple
+    user_types: tuple
+    category_names: MappingProxyType
+    waste_type_labels: MappingProxyType
+    unit_labels: MappingProxyType
+    user_type_labels: MappingProxyType
+
+
+def _version():
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        # Seed with the clock so a restarted cache never repeats a version a process already holds
+        cache.add(VERSION_KEY, time.time_ns(), None)
+        version = cache.get(VERSION_KEY, 0)
+    return version
+
+
+def load(version):
+    """Read the reference data from the database"""
+    from .models import User, WasteCategory, WasteItem
+
+    categories = tuple(WasteCategory.objects.order_by('name', 'pk').values_list('pk', 'name'))
+    return RefData(
+        version=version,
+        categories=categories,
+        waste_types=tuple(WasteItem.WASTE_TYPES),
+        units=tuple(WasteItem.UNIT_CHOICES),
+        user_types=tuple(User.USER_TYPES),
+        category_names=MappingProxyType(dict(categories)),
+        waste_type_labels=MappingProxyType(dict(WasteItem.WASTE_TYPES)),
+        unit_labels=MappingProxyType(dict(WasteItem.UNIT_CHOICES)),
+        user_type_labels=MappingProxyType(dict(User.USER_TYPES)),
+    )
+
+
+def get():
+    """The current reference data; no queries unless it changed since this process last loaded it"""
+    global _current
+    current = _current
+    now = time.monotonic()
+    if current is not None and now - current[1] < getattr(settings, 'REFDATA_CHECK_SECONDS', 5):
+        metrics.record_cache_lookup('refdata', True)
+        return current[0]
+    version = _version()
+    if current is not None and current[0].version == version:
+        _current = (current[0], now)
+        metrics.record_cache_lookup('refdata', True)
+        return current[0]
+    metrics.record_cache_lookup('refdata', False)
+    with _lock:
+        if _current is None or _current[0].version != version:
+            _current = (load(version), now)
+        return _current[0]
+
+
+def invalidate():
+    """Make every process reload: bump the shared version and drop this process's copy"""
+    global _current
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, time.time_ns(), None)
+    _current = None
+
+
+def category(pk):
+    """A `WasteCategory` for `pk` built from the cached data (no query), or None if unknown"""
+    from .models import WasteCategory
+
+    name = get().category_names.get(int(pk))
+    if name is None:
+        return None
+    instance = WasteCategory(pk=int(pk), name=name)
+    instance._state.adding = False
+    instance._state.db = 'default'
+    return instance
+
+
+def ensure_default_category():
+    """Create the default category if there are none (a new install); a no-op afterwards"""
+    from .models import WasteCategory
+
+    if not get().categories:
+        name, description = DEFAULT_CATEGORY
+        WasteCategory.objects.get_or_create(name=name, defaults={'description': description})
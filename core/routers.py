@@ -0,0 +1,21 @@
+"""
+Database routing: the database cache's table lives in its own SQLite file
+(the `cache` database, see settings.CACHES), so cache writes never wait for
+the application's write lock and cache statements are not counted as the
+request's queries.
+"""
+
+CACHE_DATABASE = 'cache'
+CACHE_APP_LABEL = 'django_cache'  # The app label of DatabaseCache's table
+
+
+class CacheRouter:
+    def db_for_read(self, model, **hints):
+        return CACHE_DATABASE if model._meta.app_label == CACHE_APP_LABEL else None
+
+    db_for_write = db_for_read
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if app_label == CACHE_APP_LABEL:
+            return db == CACHE_DATABASE
+        return False if db == CACHE_DATABASE else None
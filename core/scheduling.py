@@ -0,0 +1,175 @@
+"""
+Pickup scheduling: packing collectors' accepted matches into their pickup slots.
+
+Collectors declare a vehicle capacity and `PickupSlot`s (time windows, each
+optionally with its own capacity). Each accepted match weighs its listing's
+quantity in kg (see `load_kg`) and is planned into one slot:
+
+1. interval scheduling: a collector has one vehicle, so of overlapping
+   slots only a compatible set is used, picked greedily by earliest end
+   (which keeps as many slots as possible);
+2. first-fit decreasing bin packing: matches that already have a usable
+   slot with room keep it, then the rest, heaviest first, go into the
+   earliest slot they fit in. A match heavier than every slot stays
+   unscheduled (slot NULL) until a bigger slot is declared.
+
+Slots that have ended are not planned into, so an accepted match whose
+pickup was missed moves on to the next slot. Completed matches keep their
+slot, and while it is still running their load counts against it.
+
+Planning is per collector and incremental: `Match.save()` replans the
+collector when a match enters or leaves 'accepted', and saving or deleting
+a slot replans its owner, so one change costs a few queries over one
+collector's rows. `replan_all()` (`manage.py plan_pickups`) replans every
+collector in chunks, e.g. from cron to roll missed pickups forward.
+"""
+
+from collections import defaultdict
+from dataclasses import dataclass
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from .analytics import weight_kg
+
+
+@dataclass
+class Slot:
+    id: int
+    start: object
+    end: object
+    capacity: Decimal
+    used: Decimal = Decimal('0')
+
+
+def load_kg(quantity, unit):
+    """Weight of a listing in kg; units that are not weights use PICKUP_UNIT_LOAD_KG per unit"""
+    weight = weight_kg(quantity, unit)
+    if weight or quantity is None:
+        return weight
+    per_unit = getattr(settings, 'PICKUP_UNIT_LOAD_KG', {}).get((unit or '').strip().lower(), 1)
+    return Decimal(str(quantity)) * Decimal(str(per_unit))
+
+
+def compatible(slots):
+    """The largest set of non-overlapping slots, by earliest end first; in start order"""
+    chosen = []
+    for slot in sorted(slots, key=lambda slot: (slot.end, slot.start, slot.id)):
+        if not chosen or slot.start >= chosen[-1].end:
+            chosen.append(slot)
+    return chosen
+
+
+def plan(slots, matches):
+    """
+    Assign one collector's matches to slots. `matches` is a list of
+    (match id, load in kg, current slot id); returns {match id: slot id or None}.
+    """
+    slots = compatible(slots)
+    by_id = {slot.id: slot for slot in slots}
+    assignment = {}
+    waiting = []
+    for match_id, load, current in sorted(matches, key=lambda m: m[0]):
+        slot = by_id.get(current)
+        if slot is not None and slot.used + load <= slot.capacity:
+            slot.used += load
+            assignment[match_id] = slot.id
+        else:
+            waiting.append((match_id, load))
+    for match_id, load in sorted(waiting, key=lambda m: (-m[1], m[0])):
+        assignment[match_id] = None
+        for slot in slots:
+            if slot.used + load <= slot.capacity:
+                slot.used += load
+                assignment[match_id] = slot.id
+                break
+    return assignment
+
+
+def replan(collector_ids, now=None):
+    """Replan these collectors' accepted matches; returns {match id: new slot id} for the matches that moved"""
+    from .models import Match, PickupSlot
+
+    collector_ids = list(collector_ids)
+    if not collector_ids:
+        return {}
+    now = now or timezone.now()
+    default = Decimal(str(getattr(settings, 'PICKUP_DEFAULT_CAPACITY_KG', 100)))
+    slots = defaultdict(list)
+    for pk, collector_id, start, end, capacity, vehicle in PickupSlot.objects.filter(
+        collector_id__in=collector_ids, end__gt=now,
+    ).values_list('pk', 'collector_id', 'start', 'end', 'capacity_kg', 'collector__vehicle_capacity_kg'):
+        slots[collector_id].append(Slot(pk, start, end, capacity or vehicle or default))
+
+    matches = defaultdict(list)
+    current = {}
+    for pk, collector_id, status, slot_id, quantity, unit in Match.objects.filter(
+        Q(status='accepted') | Q(slot__end__gt=now) | Q(slot__isnull=False, status__in=('pending', 'rejected')),
+        collector_id__in=collector_ids,
+    ).values_list('pk', 'collector_id', 'status', 'slot_id', 'waste_item__quantity', 'waste_item__unit'):
+        load = load_kg(quantity, unit)
+        if status == 'completed':
+            # Already on the vehicle: takes up room but is not replanned
+            for slot in slots[collector_id]:
+                if slot.id == slot_id:
+                    slot.used += load
+            continue
+        current[pk] = slot_id
+        if status == 'accepted':
+            matches[collector_id].append((pk, load, slot_id))
+
+    moved = {pk: None for pk, slot_id in current.items() if slot_id is not None}  # Pending/rejected lose theirs
+    for collector_id, pending in matches.items():
+        moved.update(plan(slots[collector_id], pending))
+    moved = {pk: slot_id for pk, slot_id in moved.items() if current.get(pk) != slot_id}
+    # One UPDATE per destination slot (bulk_update's CASE per row is far slower to build);
+    # updated_at moves too so offline copies pick up the new slot
+    by_slot = defaultdict(list)
+    for pk, slot_id in moved.items():
+        by_slot[slot_id].append(pk)
+    with transaction.atomic(savepoint=False):
+        for slot_id, pks in by_slot.items():
+            for start in range(0, len(pks), 500):
+                Match.objects.filter(pk__in=pks[start:start + 500]).update(slot_id=slot_id, updated_at=now)
+    return moved
+
+
+def replan_all(chunk_size=200, now=None):
+    """Replan every collector with slots or accepted matches; returns (collectors, matches moved)"""
+    from .models import Match, PickupSlot
+
+    now = now or timezone.now()
+    collector_ids = sorted(
+        set(PickupSlot.objects.filter(end__gt=now).values_list('collector_id', flat=True).distinct())
+        | set(Match.objects.filter(Q(status='accepted') | Q(slot__end__gt=now))
+              .values_list('collector_id', flat=True).distinct())
+    )
+    moved = 0
+    for start in range(0, len(collector_ids), chunk_size):
+        moved += len(replan(collector_ids[start:start + chunk_size], now=now))
+    return len(collector_ids), moved
+
+
+def schedule_for(collector, now=None):
+    """The collector's upcoming slots, each with its planned matches and load, plus the unscheduled matches"""
+    from .models import Match
+
+    now = now or timezone.now()
+    slots = list(collector.pickup_slots.filter(end__gt=now).order_by('start'))
+    default = Decimal(str(getattr(settings, 'PICKUP_DEFAULT_CAPACITY_KG', 100)))
+    planned = defaultdict(list)
+    unscheduled = []
+    for match in Match.objects.filter(collector=collector, status='accepted').select_related('waste_item__poster'):
+        match.load_kg = load_kg(match.waste_item.quantity, match.waste_item.unit)
+        if match.slot_id is None:
+            unscheduled.append(match)
+        else:
+            planned[match.slot_id].append(match)
+    for slot in slots:
+        slot.planned = planned.get(slot.pk, [])
+        slot.load_kg = sum((match.load_kg for match in slot.planned), Decimal('0'))
+        slot.effective_capacity = slot.capacity_kg or collector.vehicle_capacity_kg or default
+    return slots, unscheduled
@@ -0,0 +1,22 @@
+"""
+Session engine: Django's cached_db store, counting its cache lookups in the
+`cache_requests` metric (cache="session") like the user and reference-data
+caches.
+"""
+
+from django.contrib.sessions.backends import cached_db
+
+from . import metrics
+
+
+class SessionStore(cached_db.SessionStore):
+    def load(self):
+        self._read_db = False
+        data = super().load()
+        metrics.record_cache_lookup('session', not self._read_db)
+        return data
+
+    def _get_session_from_db(self):
+        # Only reached when the cache had no copy
+        self._read_db = True
+        return super()._get_session_from_db()
@@ -0,0 +1,204 @@
+"""
+Delta sync for offline-first collector apps (`/api/v1/sync/`).
+
+A client keeps a local copy of three streams and asks only for what changed
+since its checkpoint:
+
+* listings: available waste items in its place, by (updated_at, id);
+* matches: its collection requests, by (updated_at, id);
+* credits: its ledger entries, which are append-only, by id;
+
+plus removals read from the `Tombstone` log: listings deleted or no longer
+available in the place, and deleted matches. Listings are matched on their
+place ID (`WasteItem.place`): the user's place, unless the client names
+another location. Every stream is read in keyset order, at most `limit` rows
+per call; `more` means call again straight away.
+
+The checkpoint is a signed, opaque string with each stream's position. Rows
+stamped in the last SYNC_SETTLE_SECONDS are left for the next call, so a
+transaction that commits shortly after stamping `updated_at` is not skipped.
+A checkpoint older than SYNC_RETENTION_DAYS (how long tombstones are kept),
+or for another place, restarts the sync with `reset` set: the client drops its
+copy first.
+
+Actions queued while offline are replayed with a client-chosen key each;
+`replay` stores the outcome under the key, so a resent action is answered
+from the store instead of running twice.
+"""
+
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core import signing
+from django.db import IntegrityError, transaction
+from django.db.models import Max, Q
+from django.utils import timezone
+
+from . import places
+
+EPOCH = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+MICROSECOND = timedelta(microseconds=1)
+SALT = 'core.sync'
+
+
+def record(kind, rows):
+    """Tombstones for [(object_id, place or None, user_id)] that left the `kind` stream"""
+    from .models import Tombstone
+
+    Tombstone.objects.bulk_create([
+        Tombstone(kind=kind, object_id=object_id, area=place or '', user_id=user_id)
+        for object_id, place, user_id in rows
+    ])
+
+
+def _micros(value):
+    return (value - EPOCH) // MICROSECOND if value else 0
+
+
+def _datetime(micros):
+    return EPOCH + micros * MICROSECOND if micros else None
+
+
+@dataclass
+class Checkpoint:
+    area: str = ''
+    issued: int = 0
+    listings: tuple = (0, 0)
+    matches: tuple = (0, 0)
+    credits: int = 0
+    tombstones: int = 0
+
+    def dumps(self):
+        return signing.dumps([self.area, self.issued, *self.listings, *self.matches, self.credits, self.tombstones],
+                             salt=SALT)
+
+    @classmethod
+    def loads(cls, token):
+        """The checkpoint in `token`; raises ValueError if it was not issued here"""
+        try:
+            area, issued, l_at, l_id, m_at, m_id, credits, tombstones = signing.loads(token, salt=SALT)
+        except (signing.BadSignature, TypeError, ValueError):
+            raise ValueError("Invalid checkpoint")
+        return cls(area, issued, (l_at, l_id), (m_at, m_id), credits, tombstones)
+
+
+@dataclass
+class Changes:
+    checkpoint: Checkpoint
+    reset: bool = False
+    more: bool = False
+    listings: list = field(default_factory=list)
+    matches: list = field(default_factory=list)
+    credits: list = field(default_factory=list)
+    removed_listings: list = field(default_factory=list)
+    removed_matches: list = field(default_factory=list)
+
+
+def _since(queryset, position, horizon, limit):
+    """Rows updated after `position` (updated_at micros, id) and before `horizon`, oldest first"""
+    stamp, last_id = position
+    if stamp:
+        at = _datetime(stamp)
+        queryset = queryset.filter(Q(updated_at__gt=at) | Q(updated_at=at, pk__gt=last_id))
+    rows = list(queryset.filter(updated_at__lt=horizon).order_by('updated_at', 'pk')[:limit + 1])
+    more = len(rows) > limit
+    rows = rows[:limit]
+    return rows, more, (_micros(rows[-1].updated_at), rows[-1].pk) if rows else position
+
+
+def changes(user, token=None, area=None, limit=200, listings=None, matches=None, credits=None):
+    """
+    What changed for `user` since the checkpoint `token` (from the start if
+    None), for the listings in `area` (a location; the user's place by
+    default). `listings`, `matches` and `credits` are the querysets to read
+    (already narrowed to the columns the caller serialises); they must load
+    `updated_at`.
+    """
+    from .models import CreditTransaction, Match, Tombstone, WasteItem
+
+    now = timezone.now()
+    area = user.place or places.place_id(user.location) if area is None else places.place_id(area)
+    checkpoint = Checkpoint.loads(token) if token else None
+    retention = timedelta(days=getattr(settings, 'SYNC_RETENTION_DAYS', 30))
+    reset = checkpoint is not None and (
+        checkpoint.area != area or _datetime(checkpoint.issued) < now - retention
+    )
+    if checkpoint is None or reset:
+        # Nothing to remove from an empty copy: start the tombstones at the end of the log
+        start = Tombstone.objects.aggregate(last=Max('pk'))['last'] or 0
+        checkpoint = Checkpoint(area=area, tombstones=start)
+    horizon = now - timedelta(seconds=getattr(settings, 'SYNC_SETTLE_SECONDS', 2))
+    result = Changes(checkpoint=Checkpoint(area=area, issued=_micros(now)), reset=reset)
+    position = result.checkpoint
+
+    if listings is None:
+        listings = WasteItem.objects.all()
+    listings = listings.filter(status='available')
+    if area:
+        listings = listings.filter(place=area)
+    result.listings, more, position.listings = _since(listings, checkpoint.listings, horizon, limit)
+    result.more |= more
+
+    if matches is None:
+        matches = Match.objects.all()
+    result.matches, more, position.matches = _since(matches.filter(collector=user), checkpoint.matches,
+                                                    horizon, limit)
+    result.more |= more
+
+    if credits is None:
+        credits = CreditTransaction.objects.all()
+    rows = list(credits.filter(user=user, pk__gt=checkpoint.credits, created_at__lt=horizon)
+                .order_by('pk')[:limit + 1])
+    result.credits = rows[:limit]
+    result.more |= len(rows) > limit
+    position.credits = result.credits[-1].pk if result.credits else checkpoint.credits
+
+    removals = Q(kind='match', user=user) | (Q(kind='listing', area=area) if area else Q(kind='listing'))
+    tombstones = list(
+        Tombstone.objects.filter(removals, pk__gt=checkpoint.tombstones, removed_at__lt=horizon)
+        .order_by('pk').values_list('pk', 'kind', 'object_id')[:limit + 1]
+    )
+    result.more |= len(tombstones) > limit
+    tombstones = tombstones[:limit]
+    position.tombstones = tombstones[-1][0] if tombstones else checkpoint.tombstones
+    removed = {'listing': set(), 'match': set()}
+    for _, kind, object_id in tombstones:
+        removed[kind].add(object_id)
+    if removed['listing']:
+        # A listing that came back (e.g. a match fell through) is in the listings stream again; keep it
+        back = WasteItem.objects.filter(pk__in=removed['listing'], status='available').values_list('pk', 'place')
+        removed['listing'] -= {pk for pk, place in back if not area or place == area}
+    result.removed_listings = sorted(removed['listing'])
+    result.removed_matches = sorted(removed['match'])
+    return result
+
+
+def replay(user, key, kind, perform):
+    """
+    (status, body) of the action stored under `key`: `perform()` runs only
+    the first time the key is seen, in the same transaction that stores its
+    outcome.
+    """
+    from .models import OfflineAction
+
+    with transaction.atomic():
+        try:
+            with transaction.atomic():
+                action = OfflineAction.objects.create(user=user, key=key, kind=kind)
+        except IntegrityError:
+            stored = OfflineAction.objects.get(user=user, key=key)
+            return stored.status_code, stored.response
+        action.status_code, action.response = perform()
+        action.save(update_fields=['status_code', 'response'])
+    return action.status_code, action.response
+
+
+def prune():
+    """Delete tombstones and stored actions older than SYNC_RETENTION_DAYS; returns the number deleted"""
+    from .models import OfflineAction, Tombstone
+
+    cutoff = timezone.now() - timedelta(days=getattr(settings, 'SYNC_RETENTION_DAYS', 30))
+    deleted, _ = Tombstone.objects.filter(removed_at__lt=cutoff).delete()
+    actions, _ = OfflineAction.objects.filter(created_at__lt=cutoff).delete()
+    return deleted + actions
@@ -1,3 +1,1448 @@
-from django.test import TestCase
+import gzip
+import io
+import logging
+import os
+import shutil
+import tempfile
+import time
+import warnings
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.cache.backends.db import DatabaseCache
+from django.core.management import call_command
+from django.db import connection, connections, transaction
+from django.contrib.auth.models import Permission
+from django.db.models import F, Sum
+from django.test import Client, RequestFactory, TestCase, override_settings
+from django.utils import timezone
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from . import (admission, analytics, archive, auth, benchmark, counters, dedup, events, jobs, ledger, leaderboard, metrics, places,
+               profiling, query_budget, refdata, scheduling)
+from .admin import CreditTransactionAdmin
+from .auth import CachedModelBackend
+from .forms import WasteItemForm
+from .models import (AdminJob, ArchivedMatch, ArchivedWasteItem, CreditTransaction, DuplicateCandidate, ImpactRollup,
+                     LeaderboardScore, PickupSlot, StatusEvent, User, WasteCategory, WasteItem, Match)
+
+
+# Every test client shares one IP and the cache outlives each test's data. The runner is one process, so it
+# gets its own in-memory cache rather than the shared one, which outlives the test database
+@override_settings(ADMISSION_CONTROL_ENABLED=False,
+                   CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class BaseTestCase(TestCase):
+    """Admission control off, and the per-request and job log lines kept out of the runner output"""
+
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        for name in ('core', 'core.requests'):
+            logger = logging.getLogger(name)
+            cls.addClassCleanup(logger.setLevel, logger.level)
+            logger.setLevel(logging.WARNING)
+
+
+class CoreTestCase(BaseTestCase):
+    """Shared fixtures: a poster, a collector and one available waste item"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.category = WasteCategory.objects.create(name="Plastic", description="Plastic bottles")
+        cls.poster = User.objects.create_user('poster', password='pass12345', user_type='household')
+        cls.collector = User.objects.create_user('collector', password='pass12345', user_type='collector')
+        cls.item = WasteItem.objects.create(
+            poster=cls.poster,
+            title="Plastic bottles",
+            description="Clean bottles",
+            waste_type='plastic',
+            category=cls.category,
+            quantity=Decimal('10'),
+            unit='kg',
+            location='Machakos Town',
+        )
+
+
+class RequestInstrumentationTests(CoreTestCase):
+    def test_server_timing_header(self):
+        with self.assertLogs('core.requests', level='INFO') as logs:
+            response = self.client.get(reverse('home'))
+
+        self.assertEqual(response.status_code, 200)
+        timing = response['Server-Timing']
+        self.assertIn('db;dur=', timing)
+        self.assertIn('tpl;dur=', timing)
+        self.assertIn('total;dur=', timing)
+        self.assertEqual(len(logs.records), 1)
+        perf = logs.records[0].perf
+        self.assertEqual(perf['view'], 'home')
+        self.assertGreaterEqual(perf['queries'], 1)
+        self.assertIn('waste', perf['slowest_sql'].lower())
+        line = logs.records[0].getMessage()
+        self.assertIn(f"slowest_sql_ms={perf['slowest_sql_ms']:.1f} slowest_sql={perf['slowest_sql'][:40]}", line)
+
+    def test_query_count_matches_executed_queries(self):
+        self.client.force_login(self.poster)
+        with self.assertLogs('core.requests', level='INFO') as logs:
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get(reverse('dashboard'))
+
+        perf = logs.records[-1].perf
+        self.assertEqual(perf['view'], 'dashboard')
+        self.assertEqual(perf['queries'], len(queries.captured_queries))
+        self.assertGreater(perf['template_ms'], 0)
+
+
+class MatchFlowTests(CoreTestCase):
+    def test_complete_match_awards_credits(self):
+        match = Match.objects.create(waste_item=self.item, collector=self.collector, status='accepted')
+        success, credits = match.complete_match()
+
+        self.assertTrue(success)
+        self.assertEqual(credits, Decimal('20'))
+        self.poster.refresh_from_db()
+        self.assertEqual(self.poster.digital_credits, Decimal('20'))
+        self.assertEqual(self.poster.credit_transactions.count(), 1)
+
+
+class SamplingProfilerTests(CoreTestCase):
+    def setUp(self):
+        self.spool = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.spool, ignore_errors=True)
+
+    def test_signed_header_profiles_request(self):
+        with override_settings(PROFILER_ENABLED=True, PROFILER_SAMPLE_RATE=0, PROFILER_SPOOL_DIR=self.spool):
+            self.client.get(reverse('home'))
+            self.assertFalse(os.path.exists(os.path.join(self.spool, 'home')))
+
+            self.client.get(reverse('home'), HTTP_X_PROFILE_TOKEN=profiling.make_token())
+            self.assertEqual(len(os.listdir(os.path.join(self.spool, 'home'))), 1)
+
+            out = io.StringIO()
+            call_command('profile_summary', '--url-name', 'home', stdout=out)
+            self.assertIn('1 cProfile', out.getvalue())
+
+    def test_sample_mode_writes_collapsed_stacks_with_rotation(self):
+        with override_settings(
+            PROFILER_ENABLED=True, PROFILER_SAMPLE_RATE=1, PROFILER_MODE='sample',
+            PROFILER_SAMPLE_INTERVAL=0.0005, PROFILER_SPOOL_DIR=self.spool, PROFILER_MAX_FILES_PER_VIEW=2,
+        ):
+            for _ in range(3):
+                self.client.get(reverse('home'))
+
+        files = os.listdir(os.path.join(self.spool, 'home'))
+        self.assertEqual(len(files), 2)
+        self.assertTrue(all(name.endswith('.collapsed') for name in files))
+
+
+class MetricsTests(CoreTestCase):
+    def test_metrics_endpoint_exposes_request_and_business_metrics(self):
+        match = Match.objects.create(waste_item=self.item, collector=self.collector)
+        match.accept_match()
+        match.complete_match()
+        self.client.get(reverse('home'))
+
+        response = self.client.get(reverse('metrics'))
+        body = response.content.decode()
+
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('http_request_duration_seconds_bucket{method="GET",view="home",le="+Inf"}', body)
+        self.assertIn('match_transitions_total{from_status="accepted",to_status="completed"}', body)
+        self.assertIn('credit_transactions_total{type="credit"}', body)
+        self.assertIn('waste_items{status="collected"} 1', body)
+
+    @override_settings(METRICS_TOKEN='secret')
+    def test_metrics_token(self):
+        self.assertEqual(self.client.get(reverse('metrics')).status_code, 403)
+        response = self.client.get(reverse('metrics'), HTTP_AUTHORIZATION='Bearer secret')
+        self.assertEqual(response.status_code, 200)
+
+    def test_metrics_refused_outside_allowed_ips_by_default(self):
+        self.assertEqual(self.client.get(reverse('metrics'), REMOTE_ADDR='203.0.113.9').status_code, 403)
+        with override_settings(METRICS_ALLOWED_IPS=['203.0.113.9']):
+            self.assertEqual(self.client.get(reverse('metrics'), REMOTE_ADDR='203.0.113.9').status_code, 200)
+
+    def test_cache_lookups_are_counted(self):
+        self.client.force_login(self.poster)
+        self.client.get(reverse('dashboard'))
+        self.client.get(reverse('dashboard'))
+
+        body = self.client.get(reverse('metrics')).content.decode()
+        for name in ('user', 'session', 'refdata'):
+            self.assertIn(f'cache_requests_total{{cache="{name}",result="hit"}}', body)
+        self.assertIn('cache_requests_total{cache="user",result="miss"}', body)
+
+    def test_mmap_values_are_summed_across_worker_files(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        first = metrics.MmapValues(os.path.join(directory, 'metrics-1.db'))
+        second = metrics.MmapValues(os.path.join(directory, 'metrics-2.db'))
+        first.inc('requests', 2)
+        second.inc('requests', 3)
+        second.inc('x' * 100000, 1)  # forces the file to grow
+
+        with override_settings(METRICS_MULTIPROC_DIR=directory):
+            totals = dict(metrics.collect_values())
+
+        self.assertEqual(totals['requests'], 5)
+        self.assertEqual(totals['x' * 100000], 1)
+        # Re-opening a worker file keeps its values
+        self.assertEqual(dict(metrics.MmapValues(first.path).items())['requests'], 2)
+
+
+class QueryBudgetTests(BaseTestCase):
+    """Every view runs a fixed number of queries, whatever the amount of data"""
+
+    def test_views_stay_within_query_budget(self):
+        report = query_budget.run([1, 8])
+        baseline = query_budget.load_baseline()
+        self.assertEqual(query_budget.problems(report, baseline), [])
+        # Every baseline entry is still measured, so none of them can go stale
+        self.assertEqual(sorted(report), sorted(baseline))
+
+    def test_every_url_is_measured_or_exempt(self):
+        self.assertEqual(query_budget.uncovered(), [])
+
+
+class BenchmarkReportTests(BaseTestCase):
+    def test_percentiles_and_summary(self):
+        recorder = benchmark.Recorder()
+        for ms in range(1, 101):
+            recorder.record('home', ms / 1000, 200, 100)
+        recorder.record('dashboard', 0.5, 500, 10)
+
+        report = benchmark.summarise(recorder, elapsed=2.0)
+
+        home = report['endpoints']['home']
+        self.assertEqual((home['p50_ms'], home['p95_ms'], home['p99_ms']), (50.0, 95.0, 99.0))
+        self.assertEqual(home['rps'], 50.0)
+        self.assertEqual(report['endpoints']['dashboard']['error_rate'], 1.0)
+        self.assertEqual(report['requests'], 101)
+        self.assertEqual(report['errors'], 1)
+
+
+class DataGeneratorTests(BaseTestCase):
+    def generate(self, prefix):
+        call_command('generate_data', users=50, items=300, seed=7, prefix=prefix, chunk_size=100,
+                     stdout=io.StringIO())
+        items = WasteItem.objects.filter(poster__username__startswith=f'{prefix}_')
+        return list(items.order_by('id').values_list('title', 'status', 'quantity', 'estimated_credits'))
+
+    def test_output_is_reproducible_and_ledger_consistent(self):
+        first = self.generate('gen_a')
+        second = self.generate('gen_b')
+
+        self.assertEqual(len(first), 300)
+        self.assertEqual(first, second)
+        for user in User.objects.filter(username__startswith='gen_a_'):
+            ledger = user.credit_transactions.aggregate(total=Sum('amount'))['total'] or 0
+            self.assertEqual(user.digital_credits, ledger)
+        self.assertTrue(Match.objects.filter(status='completed').exists())
+        # Rollups, leaderboards and counters are rebuilt once the rows are in
+        self.assertEqual(ImpactRollup.objects.filter(grain='month').aggregate(n=Sum('items'))['n'],
+                         WasteItem.objects.count())
+        self.assertTrue(LeaderboardScore.objects.filter(board='collectors').exists())
+        self.assertEqual(User.objects.aggregate(n=Sum('items_posted'))['n'], WasteItem.objects.count())
+
+    def test_orm_path_writes_the_same_aware_rows(self):
+        with warnings.catch_warnings():
+            warnings.simplefilter('error', RuntimeWarning)  # "received a naive datetime"
+            call_command('generate_data', users=20, items=50, seed=7, prefix='orm', chunk_size=50, orm=True,
+                         stdout=io.StringIO())
+        call_command('generate_data', users=20, items=50, seed=7, prefix='raw', chunk_size=50, stdout=io.StringIO())
+        rows = {prefix: list(WasteItem.objects.filter(poster__username__startswith=f'{prefix}_').order_by('id')
+                             .values_list('title', 'status', 'created_at', 'updated_at'))
+                for prefix in ('orm', 'raw')}
+        self.assertEqual(len(rows['orm']), 50)
+        # Each run dates its rows from its own Plan.now, so compare them relative to the run's newest listing
+        offsets = {prefix: [(title, status, max(r[2] for r in found) - created, updated - created)
+                            for title, status, created, updated in found] for prefix, found in rows.items()}
+        self.assertEqual(offsets['orm'], offsets['raw'])
+
+
+class AdminChangelistTests(CoreTestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin', password='pass12345')
+        self.client.force_login(self.admin)
+
+    def test_changelist_queries_do_not_grow_with_rows(self):
+        url = reverse('admin:core_wasteitem_changelist')
+        # Warm the per-process caches (reference data, signed-in user)
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as before:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        WasteItem.objects.bulk_create([
+            WasteItem(poster=self.poster, title=f'Lot {i}', description='Bagged', category=self.category,
+                      quantity=Decimal('1'), location='Tala') for i in range(20)
+        ])
+        with CaptureQueriesContext(connection) as after:
+            self.assertEqual(self.client.get(url).status_code, 200)
+        self.assertEqual(len(after), len(before))
+
+    def test_credit_transactions_use_keyset_pagination(self):
+        for i in range(5):
+            self.poster.add_credits(i + 1, reason=f'Lot {i}')
+        url = reverse('admin:core_credittransaction_changelist')
+        with mock.patch.object(CreditTransactionAdmin, 'list_per_page', 2):
+            first = self.client.get(url)
+            second = self.client.get(url, {'after': first.context['cl'].next_cursor})
+            last = self.client.get(url, {'after': second.context['cl'].next_cursor})
+
+        newest = list(CreditTransaction.objects.order_by('-pk').values_list('pk', flat=True))
+        self.assertEqual([t.pk for t in first.context['cl'].result_list], newest[:2])
+        self.assertEqual([t.pk for t in second.context['cl'].result_list], newest[2:4])
+        self.assertEqual([t.pk for t in last.context['cl'].result_list], newest[4:])
+        self.assertIsNone(last.context['cl'].next_cursor)
+        self.assertContains(second, '?after=%d' % newest[3])
+        self.assertEqual(self.client.get(url, {'after': 'x'}).status_code, 302)
+
+
+@override_settings(ADMIN_JOBS_IN_THREAD=False)
+class AdminJobTests(CoreTestCase):
+    def setUp(self):
+        self.admin = User.objects.create_superuser('admin', password='pass12345')
+        self.client.force_login(self.admin)
+        self.items = [self.item] + [
+            WasteItem.objects.create(poster=self.poster, title=f'Lot {i}', description='Bagged', waste_type='metal',
+                                     category=self.category, quantity=Decimal(i + 1), location='Tala')
+            for i in range(4)
+        ]
+
+    def run_action(self, action, model='wasteitem', items=None):
+        self.client.post(reverse(f'admin:core_{model}_changelist'), {
+            'action': action, '_selected_action': [obj.pk for obj in items or self.items],
+        })
+        return AdminJob.objects.latest('pk')
+
+    def test_mark_collected_awards_credits_in_chunks(self):
+        job = self.run_action('mark_collected')
+        self.assertEqual((job.status, job.total), ('queued', 5))
+
+        call_command('run_admin_jobs', chunk_size=2, stdout=io.StringIO())
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.processed, job.affected), ('completed', 5, 5))
+        self.assertEqual(job.checkpoint, self.items[-1].pk)
+        self.assertFalse(WasteItem.objects.exclude(status='collected').exists())
+        self.poster.refresh_from_db()
+        expected = Decimal('20') + 3 * Decimal(1 + 2 + 3 + 4)
+        self.assertEqual(self.poster.digital_credits, expected)
+        self.assertEqual(self.poster.credit_transactions.count(), 5)
+        self.assertEqual(self.poster.credit_transactions.aggregate(total=Sum('amount'))['total'], expected)
+
+    def test_dry_run_changes_nothing(self):
+        job = self.run_action('mark_collected_dry_run')
+        call_command('run_admin_jobs', stdout=io.StringIO())
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.dry_run, job.affected), ('completed', True, 5))
+        self.assertFalse(WasteItem.objects.filter(status='collected').exists())
+        self.assertFalse(CreditTransaction.objects.exists())
+
+    def test_failed_job_resumes_from_checkpoint(self):
+        WasteItem.objects.filter(pk__in=[i.pk for i in self.items]).update(status='collected')
+        job = self.run_action('award_credits')
+        calls = []
+
+        def flaky(ids, dry_run):
+            calls.append(ids)
+            if len(calls) == 2:
+                raise RuntimeError('worker died')
+            return jobs.award_credits(ids, dry_run)
+
+        with mock.patch.dict(jobs.OPERATIONS, {'award_credits': flaky}), self.assertLogs('core.jobs', 'ERROR'):
+            jobs.run_job(job.pk, chunk_size=2)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.processed, job.checkpoint), ('failed', 2, self.items[1].pk))
+
+        call_command('run_admin_jobs', resume=True, chunk_size=2, stdout=io.StringIO())
+
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.processed, job.affected), ('completed', 5, 5))
+        self.assertEqual(self.poster.credit_transactions.count(), 5)
+
+    def test_running_job_is_only_resumed_once_its_lease_expires(self):
+        job = self.run_action('mark_collected')
+        AdminJob.objects.filter(pk=job.pk).update(status='running')
+
+        self.assertIsNone(jobs.run_job(job.pk, resume=True))
+        call_command('run_admin_jobs', resume=True, stdout=io.StringIO())
+        self.assertFalse(WasteItem.objects.filter(status='collected').exists())
+
+        AdminJob.objects.filter(pk=job.pk).update(updated_at=timezone.now() - timedelta(minutes=10))
+        self.assertEqual(jobs.run_job(job.pk, resume=True).status, 'completed')
+        self.assertEqual(WasteItem.objects.filter(status='collected').count(), 5)
+
+    def test_worker_stops_when_another_claims_its_job(self):
+        job = self.run_action('mark_collected')
+        calls = []
+
+        def slow(ids, dry_run):
+            calls.append(ids)
+            # The lease ran out mid-chunk and another worker got further
+            AdminJob.objects.filter(pk=job.pk).update(checkpoint=self.items[3].pk)
+            return jobs.mark_collected(ids, dry_run)
+
+        with mock.patch.dict(jobs.OPERATIONS, {'mark_collected': slow}), self.assertLogs('core.jobs', 'WARNING'):
+            self.assertIsNone(jobs.run_job(job.pk, chunk_size=2))
+        self.assertEqual(len(calls), 1)
+        self.assertFalse(WasteItem.objects.filter(status='collected').exists())
+
+    def test_items_awarded_concurrently_are_not_credited_twice(self):
+        WasteItem.objects.filter(pk__in=[i.pk for i in self.items]).update(status='collected')
+        rate = jobs._credit_rate
+
+        def racing_award():
+            # Another worker awards one of the items after this one read them
+            WasteItem.objects.filter(pk=self.item.pk).update(credits_earned=Decimal('20'))
+            return rate()
+
+        with mock.patch.object(jobs, '_credit_rate', racing_award), self.assertRaises(jobs.AwardedConcurrently):
+            with transaction.atomic():
+                jobs.award_credits([i.pk for i in self.items], False)
+
+        self.poster.refresh_from_db()
+        self.assertEqual(self.poster.digital_credits, 0)
+        self.assertFalse(CreditTransaction.objects.exists())
+
+
+class ImpactRollupTests(CoreTestCase):
+    def rollups(self, grain='day'):
+        rows = ImpactRollup.objects.filter(grain__in=grain.split()).values_list(
+            'grain', 'day', 'area', 'waste_type', 'category_id', 'status', *analytics.MEASURES)
+        return {row[1:6] if grain == 'day' else row[:6]: tuple(row[6:]) for row in rows if any(row[6:])}
+
+    def assertMatchesRebuild(self):
+        incremental = self.rollups('day month')
+        analytics.rebuild(chunk_size=2)
+        self.assertEqual(incremental, self.rollups('day month'))
+
+    def test_status_transitions_move_items_between_buckets(self):
+        day = timezone.localdate()
+        key = (day, 'Machakos Town', 'plastic', self.category.pk)
+        self.assertEqual(self.rollups(), {key + ('available',): (1, Decimal('10.000'), Decimal('20.00'), Decimal('0.00'))})
+
+        match = Match.objects.create(waste_item=self.item, collector=self.collector)
+        match.accept_match()
+        match.complete_match()
+
+        self.assertEqual(self.rollups(), {key + ('collected',): (1, Decimal('10.000'), Decimal('20.00'), Decimal('20.00'))})
+        self.assertMatchesRebuild()
+
+    @override_settings(ADMIN_JOBS_IN_THREAD=False)
+    def test_bulk_writes_and_deletes_stay_consistent(self):
+        others = [
+            WasteItem.objects.create(poster=self.poster, title=f'Lot {i}', description='Bagged', waste_type='paper',
+                                     quantity=Decimal('500'), unit='g', location=f'tala, stage {i}')
+            for i in range(3)
+        ]
+        job = jobs.create_job('mark_collected', WasteItem.objects.all())
+        jobs.run_job(job.pk, chunk_size=2)
+        others[0].delete()
+
+        self.assertEqual(self.rollups()[(timezone.localdate(), 'Tala', 'paper', None, 'collected')],
+                         (2, Decimal('1.000'), Decimal('1500.00'), Decimal('1500.00')))
+        self.assertMatchesRebuild()
+
+    def test_rollups_are_keyed_by_place(self):
+        # A misspelling of the same place and a listing without a place ID yet (its area text is the key)
+        WasteItem.objects.create(poster=self.poster, title='Cans', description='Bagged', waste_type='plastic',
+                                 category=self.category, quantity=Decimal('2'), unit='kg', location='machakos twn')
+        unplaced = WasteItem.objects.create(poster=self.poster, title='Sacks', description='Bagged',
+                                            waste_type='paper', quantity=Decimal('1'), location='Kwa Mutisya')
+        WasteItem.objects.filter(pk=unplaced.pk).update(place='')
+        analytics.rebuild()
+
+        rows = ImpactRollup.objects.filter(grain='day').values_list('place', 'area', 'items')
+        self.assertEqual(sorted(rows), [('Kwa Mutisya', 'Kwa Mutisya', 1),
+                                        ('subcounty:machakos-town', 'Machakos Town', 2)])
+        report = analytics.report(area='Machakos twn', group_by=['area'])
+        self.assertEqual([(row['area'], row['items']) for row in report], [('Machakos Town', 2)])
+        self.assertEqual([row['area'] for row in analytics.report(group_by=['area'])], ['Kwa Mutisya', 'Machakos Town'])
+
+    def test_report_view_and_csv_read_the_rollups(self):
+        analyst = User.objects.create_user('analyst', password='pass12345')
+        analyst.user_permissions.add(Permission.objects.get(codename='view_impactrollup'))
+        self.client.force_login(analyst)
+        last_year = WasteItem.objects.create(poster=self.poster, title='Old lot', description='Bagged',
+                                             quantity=Decimal('5'), location='Machakos Town')
+        backdated = WasteItem.objects.filter(pk=last_year.pk)
+        with analytics.track(backdated):
+            backdated.update(created_at=timezone.now() - timedelta(days=365))
+        today = timezone.localdate()
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('impact_report'), {
+                'start': date(today.year, 1, 1), 'end': today, 'group_by': ['year', 'area'], 'compare': 'on',
+                'format': 'csv',
+            })
+
+        self.assertFalse(any('core_wasteitem' in q['sql'] for q in queries.captured_queries))
+        # Whole months come from month rows, the partial edges from day rows
+        start = today - timedelta(days=400)
+        by_day = analytics.report(start, today, ['day'])
+        self.assertEqual([row['items'] for row in analytics.report(start, today, ['status'])],
+                         [sum(row['items'] for row in by_day)])
+        lines = response.content.decode().splitlines()
+        self.assertEqual(lines[0], 'year,area,items,tonnes,estimated_credits,credits_earned,'
+                                   'previous_items,previous_tonnes,tonnes_change_pct')
+        self.assertEqual(lines[1], f'{date(today.year, 1, 1)},Machakos Town,1,0.010,20.00,0.00,1,0.005,100.0')
+        self.assertContains(self.client.get(reverse('impact_report')), '<td>0.010</td>')
+
+        self.client.force_login(self.poster)
+        with self.assertLogs('django.request', 'WARNING'):
+            self.assertEqual(self.client.get(reverse('impact_report')).status_code, 403)
+
+
+class LeaderboardTests(CoreTestCase):
+    def scores(self):
+        return {(s.board, s.period, s.place, s.user_id): s.score for s in LeaderboardScore.objects.all()}
+
+    def assertMatchesRebuild(self):
+        incremental = self.scores()
+        leaderboard.rebuild(chunk_size=2)
+        self.assertEqual(incremental, self.scores())
+
+    def test_completions_update_boards_and_ranks(self):
+        match = Match.objects.create(waste_item=self.item, collector=self.collector)
+        match.accept_match()
+        match.complete_match()
+        rival = User.objects.create_user('rival', password='pass12345')
+        bigger = WasteItem.objects.create(poster=rival, title='Scrap', description='Bagged', waste_type='metal',
+                                          quantity=Decimal('10'), location='Tala, market')
+        bigger.status = 'collected'
+        bigger.save()
+
+        self.assertEqual([(e.user, e.score) for e in leaderboard.top('earners')],
+                         [(rival, Decimal('30.00')), (self.poster, Decimal('20.00'))])
+        self.assertEqual(leaderboard.rank('earners', self.poster), (2, Decimal('20.00')))
+        self.assertEqual(leaderboard.rank('earners', self.poster, place='subcounty:machakos-town'),
+                         (1, Decimal('20.00')))
+        self.assertIsNone(leaderboard.rank('earners', self.poster, place='landmark:tala-market'))
+        self.assertEqual(leaderboard.rank('collectors', self.collector), (1, Decimal('1.00')))
+        self.assertEqual(leaderboard.top('earners', leaderboard.month_of() - timedelta(days=1)), [])
+        self.assertMatchesRebuild()
+
+    def test_scores_stay_in_the_month_they_were_earned(self):
+        match = Match.objects.create(waste_item=self.item, collector=self.collector)
+        match.accept_match()
+        match.complete_match()
+        # Edited weeks later: the listing's updated_at moves on, the award does not
+        WasteItem.objects.filter(pk=self.item.pk).update(updated_at=timezone.now() + timedelta(days=40))
+        Match.objects.filter(pk=match.pk).update(updated_at=timezone.now() + timedelta(days=40))
+
+        self.assertEqual({key[:2] for key in self.scores()}, {('earners', leaderboard.month_of()),
+                                                               ('collectors', leaderboard.month_of())})
+        self.assertMatchesRebuild()
+
+    @override_settings(ADMIN_JOBS_IN_THREAD=False)
+    def test_bulk_jobs_and_view(self):
+        Match.objects.create(waste_item=self.item, collector=self.collector, status='accepted')
+        job = jobs.create_job('mark_collected', WasteItem.objects.all())
+        jobs.run_job(job.pk)
+        self.assertEqual(leaderboard.rank('collectors', self.collector, place='subcounty:machakos-town'),
+                         (1, Decimal('1.00')))
+        self.assertMatchesRebuild()
+
+        self.client.force_login(self.poster)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('leaderboard'), {'area': 'machakos town, stage'})
+        self.assertContains(response, 'You are #1 with 20 credits.')
+        self.assertContains(response, '· Machakos Town</h5>')
+        self.assertFalse(any('core_credittransaction' in q['sql'] for q in queries.captured_queries))
+
+    def test_scores_are_keyed_by_place(self):
+        # Spelled two ways, one place: by area text these were 'Tala' and 'Tala Market'
+        for location in ('Tala, market', 'Tala Market'):
+            item = WasteItem.objects.create(poster=self.poster, title='Scrap', description='Bagged',
+                                            waste_type='metal', quantity=Decimal('10'), location=location)
+            item.status = 'collected'
+            item.save()
+
+        self.assertEqual(leaderboard.rank('earners', self.poster, place='landmark:tala-market'),
+                         (1, Decimal('60.00')))
+        self.assertMatchesRebuild()
+
+
+class ApiTests(CoreTestCase):
+    def test_session_login_csrf_and_batched_create(self):
+        client = Client(enforce_csrf_checks=True)
+        self.assertEqual(client.get(reverse('api_waste_items')).status_code, 401)
+        response = client.post(reverse('api_session'), {'username': 'poster', 'password': 'pass12345'},
+                               content_type='application/json')
+        token = response.json()['csrf_token']
+        listings = [
+            {'title': 'Bottles', 'description': 'Bagged', 'quantity': 4, 'location': 'Tala',
+             'category': self.category.pk},
+            {'title': 'Cans', 'description': 'Crushed', 'waste_type': 'metal', 'quantity': '2.5', 'location': 'Tala'},
+        ]
+        self.assertEqual(client.post(reverse('api_waste_items'), listings,
+                                     content_type='application/json').status_code, 403)
+
+        response = client.post(reverse('api_waste_items') + '?fields=title,estimated_credits,category', listings,
+                               content_type='application/json', HTTP_X_CSRFTOKEN=token)
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()['results'], [
+            {'title': 'Bottles', 'estimated_credits': '8.00', 'category': 'Plastic'},
+            {'title': 'Cans', 'estimated_credits': '7.50', 'category': None},
+        ])
+        self.assertEqual(sum(row['items'] for row in analytics.report(group_by=['status'])), 3)
+
+        listings[1]['quantity'] = -1
+        response = client.post(reverse('api_waste_items'), listings, content_type='application/json',
+                               HTTP_X_CSRFTOKEN=token)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(list(response.json()['details']), ['1'])
+        self.assertEqual(WasteItem.objects.count(), 3)
+
+    def test_cursor_pages_sparse_fields_and_compression(self):
+        for i in range(4):
+            WasteItem.objects.create(poster=self.poster, title=f'Lot {i}', description='Bagged ' * 40,
+                                     quantity=Decimal('1'), location='Tala')
+        self.client.force_login(self.collector)
+        url = reverse('api_waste_items') + '?limit=2&fields=id,title,poster'
+        with CaptureQueriesContext(connection) as queries:
+            page = self.client.get(url).json()
+        sql = queries.captured_queries[-1]['sql']
+        self.assertIn('"core_user"."username"', sql)
+        self.assertNotIn('"core_wasteitem"."description"', sql)
+        self.assertEqual([row['title'] for row in page['results']], ['Lot 3', 'Lot 2'])
+        self.assertEqual(page['results'][0]['poster'], 'poster')
+
+        titles = []
+        while url:
+            page = self.client.get(url).json()
+            titles += [row['title'] for row in page['results']]
+            url = page['next']
+        self.assertEqual(titles, ['Lot 3', 'Lot 2', 'Lot 1', 'Lot 0', 'Plastic bottles'])
+        self.assertEqual(self.client.get(reverse('api_waste_items') + '?fields=password').status_code, 400)
+
+        plain = self.client.get(reverse('api_waste_items'))
+        compressed = self.client.get(reverse('api_waste_items'), HTTP_ACCEPT_ENCODING='gzip;q=1.0, identity; q=0.5')
+        self.assertEqual(compressed['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(compressed.content), plain.content)
+        self.assertIn('Accept-Encoding', plain['Vary'])
+        self.assertFalse(self.client.get(reverse('home'), HTTP_ACCEPT_ENCODING='gzip').has_header('Content-Encoding'))
+
+    def test_match_flow(self):
+        collector = Client()
+        collector.force_login(self.collector)
+        created = collector.post(reverse('api_matches'), {'waste_item_id': self.item.pk, 'message': 'Tomorrow'},
+                                 content_type='application/json')
+        self.assertEqual(created.status_code, 201)
+        match_id = created.json()['results'][0]['id']
+        self.assertEqual(collector.post(reverse('api_matches'), {'waste_item_id': self.item.pk},
+                                        content_type='application/json').json()['details'], {'0': 'Already requested'})
+
+        poster = Client()
+        poster.force_login(self.poster)
+        self.assertEqual(poster.post(reverse('api_match_action', args=[match_id, 'accept'])).json()['status'], 'accepted')
+        self.assertEqual(poster.post(reverse('api_match_action', args=[match_id, 'complete'])).status_code, 403)
+        done = collector.post(reverse('api_match_action', args=[match_id, 'complete'])).json()
+        self.assertEqual((done['status'], done['credits_awarded']), ('completed', '20.00'))
+
+        stats = poster.get(reverse('api_dashboard')).json()
+        self.assertEqual((stats['balance'], stats['leaderboard']['rank']), ('20.00', 1))
+        self.assertEqual(poster.get(reverse('api_credits')).json()['results'][0]['amount'], '20.00')
+        self.assertEqual(poster.get(reverse('api_matches') + '?role=poster&fields=status,collector').json()['results'],
+                         [{'status': 'completed', 'collector': 'collector'}])
+
+
+class ListingImportTests(CoreTestCase):
+    CSV = (
+        "Title,Description,Quantity,Location,Waste_Type,Category,Unit\n"
+        "Bottles,Bagged,4,Tala,plastic,plastic,kgs\n"
+        "Cans,Crushed,lots,Tala,metal,,kg\n"
+        "Paper,Bundled,2.5,Kathiani,paper,Unknown,kg\n"
+        "Glass,Jars,3,Tala,glass,,bottle\n"
+    )
+
+    def test_valid_rows_imported_and_bad_rows_reported(self):
+        from io import BytesIO
+        from . import importer
+
+        result = importer.import_listings(BytesIO(self.CSV.encode()), self.poster, batch_size=1)
+        self.assertEqual((result.rows, result.created, result.invalid), (4, 2, 2))
+        self.assertEqual(result.errors, [(3, {'quantity': "Enter a number."}),
+                                         (4, {'category': "Unknown category 'Unknown'."})])
+        bottles = WasteItem.objects.get(title='Bottles')
+        self.assertEqual((bottles.category, bottles.unit, bottles.estimated_credits), (self.category, 'kg', Decimal('8.00')))
+        self.assertIsNotNone(bottles.created_at)
+        self.assertEqual(WasteItem.objects.get(title='Glass').unit, 'bottles')
+
+        def rollups():
+            rows = ImpactRollup.objects.values_list('grain', 'day', 'area', 'waste_type', 'category_id', 'status',
+                                                    *analytics.MEASURES)
+            return {row[:6]: tuple(row[6:]) for row in rows if any(row[6:])}
+
+        incremental = rollups()
+        self.assertEqual(incremental[('day', timezone.localdate(), 'Tala', 'plastic', self.category.pk, 'available')],
+                         (1, Decimal('4.000'), Decimal('8.00'), Decimal('0.00')))
+        analytics.rebuild()
+        self.assertEqual(rollups(), incremental)
+
+        missing = importer.import_listings(BytesIO(b"title,quantity\nBottles,4\n"), self.poster)
+        self.assertEqual(missing.errors, [(1, {'header': "Missing columns: description, location"})])
+
+    def test_upload_page_api_and_command(self):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+
+        self.client.force_login(self.poster)
+        self.assertEqual(self.client.get(reverse('import_waste')).status_code, 200)
+        response = self.client.post(reverse('import_waste'), {
+            'file': SimpleUploadedFile('lots.csv', self.CSV.encode()), 'dry_run': 'on',
+        })
+        self.assertContains(response, 'Unknown category')
+        self.assertEqual(WasteItem.objects.count(), 1)
+
+        response = self.client.post(reverse('api_import_waste_items'),
+                                    {'file': SimpleUploadedFile('lots.csv', self.CSV.encode())})
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.json()['created'], response.json()['errors'][0]['line']), (2, 3))
+        self.assertEqual(WasteItem.objects.count(), 3)
+
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as fh:
+            fh.write(self.CSV)
+        self.addCleanup(os.remove, fh.name)
+        out, err = io.StringIO(), io.StringIO()
+        call_command('import_listings', fh.name, user='poster', stdout=out, stderr=err)
+        self.assertIn('Imported 2 of 4 rows (2 invalid)', out.getvalue())
+        self.assertIn('line 3: quantity: Enter a number.', err.getvalue())
+        self.assertEqual(WasteItem.objects.filter(poster=self.poster).count(), 5)
+
+
+@override_settings(SYNC_SETTLE_SECONDS=0)
+class SyncTests(CoreTestCase):
+    def sync(self, client, **params):
+        body = client.get(reverse('api_sync'), params).json()
+        rows = {name: [dict(zip(body[name]['columns'], row)) for row in body[name]['rows']]
+                for name in ('listings', 'matches', 'credits')}
+        return body, rows
+
+    def test_changes_since_checkpoint(self):
+        self.collector.location = 'machakos town, stage'
+        self.collector.save()
+        elsewhere = WasteItem.objects.create(poster=self.poster, title='Far', description='x', quantity=Decimal('1'),
+                                             location='Tala')
+        client = Client()
+        client.force_login(self.collector)
+
+        body, rows = self.sync(client)
+        self.assertEqual([row['id'] for row in rows['listings']], [self.item.pk])
+        self.assertFalse(body['reset'] or body['more'])
+        body, rows = self.sync(client, checkpoint=body['checkpoint'])
+        self.assertEqual((rows['listings'], rows['matches'], body['removed']), ([], [], {'listings': [], 'matches': []}))
+
+        fresh = WasteItem.objects.create(poster=self.poster, title='New', description='x', quantity=Decimal('2'),
+                                         location='Machakos Town')
+        match = Match.objects.create(waste_item=self.item, collector=self.collector)
+        match.accept_match()
+        body, rows = self.sync(client, checkpoint=body['checkpoint'])
+        self.assertEqual([row['id'] for row in rows['listings']], [fresh.pk])
+        self.assertEqual([(row['id'], row['status']) for row in rows['matches']], [(match.pk, 'accepted')])
+        self.assertEqual(body['removed']['listings'], [self.item.pk])
+
+        removed = {'listings': [fresh.pk], 'matches': [match.pk]}
+        fresh.delete()
+        elsewhere.delete()
+        match.delete()
+        body, rows = self.sync(client, checkpoint=body['checkpoint'])
+        self.assertEqual(body['removed'], removed)
+
+        body, rows = self.sync(client, checkpoint=body['checkpoint'], area='Tala')
+        self.assertTrue(body['reset'])
+        self.assertEqual(client.get(reverse('api_sync'), {'checkpoint': 'forged'}).status_code, 400)
+
+    def test_batches_and_ledger(self):
+        for i in range(3):
+            self.poster.add_credits(Decimal('1'), reason=f'Bonus {i}')
+        client = Client()
+        client.force_login(self.poster)
+        body, rows = self.sync(client, limit=2)
+        self.assertTrue(body['more'])
+        self.assertEqual([row['reason'] for row in rows['credits']], ['Bonus 0', 'Bonus 1'])
+        body, rows = self.sync(client, limit=2, checkpoint=body['checkpoint'])
+        self.assertFalse(body['more'])
+        self.assertEqual([row['reason'] for row in rows['credits']], ['Bonus 2'])
+
+    def test_queued_actions_are_idempotent(self):
+        client = Client()
+        client.force_login(self.collector)
+        actions = [{'key': 'a1', 'type': 'request', 'waste_item_id': self.item.pk, 'message': 'Offline'}]
+        first = client.post(reverse('api_sync'), actions, content_type='application/json').json()['results']
+        again = client.post(reverse('api_sync'), actions, content_type='application/json').json()['results']
+        self.assertEqual(first, again)
+        self.assertEqual(first[0]['status'], 201)
+        self.assertEqual(Match.objects.filter(collector=self.collector).count(), 1)
+
+        match_id = first[0]['body']['id']
+        complete = [{'key': 'a2', 'type': 'complete', 'match_id': match_id}]
+        refused = client.post(reverse('api_sync'), complete, content_type='application/json').json()['results'][0]
+        self.assertEqual((refused['status'], refused['body']['error']), (409, 'Cannot complete a match that is pending'))
+        Match.objects.get(pk=match_id).accept_match()
+        complete[0]['key'] = 'a3'
+        done = client.post(reverse('api_sync'), complete * 2, content_type='application/json').json()['results']
+        self.assertEqual([result['body']['credits_awarded'] for result in done], ['20.00', '20.00'])
+        self.assertEqual(CreditTransaction.objects.filter(user=self.poster).count(), 1)
+        self.assertEqual(client.post(reverse('api_sync'), [{'type': 'complete'}],
+                                     content_type='application/json').status_code, 400)
+
+
+class ConditionalGetTests(CoreTestCase):
+    def test_unchanged_pages_revalidate_with_304(self):
+        client = Client()
+        client.force_login(self.collector)
+        page = client.get(reverse('waste_list'))
+        self.assertEqual(page.status_code, 200)
+        self.assertEqual(page['Cache-Control'], 'private, no-cache')
+        self.assertIn('Cookie', page['Vary'])
+        with CaptureQueriesContext(connection) as queries:
+            again = client.get(reverse('waste_list'), HTTP_IF_NONE_MATCH=page['ETag'])
+        self.assertEqual((again.status_code, again.content), (304, b''))
+        self.assertLessEqual(len(queries), 4)
+        self.assertEqual(client.get(reverse('waste_list'), HTTP_IF_MODIFIED_SINCE=page['Last-Modified']).status_code, 304)
+
+        other = Client()
+        other.force_login(self.poster)
+        self.assertEqual(other.get(reverse('waste_list'), HTTP_IF_NONE_MATCH=page['ETag']).status_code, 200)
+
+        self.item.status = 'pending'
+        self.item.save()
+        changed = client.get(reverse('waste_list'), HTTP_IF_NONE_MATCH=page['ETag'])
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed['ETag'], page['ETag'])
+
+        detail = client.get(reverse('waste_detail', args=[self.item.pk]))
+        self.assertEqual(client.get(reverse('waste_detail', args=[self.item.pk]),
+                                    HTTP_IF_NONE_MATCH=detail['ETag']).status_code, 304)
+        self.assertEqual(client.get(reverse('waste_detail', args=[self.item.pk + 100])).status_code, 404)
+
+    def test_anonymous_home_is_publicly_cacheable(self):
+        page = self.client.get(reverse('home'))
+        self.assertEqual(page['Cache-Control'], 'public, max-age=60')
+        self.assertEqual(self.client.get(reverse('home'), HTTP_IF_NONE_MATCH=page['ETag']).status_code, 304)
+
+    def test_uploads_get_unique_names(self):
+        from .models import waste_image_path
+
+        self.assertNotEqual(waste_image_path(None, 'Bottles.JPG'), waste_image_path(None, 'Bottles.JPG'))
+        self.assertTrue(waste_image_path(None, 'Bottles.JPG').endswith('.jpg'))
+
+
+class CachedAuthTests(CoreTestCase):
+    def setUp(self):
+        self.client.force_login(self.poster)
+        self.backend = CachedModelBackend()
+
+    def test_signed_in_requests_skip_session_and_user_queries(self):
+        self.client.get(reverse('import_waste'))
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(reverse('import_waste')).status_code, 200)
+
+    def test_balance_is_fresh_after_ledger_writes(self):
+        self.client.get(reverse('user_credits'))
+        self.poster.add_credits(Decimal('7.5'), reason='Bonus')
+        self.assertEqual(self.client.get(reverse('user_credits')).context['user'].digital_credits, Decimal('7.5'))
+
+        WasteItem.objects.filter(pk=self.item.pk).update(status='collected')
+        jobs.award_items(WasteItem.objects.filter(pk=self.item.pk))
+        self.assertEqual(self.backend.get_user(self.poster.pk).digital_credits, Decimal('27.5'))
+
+    def test_entry_loaded_before_a_change_is_not_reused(self):
+        self.backend.get_user(self.poster.pk)
+        key, generation_key = auth._keys(self.poster.pk)
+        stale = cache.get(key)
+        auth.forget([self.poster.pk])
+        # A request that read the row before the change stores its copy afterwards
+        cache.set(key, stale)
+        with self.assertNumQueries(1):
+            self.backend.get_user(self.poster.pk)
+
+    def test_stale_cached_user_does_not_overwrite_the_balance(self):
+        self.client.force_login(self.collector)
+        self.client.get(reverse('pickup_schedule'))
+        # Credited by another process whose forget() did not reach this cache
+        User.objects.filter(pk=self.collector.pk).update(digital_credits=F('digital_credits') + 12)
+        response = self.client.post(reverse('pickup_schedule'), {'action': 'capacity', 'vehicle_capacity_kg': '250'})
+        self.assertEqual(response.status_code, 302)
+        collector = User.objects.get(pk=self.collector.pk)
+        self.assertEqual((collector.vehicle_capacity_kg, collector.digital_credits), (Decimal('250'), Decimal('12')))
+
+    @override_settings(USER_CACHE_BULK_FORGET=1)
+    def test_bulk_forget_drops_every_cached_user(self):
+        for user in (self.poster, self.collector):
+            self.backend.get_user(user.pk)
+        generation = cache.get(auth._keys(self.collector.pk)[1])
+        auth.forget([self.poster.pk, self.collector.pk])
+        self.assertEqual(cache.get(auth._keys(self.collector.pk)[1]), generation)  # One write, not one per user
+        with self.assertNumQueries(2):
+            self.backend.get_user(self.poster.pk)
+            self.backend.get_user(self.collector.pk)
+
+
+class CacheDatabaseTests(BaseTestCase):
+    databases = {'default', 'cache'}
+
+    def test_database_cache_has_its_own_database(self):
+        shared = DatabaseCache('core_cache', {})
+        with self.assertNumQueries(0), CaptureQueriesContext(connections['cache']) as queries:
+            shared.set('key', 'value')
+            self.assertEqual(shared.get('key'), 'value')
+        self.assertTrue(queries.captured_queries)
+
+
+class RefDataTests(CoreTestCase):
+    def setUp(self):
+        refdata.invalidate()
+
+    def test_listing_form_runs_no_queries_once_loaded(self):
+        refdata.get()
+        with self.assertNumQueries(0):
+            html = str(WasteItemForm())
+        self.assertIn(f'<option value="{self.category.pk}">Plastic</option>', html)
+        self.assertIn('Kilograms (kg)', html)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.item.get_waste_type_display(), 'Plastic')
+            self.assertEqual(self.poster.get_user_type_display(), 'Household')
+
+    def test_category_changes_reach_the_cache(self):
+        self.assertEqual(refdata.get().categories, ((self.category.pk, 'Plastic'),))
+        glass = WasteCategory.objects.create(name='Glass')
+        self.assertIn((glass.pk, 'Glass'), refdata.get().categories)
+        self.category.delete()
+        self.assertEqual(refdata.get().categories, ((glass.pk, 'Glass'),))
+
+    def test_form_saves_cached_category(self):
+        form = WasteItemForm({'title': 'Bottles', 'description': 'Bagged', 'category': str(self.category.pk),
+                              'quantity': '4', 'unit': 'kg', 'location': 'Tala'})
+        self.assertTrue(form.is_valid(), form.errors)
+        form.instance.poster = self.poster
+        self.assertEqual(form.save().category_id, self.category.pk)
+        form = WasteItemForm({'title': 'Bottles', 'description': 'Bagged', 'category': '999999',
+                              'quantity': '4', 'unit': 'kg', 'location': 'Tala'})
+        self.assertIn('category', form.errors)
+
+    def test_default_category_created_on_empty_install(self):
+        WasteCategory.objects.all().delete()
+        WasteItemForm()
+        self.assertEqual([name for _, name in refdata.get().categories], ['General Waste'])
+
+
+@override_settings(PLACES_RELOAD_SECONDS=0)
+class PlaceIndexTests(CoreTestCase):
+    def setUp(self):
+        places.invalidate()
+
+    def test_prefix_word_and_typo_lookups(self):
+        index = places.index()
+        with self.assertNumQueries(0):
+            self.assertEqual(index.search('mavoko')[0].id, 'subcounty:mavoko')
+            self.assertEqual(index.search('river')[0].name, 'Athi River')
+            self.assertEqual(index.search('machakso')[0].name, 'Machakos Town')
+            self.assertEqual(index.search('xq'), [])
+        self.assertEqual(index.resolve('mavko, behind the market').id, 'subcounty:mavoko')
+        self.assertIsNone(index.resolve('Kwa Mutisya'))
+
+    def test_listings_store_canonical_place(self):
+        self.assertEqual(self.item.place, 'subcounty:machakos-town')
+        form = WasteItemForm({'title': 'Cans', 'description': 'Bagged', 'quantity': '2', 'unit': 'kg',
+                              'location': 'machakos twn, near the stage'})
+        self.assertTrue(form.is_valid(), form.errors)
+        form.instance.poster = self.poster
+        item = form.save()
+        self.assertEqual((item.location, item.place), ('Machakos Town, near the stage', 'subcounty:machakos-town'))
+
+        # Somewhere new is indexed from the rollups once the listing is saved
+        other = WasteItem.objects.create(poster=self.poster, title='Sacks', description='Bagged',
+                                         quantity=Decimal('3'), location='Kwa Mutisya, stage')
+        self.assertEqual(other.place, 'area:kwa-mutisya')
+        self.assertEqual([place.id for place in places.index().search('kwa mu')], ['area:kwa-mutisya'])
+
+    def test_autocomplete_endpoint(self):
+        response = self.client.get(reverse('api_places'), {'q': 'athi', 'limit': 1})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['results'], [
+            {'id': 'ward:athi-river', 'name': 'Athi River', 'kind': 'ward', 'subcounty': 'Mavoko'},
+        ])
+
+    def test_backfill(self):
+        WasteItem.objects.update(place='')
+        User.objects.filter(pk=self.poster.pk).update(location='Tala')
+        self.assertEqual(places.backfill(chunk_size=1), 2)
+        self.assertEqual(WasteItem.objects.get(pk=self.item.pk).place, 'subcounty:machakos-town')
+        self.assertEqual(User.objects.get(pk=self.poster.pk).place, 'ward:tala')
+
+
+@override_settings(
+    ADMISSION_CONTROL_ENABLED=True,
+    ADMISSION_CLASSES={'write': {'user_rate': 0.01, 'user_burst': 2, 'ip_rate': 0.01, 'ip_burst': 5,
+                                 'concurrency': 1}},
+    ADMISSION_RULES={'request_match': {'class': 'write'}, 'post_waste': {'class': 'write', 'methods': ['POST']},
+                     'api_match_action': {'class': 'write'}},
+)
+class AdmissionControlTests(CoreTestCase):
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.collector)
+        self.url = reverse('request_match', kwargs={'waste_item_id': self.item.pk})
+
+    def test_retries_past_the_burst_get_429(self):
+        self.assertEqual(self.client.get(self.url).status_code, 302)
+        self.assertEqual(self.client.get(self.url).status_code, 302)
+        refused = self.client.get(self.url)
+        self.assertEqual(refused.status_code, 429)
+        self.assertGreaterEqual(int(refused['Retry-After']), 1)
+        self.assertEqual(Match.objects.filter(collector=self.collector).count(), 1)
+
+        # Someone else from the same address still gets in, until the address's own bucket is empty
+        self.client.force_login(self.poster)
+        self.assertNotEqual(self.client.get(self.url).status_code, 429)
+        self.assertEqual(self.client.get(reverse('post_waste')).status_code, 200)  # GET is not limited
+
+    def test_busy_class_and_slow_database_get_503(self):
+        with mock.patch.dict(admission._running, {'write': 1}):
+            self.assertEqual(self.client.get(self.url).status_code, 503)
+        self.assertEqual(admission._running.get('write', 0), 0)
+
+        match = Match.objects.create(waste_item=self.item, collector=self.collector)
+        self.client.force_login(self.poster)
+        with mock.patch.object(admission, '_db_latency', 1.0), \
+                mock.patch.object(admission, '_db_latency_at', time.monotonic()):
+            response = self.client.post(reverse('api_match_action', kwargs={'pk': match.pk, 'action': 'accept'}))
+        self.assertEqual(response.status_code, 503)
+        self.assertEqual(response.json()['details'], {'reason': 'db_latency'})
+        self.assertEqual(self.client.post(
+            reverse('api_match_action', kwargs={'pk': match.pk, 'action': 'accept'})).status_code, 200)
+
+    def test_refused_request_takes_no_tokens(self):
+        buckets = [('user', 0.01, 3), ('ip', 0.01, 1)]
+        self.assertEqual(admission.take(buckets), 0)
+        self.assertGreater(admission.take(buckets), 0)  # The address is out of tokens
+        self.assertGreater(admission.take(buckets), 0)
+        self.assertAlmostEqual(cache.get('user')[0], 2, places=2)
+
+    def test_client_ip_from_trusted_forwarded_hop(self):
+        request = RequestFactory().get('/', REMOTE_ADDR='10.0.0.2', HTTP_X_FORWARDED_FOR='6.6.6.6, 41.90.1.7')
+        with self.settings(ADMISSION_PROXY_HOPS=1):
+            self.assertEqual(admission.client_ip(request), '41.90.1.7')
+        with self.settings(ADMISSION_PROXY_HOPS=2):
+            self.assertEqual(admission.client_ip(request), '6.6.6.6')
+        with self.settings(ADMISSION_PROXY_HOPS=3):
+            self.assertEqual(admission.client_ip(request), '10.0.0.2')  # Fewer hops than proxies: not trusted
+        with self.settings(ADMISSION_PROXY_HOPS=0):
+            self.assertEqual(admission.client_ip(request), '10.0.0.2')
+
+
+class DedupTests(CoreTestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        override = override_settings(MEDIA_ROOT=self.root)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def photo(self, size=(120, 90), seed=0):
+        from PIL import Image, ImageDraw
+        from django.core.files.uploadedfile import SimpleUploadedFile
+
+        image = Image.new('RGB', (120, 90), 'white')
+        draw = ImageDraw.Draw(image)
+        for i in range(6):
+            draw.rectangle((i * 20, (i * 37 + seed * 11) % 60, i * 20 + 15, 89), fill=(40 * i, 200 - 30 * i, 90))
+        out = io.BytesIO()
+        image.resize(size).save(out, 'PNG')
+        return SimpleUploadedFile('photo.png', out.getvalue(), content_type='image/png')
+
+    def post(self, title, description, image=None):
+        data = {'title': title, 'description': description, 'waste_type': 'plastic', 'quantity': '5', 'unit': 'kg',
+                'location': 'Tala'}
+        if image is not None:
+            data['image'] = image
+        return self.client.post(reverse('post_waste'), data, follow=True)
+
+    def test_signatures(self):
+        text = 'Clean PET bottles, about 20kg, bagged and ready at the gate'
+        self.assertEqual(dedup.similarity(dedup.minhash(text), dedup.minhash(text.upper() + '!')), 1.0)
+        self.assertGreater(dedup.similarity(dedup.minhash(text), dedup.minhash(text.replace('20kg', '25 kg'))), 0.6)
+        self.assertLess(dedup.similarity(dedup.minhash(text), dedup.minhash('Scrap copper wire from rewiring')), 0.3)
+        self.assertLessEqual(dedup.distance(dedup.image_hash(self.photo()), dedup.image_hash(self.photo(size=(240, 180)))),
+                             dedup.IMAGE_BANDS - 1)
+        self.assertGreater(dedup.distance(dedup.image_hash(self.photo()), dedup.image_hash(self.photo(seed=1))), 3)
+        self.assertEqual(dedup.image_hash(io.BytesIO(b'not an image')), '')
+
+    def test_reposts_are_queued_at_post_time(self):
+        self.client.force_login(self.poster)
+        first = self.post('Bottles', 'Sorted clear bottles', self.photo())
+        self.assertEqual(DuplicateCandidate.objects.count(), 0)
+        response = self.post('Plastic for collection', 'Different words entirely', self.photo(size=(240, 180)))
+        self.assertContains(response, 'looks like a repost')
+        candidate = DuplicateCandidate.objects.get()
+        self.assertLessEqual(candidate.image_distance, 3)
+        self.assertEqual(candidate.duplicate_of.title, 'Bottles')
+        self.post('Bottles', 'Sorted clear bottles', self.photo(seed=1))
+        self.assertEqual(DuplicateCandidate.objects.count(), 2)  # Same poster, same text
+        self.assertEqual(first.status_code, 200)
+
+        # Another poster's listing with the same words is not a repost
+        self.client.force_login(self.collector)
+        self.post('Bottles', 'Sorted clear bottles')
+        self.assertEqual(DuplicateCandidate.objects.count(), 2)
+
+    def test_batch_scan_and_review(self):
+        copies = [WasteItem.objects.create(poster=self.poster, title='Plastic bottles', description='Clean bottles',
+                                           quantity=Decimal('10'), location='Tala') for _ in range(2)]
+        self.assertEqual(dedup.scan(chunk_size=2), (3, 3))
+        self.assertEqual(dedup.scan(), (0, 0))
+        self.assertEqual(dedup.scan(rescan=True), (3, 0))
+
+        copies[0].status = 'collected'
+        copies[0].save()
+        admin = User.objects.create_superuser('admin', password='pass12345')
+        self.client.force_login(admin)
+        url = reverse('admin:core_duplicatecandidate_changelist')
+        self.assertEqual(self.client.get(url).status_code, 200)
+        self.client.post(url, {'action': 'confirm', '_selected_action': list(
+            DuplicateCandidate.objects.filter(duplicate_of=self.item).values_list('pk', flat=True))})
+        self.assertFalse(WasteItem.objects.filter(pk=copies[1].pk).exists())
+        self.assertEqual(list(DuplicateCandidate.objects.values_list('item', 'status')),
+                         [(copies[0].pk, 'confirmed')])
+
+
+class PickupSchedulingTests(CoreTestCase):
+    def slot(self, hours, length=2, collector=None, **kwargs):
+        start = timezone.now() + timedelta(hours=hours)
+        return PickupSlot.objects.create(collector=collector or self.collector, start=start,
+                                         end=start + timedelta(hours=length), **kwargs)
+
+    def accept(self, quantity, unit='kg'):
+        item = WasteItem.objects.create(poster=self.poster, title='Lot', description='Bagged', quantity=quantity,
+                                        unit=unit, location='Tala')
+        match = Match.objects.create(waste_item=item, collector=self.collector)
+        match.accept_match()
+        return match
+
+    def test_plan_packs_heaviest_first_into_compatible_slots(self):
+        now = timezone.now()
+        slots = [scheduling.Slot(1, now, now + timedelta(hours=2), Decimal('50')),
+                 scheduling.Slot(2, now + timedelta(hours=1), now + timedelta(hours=3), Decimal('500')),  # Overlaps 1
+                 scheduling.Slot(3, now + timedelta(hours=2), now + timedelta(hours=4), Decimal('40'))]
+        loads = [(10, Decimal('30'), None), (11, Decimal('45'), None), (12, Decimal('20'), None),
+                 (13, Decimal('60'), None)]
+        self.assertEqual(scheduling.plan(slots, loads), {11: 1, 10: 3, 12: None, 13: None})
+        # A match keeps its slot while it still fits there
+        slots = [scheduling.Slot(1, now, now + timedelta(hours=2), Decimal('50')),
+                 scheduling.Slot(3, now + timedelta(hours=2), now + timedelta(hours=4), Decimal('50'))]
+        self.assertEqual(scheduling.plan(slots, [(10, Decimal('30'), 3), (11, Decimal('45'), None)]), {10: 3, 11: 1})
+        self.assertEqual(scheduling.load_kg(Decimal('2'), 'bags'), Decimal('20'))
+
+    def test_replans_as_matches_and_slots_change(self):
+        User.objects.filter(pk=self.collector.pk).update(vehicle_capacity_kg=50)
+        first = self.slot(1)
+        heavy, light = self.accept(40), self.accept(20)
+        self.assertEqual((heavy.slot_id, light.slot_id), (first.pk, None))
+        second = self.slot(4, capacity_kg=30)
+        self.assertEqual(Match.objects.get(pk=light.pk).slot_id, second.pk)
+
+        # Completing the heavy lot leaves its load on the running slot; rejecting frees the room
+        heavy.complete_match()
+        self.assertEqual(Match.objects.get(pk=heavy.pk).slot_id, first.pk)
+        third = self.accept(10)
+        self.assertEqual(third.slot_id, first.pk)
+        self.assertIsNone(self.accept(60).slot_id)  # Heavier than any slot
+        first.delete()
+        self.assertIsNone(Match.objects.get(pk=heavy.pk).slot_id)
+        self.assertEqual(Match.objects.get(pk=third.pk).slot_id, second.pk)
+
+        # A missed pickup moves to the next slot
+        later = self.slot(24)
+        PickupSlot.objects.filter(pk=second.pk).update(start=timezone.now() - timedelta(hours=3),
+                                                       end=timezone.now() - timedelta(hours=1))
+        self.assertEqual(scheduling.replan_all(), (1, 2))  # light and third; the 60 kg lot still fits nowhere
+        self.assertEqual(set(Match.objects.filter(status='accepted').values_list('slot', flat=True)), {later.pk, None})
+
+    def test_schedule_page(self):
+        self.client.force_login(self.collector)
+        url = reverse('pickup_schedule')
+        start = timezone.localtime() + timedelta(days=1)
+        self.client.post(url, {'action': 'capacity', 'vehicle_capacity_kg': '80'})
+        self.client.post(url, {'action': 'add_slot', 'start': start.strftime('%Y-%m-%dT%H:%M'),
+                               'end': (start + timedelta(hours=3)).strftime('%Y-%m-%dT%H:%M')})
+        match = self.accept(12)
+        response = self.client.get(url)
+        self.assertContains(response, '12 of 80 kg')
+        self.assertEqual(self.client.get(reverse('api_matches') + '?fields=id,pickup_start').json()['results'],
+                         [{'id': match.pk, 'pickup_start': match.slot.start.isoformat().replace('+00:00', 'Z')}])
+        self.client.force_login(self.poster)
+        self.assertRedirects(self.client.get(url), reverse('dashboard'))
+
+    def test_ten_thousand_matches_across_500_collectors(self):
+        import random
+
+        rng = random.Random(0)
+        collectors = User.objects.bulk_create([
+            User(username=f'c{i}', user_type='collector', vehicle_capacity_kg=150) for i in range(500)
+        ])
+        start = timezone.now() + timedelta(hours=1)
+        PickupSlot.objects.bulk_create([
+            PickupSlot(collector=collector, start=start + timedelta(hours=3 * day), end=start + timedelta(hours=3 * day + 2))
+            for collector in collectors for day in range(4)
+        ])
+        items = WasteItem.objects.bulk_create([
+            WasteItem(poster=self.poster, title='Lot', description='Bagged', quantity=rng.randint(1, 50), unit='kg',
+                      location='Tala', status='pending')
+            for _ in range(10000)
+        ])
+        Match.objects.bulk_create([
+            Match(waste_item=item, collector=collectors[i % 500], status='accepted') for i, item in enumerate(items)
+        ])
+
+        started = time.perf_counter()
+        collectors_planned, moved = scheduling.replan_all()
+        elapsed = time.perf_counter() - started
+        self.assertEqual(collectors_planned, 500)
+        self.assertLess(elapsed, 10)
+        loads = (Match.objects.filter(slot__isnull=False).values('slot').annotate(kg=Sum('waste_item__quantity'))
+                 .order_by('-kg').first())
+        self.assertLessEqual(loads['kg'], 150)
+        self.assertGreater(moved, 9000)
+
+
+class ArchiveTests(CoreTestCase):
+    def totals(self):
+        analytics.rebuild(chunk_size=2)
+        leaderboard.rebuild(chunk_size=2)
+        return (set(ImpactRollup.objects.values_list('grain', 'day', 'area', 'status', 'items', 'credits_earned')),
+                set(LeaderboardScore.objects.values_list('board', 'period', 'place', 'user_id', 'score')))
+
+    def test_moves_finished_rows_and_reads_both_tiers(self):
+        other = User.objects.create_user('other', password='pass12345', user_type='collector')
+        Match.objects.create(waste_item=self.item, collector=other)  # Still pending when the item is collected
+        match = Match.objects.create(waste_item=self.item, collector=self.collector)
+        match.accept_match()
+        match.complete_match()
+        open_item = WasteItem.objects.create(poster=self.poster, title='Cans', description='Crushed', quantity=5,
+                                             location='Tala')
+        rejected = Match.objects.create(waste_item=open_item, collector=self.collector, status='rejected')
+        dedup.check([self.item, open_item])
+        before = self.totals()
+        ledger = list(CreditTransaction.objects.values_list('pk', 'amount', 'reason'))
+
+        self.assertEqual(archive.archive(), (0, 0))  # Nothing is old enough yet
+        later = timezone.now() + timedelta(days=91)
+        self.assertEqual(archive.archive(chunk_size=1, now=later), (1, 3))
+        self.assertEqual(archive.archive(now=later), (0, 0))
+        self.assertEqual(list(WasteItem.objects.values_list('pk', flat=True)), [open_item.pk])
+        self.assertFalse(Match.objects.exists())
+        archived = ArchivedWasteItem.objects.get(pk=self.item.pk)
+        self.assertEqual((archived.status, archived.credits_earned), ('collected', Decimal('20.00')))
+        self.assertEqual(ArchivedMatch.objects.get(pk=match.pk).waste_item_title, 'Plastic bottles')
+        self.assertEqual(ArchivedMatch.objects.get(pk=rejected.pk).waste_item_ref, open_item.pk)
+        self.assertEqual(self.totals(), before)
+        self.assertEqual(list(CreditTransaction.objects.values_list('pk', 'amount', 'reason')), ledger)
+        self.assertEqual(User.objects.get(pk=self.poster.pk).digital_credits, Decimal('20.00'))
+
+        self.client.force_login(self.poster)
+        mine = self.client.get(reverse('api_waste_items'), {'mine': '1', 'fields': 'id,status', 'limit': 1}).json()
+        self.assertEqual(mine['results'], [{'id': open_item.pk, 'status': 'available'}])
+        mine = self.client.get(mine['next']).json()
+        self.assertEqual((mine['results'], mine['next']), ([{'id': self.item.pk, 'status': 'collected'}], None))
+        self.assertEqual(self.client.get(reverse('api_waste_item', args=[self.item.pk])).json()['credits_earned'],
+                         '20.00')
+        self.assertEqual(self.client.get(reverse('api_dashboard')).json()['total_waste_posted'], 2)
+        self.assertContains(self.client.get(reverse('dashboard')), 'Plastic bottles')
+        self.assertEqual(self.client.get(reverse('waste_detail', args=[self.item.pk])).status_code, 200)
+
+        self.client.force_login(self.collector)
+        found = self.client.get(reverse('api_matches'), {'role': 'collector', 'fields': 'id,status,waste_item'}).json()
+        self.assertEqual(found['results'], [{'id': rejected.pk, 'status': 'rejected', 'waste_item': 'Cans'},
+                                            {'id': match.pk, 'status': 'completed', 'waste_item': 'Plastic bottles'}])
+
+
+@override_settings(EVENT_SETTLE_SECONDS=0)
+class StatusEventTests(CoreTestCase):
+    def feed(self, after=0):
+        return [(e.kind, e.object_id, e.from_status, e.to_status, e.amount) for e in events.read(after)]
+
+    def test_transitions_and_awards_are_logged_in_order(self):
+        match = Match.objects.create(waste_item=self.item, collector=self.collector)
+        match.accept_match()
+        match.complete_match()
+        self.assertEqual(self.feed(), [
+            ('listing', self.item.pk, 'available', 'pending', None),
+            ('match', match.pk, 'pending', 'accepted', None),
+            ('award', self.item.pk, '', '', Decimal('20.00')),
+            ('listing', self.item.pk, 'pending', 'collected', None),
+            ('match', match.pk, 'accepted', 'completed', None),
+        ])
+        # The log is written with the change: a rolled-back change leaves no event
+        item = WasteItem.objects.create(poster=self.poster, title='Cans', description='Crushed', quantity=5,
+                                        location='Tala')
+        with self.assertRaises(RuntimeError), transaction.atomic():
+            item.status = 'recycled'
+            item.save()
+            raise RuntimeError
+        self.assertEqual(len(self.feed()), 5)
+
+    @override_settings(ADMIN_JOBS_IN_THREAD=False)
+    def test_bulk_jobs_log_events(self):
+        match = Match.objects.create(waste_item=self.item, collector=self.collector, status='accepted')
+        jobs.run_job(jobs.create_job('mark_collected', WasteItem.objects.all()).pk)
+        self.assertEqual(self.feed(), [
+            ('listing', self.item.pk, 'available', 'collected', None),
+            ('award', self.item.pk, '', '', Decimal('20.00')),
+            ('match', match.pk, 'accepted', 'completed', None),
+        ])
+
+    def test_consumers_checkpoint_and_old_events_compact(self):
+        match = Match.objects.create(waste_item=self.item, collector=self.collector)
+        match.accept_match()
+        match.complete_match()
+        seen = []
+        self.assertEqual(len(events.consume('notifications', seen.extend, limit=2)), 2)
+        self.assertEqual(len(events.consume('notifications', seen.extend)), 3)
+        self.assertEqual(events.consume('notifications', seen.extend), [])
+        self.assertEqual([e.pk for e in seen], list(StatusEvent.objects.order_by('pk').values_list('pk', flat=True)))
+        self.assertEqual(events.position('analytics'), 0)
+        with override_settings(EVENT_SETTLE_SECONDS=60):
+            self.assertEqual(events.read(), [])  # Not settled yet
+
+        self.assertEqual(events.compact(), 0)
+        self.assertEqual(events.compact(chunk_size=1, now=timezone.now() + timedelta(days=31)), 2)
+        self.assertEqual(self.feed(), [
+            ('award', self.item.pk, '', '', Decimal('20.00')),
+            ('listing', self.item.pk, 'pending', 'collected', None),
+            ('match', match.pk, 'accepted', 'completed', None),
+        ])
+
+
+class LedgerReconciliationTests(CoreTestCase):
+    def test_reports_and_repairs_drift(self):
+        self.poster.add_credits(Decimal('12.50'), reason='Bonus')
+        self.assertTrue(self.poster.deduct_credits(Decimal('2.50'), reason='Voucher'))
+        self.assertFalse(self.poster.deduct_credits(Decimal('100'), reason='Voucher'))
+        # Written without a ledger entry, like create_sample_data
+        User.objects.filter(pk=self.collector.pk).update(digital_credits=Decimal('40'))
+        stale = User.objects.get(pk=self.poster.pk)
+        self.poster.add_credits(Decimal('5'), reason='Bonus')
+        stale.add_credits(Decimal('1'), reason='Bonus')  # Once a lost update
+        self.assertEqual(User.objects.get(pk=self.poster.pk).digital_credits, Decimal('16.00'))
+
+        report = ledger.reconcile(chunk_size=1)
+        self.assertEqual((report.users, report.drifting, report.total_drift, report.repaired), (2, 1, Decimal('40'), 0))
+        self.assertEqual(report.largest, [(Decimal('40'), self.collector.pk, Decimal('40.00'), Decimal('0'))])
+
+        out = io.StringIO()
+        call_command('reconcile_ledger', '--repair', '--chunk-size', '1', stdout=out)
+        self.assertIn('1 drifting by 40.00 credits in total, 1 repaired', out.getvalue())
+        entry = CreditTransaction.objects.get(user=self.collector)
+        self.assertEqual((entry.transaction_type, entry.amount, entry.reason), ('credit', Decimal('40.00'), ledger.REASON))
+        self.assertEqual(ledger.reconcile().drifting, 0)
+
+
+class CounterTests(CoreTestCase):
+    def stored(self, user):
+        return dict(zip(counters.FIELDS, User.objects.filter(pk=user.pk).values_list(*counters.FIELDS).get()))
+
+    def assertCounts(self, user, **expected):
+        stored = self.stored(user)
+        self.assertEqual(stored, {**dict.fromkeys(counters.FIELDS, 0), **expected})
+        self.assertEqual(stored, counters.counts(user.pk, user.pk + 1)[user.pk])
+
+    def test_writes_keep_counters_in_step(self):
+        self.assertCounts(self.poster, items_posted=1)
+        stale = User.objects.get(pk=self.poster.pk)
+        match = Match.objects.create(waste_item=self.item, collector=self.collector)
+        self.assertCounts(self.poster, items_posted=1, pending_matches_received=1)
+        self.assertCounts(self.collector, matches_made=1)
+
+        match.accept_match()
+        self.assertCounts(self.poster, items_posted=1)
+        match.complete_match()
+        self.assertCounts(self.poster, items_posted=1, transaction_count=1)
+        stale.first_name = 'Stale'
+        stale.save()  # Loaded before the counters moved; must not write them back
+        self.assertCounts(self.poster, items_posted=1, transaction_count=1)
+
+        # Bulk paths: batched API requests and the stale-match job
+        second = WasteItem.objects.create(poster=self.poster, title="Cans", quantity=Decimal('2'), unit='kg',
+                                          location='Tala', waste_type='metal')
+        self.client.force_login(self.collector)
+        self.assertEqual(self.client.post(reverse('api_matches'), [{'waste_item_id': second.pk}],
+                                          content_type='application/json').status_code, 201)
+        self.assertCounts(self.poster, items_posted=2, pending_matches_received=1, transaction_count=1)
+        Match.objects.filter(waste_item=second).update(created_at=timezone.now() - timedelta(days=30))
+        self.assertEqual(jobs.reject_stale_matches(Match.objects.values_list('pk', flat=True), dry_run=False), 1)
+        self.assertCounts(self.poster, items_posted=2, transaction_count=1)
+        self.assertCounts(self.collector, matches_made=2)
+
+        second.delete()
+        self.assertCounts(self.poster, items_posted=1, transaction_count=1)
+        self.assertCounts(self.collector, matches_made=1)
+        self.client.force_login(self.poster)
+        stats = self.client.get(reverse('api_dashboard')).json()
+        self.assertEqual((stats['total_waste_posted'], stats['transaction_count'], stats['pending_matches']), (1, 1, 0))
+
+    def test_verify_counters_fixes_drift(self):
+        User.objects.filter(pk=self.poster.pk).update(items_posted=7, transaction_count=3)
+        out = io.StringIO()
+        call_command('verify_counters', '--chunk-size', '1', stdout=out)
+        self.assertIn('Checked 2 users, fixed 1', out.getvalue())
+        self.assertCounts(self.poster, items_posted=1)
+        self.assertEqual(counters.rebuild(), (2, 0))
+
+
+class MediaServingTests(BaseTestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.root)
+        os.makedirs(os.path.join(self.root, 'waste_images'))
+        self.data = bytes(range(256)) * 40
+        for name, body in (('photo.jpg', self.data), ('photo.webp', b'webp'), ('notes.txt', b'notes'),
+                           ('notes.txt.gz', b'gzipped')):
+            with open(os.path.join(self.root, 'waste_images', name), 'wb') as fh:
+                fh.write(body)
+        override = override_settings(MEDIA_ROOT=self.root)
+        override.enable()
+        self.addCleanup(override.disable)
+
+    def get(self, path, **headers):
+        response = self.client.get('/media/waste_images/' + path, **headers)
+        body = b''.join(response.streaming_content) if response.streaming else response.content
+        return response, body
+
+    def test_streams_whole_files_and_ranges(self):
+        response, body = self.get('photo.jpg')
+        self.assertEqual((response.status_code, body, response['Content-Type']), (200, self.data, 'image/jpeg'))
+        self.assertEqual(response['Cache-Control'], 'public, immutable, max-age=31536000')
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+
+        response, body = self.get('photo.jpg', HTTP_RANGE='bytes=100-199')
+        self.assertEqual((response.status_code, body), (206, self.data[100:200]))
+        self.assertEqual((response['Content-Range'], response['Content-Length']), (f'bytes 100-199/{len(self.data)}', '100'))
+        response, body = self.get('photo.jpg', HTTP_RANGE='bytes=-10')
+        self.assertEqual((response.status_code, body), (206, self.data[-10:]))
+        response, body = self.get('photo.jpg', HTTP_RANGE='bytes=5-', HTTP_IF_RANGE='"stale"')
+        self.assertEqual((response.status_code, body), (200, self.data))
+        self.assertEqual(self.get('photo.jpg', HTTP_RANGE=f'bytes={len(self.data)}-')[0].status_code, 416)
+
+        self.assertEqual(self.get('photo.jpg', HTTP_IF_NONE_MATCH=response['ETag'])[0].status_code, 304)
+        self.assertEqual(self.get('../secret.txt')[0].status_code, 404)
+        self.assertEqual(self.client.post('/media/waste_images/photo.jpg').status_code, 405)
+
+    def test_derivatives_precompressed_and_offload(self):
+        response, body = self.get('photo.jpg', HTTP_ACCEPT='image/avif,image/webp,*/*')
+        self.assertEqual((body, response['Content-Type']), (b'webp', 'image/webp'))
+        self.assertIn('Accept', response['Vary'])
+        response, body = self.get('notes.txt', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual((body, response['Content-Encoding']), (b'gzipped', 'gzip'))
+        self.assertEqual(self.get('notes.txt')[1], b'notes')
+
+        with override_settings(MEDIA_SERVE_MODE='x-accel'):
+            response, body = self.get('photo.jpg')
+        self.assertEqual((body, response['X-Accel-Redirect']), (b'', '/protected-media/waste_images/photo.jpg'))
+        with override_settings(MEDIA_SERVE_MODE='x-sendfile'):
+            response, body = self.get('photo.jpg')
+        self.assertEqual(response['X-Sendfile'], os.path.join(self.root, 'waste_images', 'photo.jpg'))
@@ -1,6 +1,6 @@
 from django.urls import path
 from django.contrib.auth import views as auth_views
-from . import views
+from . import api, views
 
 urlpatterns = [
     path('', views.home, name='home'),
@@ -9,6 +9,7 @@ urlpatterns = [
     path('logout/', auth_views.LogoutView.as_view(template_name='core/home.html'), name='logout'),
     path('dashboard/', views.dashboard, name='dashboard'),
     path('waste/post/', views.post_waste, name='post_waste'),
+    path('waste/import/', views.import_waste, name='import_waste'),
     path('waste/', views.waste_list, name='waste_list'),
     path('waste/<int:pk>/', views.waste_detail, name='waste_detail'),
     path('match/<int:pk>/<str:action>/', views.manage_match, name='manage_match'),
@@ -16,4 +17,18 @@ urlpatterns = [
     path('credits/', views.user_credits, name='user_credits'),
     path('waste/<int:pk>/complete/', views.manage_match, {'action': 'complete'}, name='complete_waste'),
     path('test-award/<int:waste_id>/', views.test_award_credits, name='test_award'),
+    path('metrics', views.metrics_view, name='metrics'),
+    path('reports/impact/', views.impact_report, name='impact_report'),
+    path('leaderboard/', views.leaderboard_view, name='leaderboard'),
+    path('schedule/', views.pickup_schedule, name='pickup_schedule'),
+    path('api/v1/session/', api.session, name='api_session'),
+    path('api/v1/waste/', api.waste_items, name='api_waste_items'),
+    path('api/v1/waste/<int:pk>/', api.waste_item, name='api_waste_item'),
+    path('api/v1/waste/import/', api.import_waste_items, name='api_import_waste_items'),
+    path('api/v1/matches/', api.matches, name='api_matches'),
+    path('api/v1/matches/<int:pk>/<str:action>/', api.match_action, name='api_match_action'),
+    path('api/v1/credits/', api.credits, name='api_credits'),
+    path('api/v1/dashboard/', api.dashboard, name='api_dashboard'),
+    path('api/v1/sync/', api.delta_sync, name='api_sync'),
+    path('api/v1/places/', api.place_search, name='api_places'),
 ]
\ No newline at end of file
@@ -1,13 +1,22 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth import login, authenticate
-from django.contrib.auth.decorators import login_required
+from django.contrib.auth.decorators import login_required, permission_required
 from django.contrib import messages
-from .models import WasteItem, Match, WasteCategory, User, CreditTransaction
-from .forms import UserRegistrationForm, WasteItemForm, MatchForm, Match
+from . import analytics, archive, dedup, importer, leaderboard, metrics, places, scheduling
+from .conditional import conditional_page, item_version, listings_version
+from .models import WasteItem, Match, WasteCategory, User, CreditTransaction, PickupSlot, ArchivedWasteItem
+from .forms import (UserRegistrationForm, WasteItemForm, MatchForm, Match, ImpactReportForm, LeaderboardForm, ListingImportForm,
+                    PickupSlotForm, VehicleCapacityForm)
 from django.db import transaction
-from django.db.models import Sum
+from django.db.models import F, Q, Sum
 from django.utils import timezone
 from django.http import HttpResponse, HttpResponseRedirect, JsonResponse
+from django.conf import settings
+from django.utils.crypto import constant_time_compare
+import csv
+import logging
+
+logger = logging.getLogger(__name__)
 
 #from .models import WasteItem, , CreditTransaction
 
@@ -66,13 +75,12 @@ def complete_waste_transaction(waste_item_id, collector_id):
 #start manage match function
 
 def manage_match(request, pk, action):
-    match = get_object_or_404(Match, pk=pk)
+    match = get_object_or_404(Match.objects.select_related('waste_item__poster', 'collector'), pk=pk)
     
-    print(f"DEBUG: User: {request.user.username} (ID: {request.user.id})")
-    print(f"DEBUG: Match Collector: {match.collector.username} (ID: {match.collector.id})")
-    print(f"DEBUG: Action: {action}")
-    print(f"DEBUG: User == Collector: {request.user == match.collector}")
-    print(f"DEBUG: User ID == Collector ID: {request.user.id == match.collector.id}")
+    logger.debug(
+        "manage_match match=%s action=%s user=%s collector=%s",
+        match.pk, action, request.user.pk, match.collector_id,
+    )
     
     # Check permissions for complete action
     if action == 'complete':
@@ -164,9 +172,10 @@ def request_match(request, waste_item_id):
 
 # it reaches here
 
+@conditional_page(listings_version)
 def home(request):
     try:
-        recent_waste = WasteItem.objects.filter(status='available').order_by('-created_at')[:6]
+        recent_waste = WasteItem.objects.filter(status='available').select_related('poster').order_by('-created_at')[:6]
     except:
         recent_waste = []
     
@@ -188,19 +197,21 @@ def register(request):
 @login_required
 def dashboard(request):
     # Only show PENDING collection requests
-    user_waste = WasteItem.objects.filter(poster=request.user)
-    matches_received = Match.objects.filter(waste_item__poster=request.user, status='pending')  # ✅ ADDED STATUS FILTER
+    user_waste = archive.listings_for(request.user)  # Live and archived
+    matches_received = Match.objects.filter(
+        waste_item__poster=request.user, status='pending'
+    ).select_related('waste_item', 'collector')  # ✅ ADDED STATUS FILTER
     
     # Different views based on user type
     if request.user.user_type in ['collector', 'recycler']:
-        available_waste = WasteItem.objects.filter(status='available').exclude(poster=request.user)
-        matches_made = Match.objects.filter(collector=request.user)
+        available_waste = WasteItem.objects.filter(status='available').exclude(poster=request.user).select_related('poster')
+        matches_made = Match.objects.filter(collector=request.user).select_related('waste_item')[:5]  # Template shows 5
         
         # Show accepted matches that need completion
         accepted_matches = Match.objects.filter(
             collector=request.user, 
             status='accepted'
-        )
+        ).select_related('waste_item__poster', 'slot').order_by(F('slot__start').asc(nulls_last=True), 'pk')
         
         # For collectors: show nearby waste
         if request.user.location:
@@ -210,30 +221,24 @@ def dashboard(request):
         matches_made = None
         accepted_matches = None
     
-    # Statistics for dashboard
-    total_waste_posted = user_waste.count()
-    total_credits_earned = sum([waste.credits_earned for waste in user_waste])
-    pending_matches = matches_received.count()  # This will now match what's displayed
+    # Statistics for dashboard; the counts are kept on the user row (core/counters.py)
+    total_waste_posted = request.user.items_posted
+    total_credits_earned = sum(waste.credits_earned for waste in user_waste)
+    pending_matches = request.user.pending_matches_received
     
     # Credit transaction data
     recent_transactions = CreditTransaction.objects.filter(user=request.user).order_by('-created_at')[:5]
-    transaction_count = CreditTransaction.objects.filter(user=request.user).count()
-    
-    # Calculate credits earned this month
-    current_month = timezone.now().month
-    current_year = timezone.now().year
-    credits_this_month = CreditTransaction.objects.filter(
-        user=request.user,
-        transaction_type='credit',
-        created_at__month=current_month,
-        created_at__year=current_year
-    ).aggregate(total=Sum('amount'))['total'] or 0
     
-    # Alternative calculation for total credits earned from all credit transactions
-    total_credits_from_transactions = CreditTransaction.objects.filter(
-        user=request.user,
-        transaction_type='credit'
-    ).aggregate(total=Sum('amount'))['total'] or 0
+    # Credits earned this month and all-time credits in a single query
+    now = timezone.now()
+    is_credit = Q(transaction_type='credit')
+    transaction_stats = CreditTransaction.objects.filter(user=request.user).aggregate(
+        this_month=Sum('amount', filter=is_credit & Q(created_at__month=now.month, created_at__year=now.year)),
+        total_credits=Sum('amount', filter=is_credit),
+    )
+    transaction_count = request.user.transaction_count
+    credits_this_month = transaction_stats['this_month'] or 0
+    total_credits_from_transactions = transaction_stats['total_credits'] or 0
     
     context = {
         'user_waste': user_waste,
@@ -252,6 +257,22 @@ def dashboard(request):
     return render(request, 'core/dashboard.html', context)
 #End of dashboard view
 
+@login_required
+def import_waste(request):
+    """Upload many listings at once as CSV; invalid rows are listed and skipped"""
+    result = None
+    if request.method == 'POST':
+        form = ListingImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            result = importer.import_listings(request.FILES['file'], request.user,
+                                              dry_run=form.cleaned_data['dry_run'])
+            if result.created and not form.cleaned_data['dry_run']:
+                messages.success(request, f'✅ Imported {result.created} of {result.rows} listings.')
+    else:
+        form = ListingImportForm()
+    return render(request, 'core/import_waste.html', {'form': form, 'result': result})
+
+
 @login_required
 def post_waste(request):
     if request.method == 'POST':
@@ -268,7 +289,9 @@ def post_waste(request):
                 unit = waste_item.unit
                 
                 waste_item.save()
-                
+                if dedup.check([waste_item]):
+                    messages.info(request, 'This listing looks like a repost of an earlier one and will be reviewed.')
+
                 messages.success(
                     request, 
                     f'✅ Waste item "{waste_item.title}" posted successfully! '
@@ -280,6 +303,7 @@ def post_waste(request):
             except TypeError as e:
                 # Handle the Decimal/float multiplication error
                 waste_item.save()  # Save without calculated credits for now
+                dedup.check([waste_item])
                 messages.warning(
                     request,
                     f'✅ Waste item "{waste_item.title}" posted successfully! '
@@ -293,17 +317,7 @@ def post_waste(request):
         form = WasteItemForm()
     
     # Add credit rates to context for display in template
-    credit_rates = {
-        'plastic': 2.0,
-        'paper': 1.5,
-        'metal': 3.0,
-        'glass': 1.0,
-        'organic': 0.5,
-        'agricultural': 0.3,
-        'e-waste': 5.0,
-        'textile': 1.0,
-        'other': 1.0,
-    }
+    credit_rates = WasteItem.CREDIT_RATES
     
     context = {
         'form': form,
@@ -313,18 +327,134 @@ def post_waste(request):
     return render(request, 'core/post_waste.html', context) 
 
 
+def metrics_view(request):
+    """Prometheus scrape endpoint: needs METRICS_TOKEN when it is set, else a client in METRICS_ALLOWED_IPS"""
+    token = getattr(settings, 'METRICS_TOKEN', '')
+    if token:
+        supplied = request.META.get('HTTP_AUTHORIZATION', '').removeprefix('Bearer ')
+        allowed = constant_time_compare(supplied, token)
+    else:
+        allowed = request.META.get('REMOTE_ADDR') in getattr(settings, 'METRICS_ALLOWED_IPS', ('127.0.0.1', '::1'))
+    if not allowed:
+        return HttpResponse('Forbidden', status=403, content_type='text/plain')
+    return HttpResponse(metrics.render_latest(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+@permission_required('core.view_impactrollup', raise_exception=True)
+def impact_report(request):
+    """Tonnage and credits from the impact rollups; `?format=csv` downloads the table"""
+    form = ImpactReportForm(request.GET or None)
+    rows, group_by, compare = [], ['month'], False
+    if form.is_valid():
+        data = form.cleaned_data
+        group_by, compare = data['group_by'], data['compare']
+        options = dict(start=data['start'], end=data['end'], group_by=group_by,
+                       area=data['area'], waste_type=data['waste_type'], status=data['status'])
+        rows = analytics.year_over_year(**options) if compare else analytics.report(**options)
+    elif not request.GET:
+        rows = analytics.report(group_by=group_by)
+
+    columns = [name for name, _ in ImpactReportForm.GROUP_CHOICES if name in group_by]
+    columns += ['items', 'tonnes', 'estimated_credits', 'credits_earned']
+    if compare:
+        columns += ['previous_items', 'previous_tonnes', 'tonnes_change_pct']
+
+    if request.GET.get('format') == 'csv':
+        response = HttpResponse(content_type='text/csv')
+        response['Content-Disposition'] = 'attachment; filename="impact-report.csv"'
+        writer = csv.writer(response)
+        writer.writerow(columns)
+        for row in rows:
+            writer.writerow(['' if row.get(name) is None else row[name] for name in columns])
+        return response
+
+    table = [[row.get(name) for name in columns] for row in rows]
+    headers = [name.replace('_', ' ').capitalize() for name in columns]
+    return render(request, 'core/impact_report.html', {'form': form, 'headers': headers, 'table': table})
+
+
+@login_required
+def leaderboard_view(request):
+    """Top 10 of a monthly leaderboard, county-wide or for one place, and the user's own rank"""
+    form = LeaderboardForm(request.GET or None)
+    board, month, place = 'earners', leaderboard.month_of(), leaderboard.ALL_PLACES
+    if form.is_valid():
+        board = form.cleaned_data['board']
+        month = leaderboard.month_of(form.cleaned_data['month'] or month)
+        place = places.place_id(form.cleaned_data['area'])
+
+    context = {
+        'form': form,
+        'board_label': dict(leaderboard.BOARDS)[board],
+        'month': month,
+        'area': analytics.area_name(place) if place else '',
+        'entries': leaderboard.top(board, month, place),
+        'my_rank': leaderboard.rank(board, request.user, month, place),
+        'unit': 'credits' if board == 'earners' else 'collections',
+    }
+    return render(request, 'core/leaderboard.html', context)
+
+
+@login_required
+def pickup_schedule(request):
+    """A collector's vehicle capacity and pickup slots, with the accepted matches planned into each slot"""
+    if request.user.user_type not in ('collector', 'recycler'):
+        messages.error(request, 'Only collectors and recyclers schedule pickups.')
+        return redirect('dashboard')
+    capacity_form = VehicleCapacityForm(instance=request.user)
+    slot_form = PickupSlotForm()
+    if request.method == 'POST':
+        action = request.POST.get('action')
+        if action == 'capacity':
+            capacity_form = VehicleCapacityForm(request.POST, instance=request.user)
+            if capacity_form.is_valid():
+                # request.user may be a cached copy: write only what the form changes
+                capacity_form.save(commit=False).save(update_fields=['vehicle_capacity_kg'])
+                scheduling.replan([request.user.pk])
+                messages.success(request, 'Vehicle capacity saved; your pickups have been replanned.')
+                return redirect('pickup_schedule')
+        elif action == 'add_slot':
+            slot_form = PickupSlotForm(request.POST)
+            if slot_form.is_valid():
+                slot = slot_form.save(commit=False)
+                slot.collector = request.user
+                slot.save()
+                messages.success(request, 'Pickup slot added.')
+                return redirect('pickup_schedule')
+        elif action == 'delete_slot':
+            slot = get_object_or_404(PickupSlot, pk=request.POST.get('slot'), collector=request.user)
+            slot.delete()
+            messages.success(request, 'Pickup slot removed; its pickups have been moved to your other slots.')
+            return redirect('pickup_schedule')
+
+    slots, unscheduled = scheduling.schedule_for(request.user)
+    context = {
+        'capacity_form': capacity_form,
+        'slot_form': slot_form,
+        'slots': slots,
+        'unscheduled': unscheduled,
+    }
+    return render(request, 'core/pickup_schedule.html', context)
+
+
 @login_required
+@conditional_page(listings_version)
 def waste_list(request):
     try:
-        waste_items = WasteItem.objects.filter(status='available').order_by('-created_at')
+        waste_items = WasteItem.objects.filter(status='available').select_related('poster', 'category').order_by('-created_at')
     except:
         waste_items = []
     
     return render(request, 'core/waste_list.html', {'waste_items': waste_items})
 
 @login_required
+@conditional_page(item_version)
 def waste_detail(request, pk):
-    waste_item = get_object_or_404(WasteItem, pk=pk)
+    waste_item = WasteItem.objects.select_related('poster', 'category').filter(pk=pk).first()
+    if waste_item is None:
+        # Finished listings moved to the archive keep their page, read-only
+        archived = get_object_or_404(ArchivedWasteItem.objects.select_related('poster', 'category'), pk=pk)
+        return render(request, 'core/waste_detail.html', {'waste_item': archived, 'form': None})
     
     if request.method == 'POST' and request.user.user_type in ['collector', 'recycler']:
         form = MatchForm(request.POST)
@@ -346,7 +476,7 @@ def waste_detail(request, pk):
 """"
 @login_required
 def manage_match(request, pk, action):
-    match = get_object_or_404(Match, pk=pk)
+    match = get_object_or_404(Match.objects.select_related('waste_item__poster', 'collector'), pk=pk)
     
     if request.user != match.waste_item.poster:
         messages.error(request, 'You cannot manage this match.')
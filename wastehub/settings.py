@@ -38,12 +38,16 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'core.middleware.RequestInstrumentationMiddleware',  # Server-Timing + per-request log line
+    'core.middleware.SamplingProfilerMiddleware',  # Only active when PROFILER_ENABLED
+    'core.middleware.CompressionMiddleware',  # brotli/gzip for JSON responses
     'django.middleware.security.SecurityMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',  # For static files
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
+    'core.middleware.AdmissionControlMiddleware',  # 429/503 for retry storms and overload
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
 ]
@@ -73,8 +77,17 @@ DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
         'NAME': BASE_DIR / 'db.sqlite3',
-    }
+    },
+    # Holds only the database cache's table (see CACHES); create it with
+    # `manage.py createcachetable --database cache`. Losing the last writes
+    # on a crash only loses cache entries, so it does not sync every commit.
+    'cache': {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': os.environ.get('CACHE_DB', BASE_DIR / 'cache.sqlite3'),
+        'OPTIONS': {'init_command': 'PRAGMA journal_mode=WAL; PRAGMA synchronous=NORMAL'},
+    },
 }
+DATABASE_ROUTERS = ['core.routers.CacheRouter']
 
 # Password validation
 AUTH_PASSWORD_VALIDATORS = [
@@ -133,6 +146,46 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 # Custom user model
 AUTH_USER_MODEL = 'core.User'
 
+# One cache for every process on the host: the gunicorn workers, manage.py
+# commands and their pool workers. A user forgotten after a ledger write in
+# any of them (core/auth.py), a category version bump (core/refdata.py) and
+# the admission buckets (core/admission.py) are then seen by all the others.
+# The database is a local SQLite file, so the app runs on one host and a
+# database cache in a second SQLite file on it is shared; set REDIS_URL
+# (needs the redis package) when it runs on several.
+# A file-based cache is shared too, but every write lists the cache directory
+# to decide whether to cull it: about 6 ms a set with 1,500 entries cached,
+# against 0.2 ms for the database cache.
+if os.environ.get('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ['REDIS_URL'],
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+            'LOCATION': 'core_cache',
+            'OPTIONS': {'MAX_ENTRIES': 2000},
+        }
+    }
+
+# Sessions are read from the cache and written through to the database
+# (cached_db, counting hits and misses in /metrics); the
+# signed-in user is cached for USER_CACHE_SECONDS (core/auth.py) and dropped
+# on every save; forgetting more than USER_CACHE_BULK_FORGET users at once
+# drops every cached user with one cache write.
+SESSION_ENGINE = 'core.sessions'
+AUTHENTICATION_BACKENDS = [
+    'core.auth.CachedModelBackend',
+    # Sessions started before the cached backend still name this one
+    'django.contrib.auth.backends.ModelBackend',
+]
+USER_CACHE_SECONDS = 60
+USER_CACHE_BULK_FORGET = 100
+
 # Login/Logout URLs
 LOGIN_REDIRECT_URL = 'dashboard'
 LOGOUT_REDIRECT_URL = 'home'
@@ -151,17 +204,157 @@ MESSAGE_TAGS = {
 # Email configuration (if needed)
 EMAIL_BACKEND = 'django.core.mail.backends.console.EmailBackend'
 
+# Sampling profiler (see core/profiling.py). Summarise with `manage.py profile_summary`.
+PROFILER_ENABLED = os.environ.get('PROFILER_ENABLED', '') == '1'
+PROFILER_SAMPLE_RATE = float(os.environ.get('PROFILER_SAMPLE_RATE', '0.01'))
+PROFILER_MODE = os.environ.get('PROFILER_MODE', 'cprofile')  # 'cprofile' or 'sample'
+PROFILER_SPOOL_DIR = os.environ.get('PROFILER_SPOOL_DIR', os.path.join(BASE_DIR, 'profiles'))
+PROFILER_MAX_FILES_PER_VIEW = 50
+
+# Metrics (/metrics). Point METRICS_MULTIPROC_DIR at a directory shared by the
+# gunicorn workers so every scrape sums all of them. Scrapes must carry
+# "Authorization: Bearer <METRICS_TOKEN>" when it is set, and otherwise come
+# straight (REMOTE_ADDR, not X-Forwarded-For) from METRICS_ALLOWED_IPS.
+METRICS_MULTIPROC_DIR = os.environ.get('METRICS_MULTIPROC_DIR', '')
+METRICS_TOKEN = os.environ.get('METRICS_TOKEN', '')
+METRICS_ALLOWED_IPS = [ip.strip() for ip in os.environ.get('METRICS_ALLOWED_IPS', '127.0.0.1,::1').split(',') if ip.strip()]
+
+# Bulk admin actions (core/jobs.py). Jobs run in a thread of the web process;
+# after a restart pick them up with `manage.py run_admin_jobs --resume`.
+# A running job whose worker has not finished a chunk for
+# ADMIN_JOB_LEASE_SECONDS counts as dead and may be resumed.
+ADMIN_JOBS_IN_THREAD = os.environ.get('ADMIN_JOBS_IN_THREAD', '1') == '1'
+ADMIN_JOB_CHUNK_SIZE = 500
+ADMIN_JOB_LEASE_SECONDS = 300
+STALE_MATCH_DAYS = 14
+
+# JSON API (core/api.py). Responses of at least COMPRESS_MIN_LENGTH bytes are
+# brotli- (if installed) or gzip-compressed by CompressionMiddleware.
+API_PAGE_SIZE = 50
+API_MAX_PAGE_SIZE = 200
+API_MAX_BATCH = 100
+COMPRESS_MIN_LENGTH = 200
+BROTLI_QUALITY = 5
+
+# HTTP caching (core/conditional.py): anonymous pages may be reused this long;
+# signed-in pages are always revalidated with their ETag. Uploaded media get a
+# unique name per upload and are cached as immutable for MEDIA_MAX_AGE.
+PAGE_MAX_AGE = 60
+MEDIA_MAX_AGE = 365 * 24 * 3600
+
+# Media serving (core/media.py): 'django' streams files (sendfile(2) where the
+# WSGI server supports it), 'x-accel' hands them to nginx through an internal
+# location at MEDIA_ACCEL_PREFIX, 'x-sendfile' to Apache/lighttpd.
+MEDIA_SERVE_MODE = os.environ.get('MEDIA_SERVE_MODE', 'django')
+MEDIA_ACCEL_PREFIX = '/protected-media/'
+MEDIA_BLOCK_SIZE = 256 * 1024
+
+# Delta sync (core/sync.py): rows per stream per call, how long changes settle
+# before they are served, and how long tombstones (and replayed action
+# outcomes) are kept; older checkpoints restart from scratch.
+SYNC_BATCH_SIZE = 200
+SYNC_MAX_BATCH_SIZE = 1000
+SYNC_SETTLE_SECONDS = 2
+SYNC_RETENTION_DAYS = 30
+
+# Admission control (core/admission.py). Rates are tokens a second per user
+# and per client IP; concurrency is per worker process. Rules are keyed by
+# URL name and may override any class setting.
+ADMISSION_CONTROL_ENABLED = os.environ.get('ADMISSION_CONTROL', '1') == '1'
+ADMISSION_CLASSES = {
+    'write': {'user_rate': 0.5, 'user_burst': 10, 'ip_rate': 5.0, 'ip_burst': 60, 'concurrency': 4},
+    'import': {'user_rate': 0.05, 'user_burst': 3, 'ip_rate': 0.2, 'ip_burst': 6, 'concurrency': 1},
+}
+ADMISSION_RULES = {
+    'request_match': {'class': 'write'},
+    'manage_match': {'class': 'write'},
+    'complete_waste': {'class': 'write'},
+    'post_waste': {'class': 'write', 'methods': ['POST']},
+    'import_waste': {'class': 'import', 'methods': ['POST']},
+    'api_waste_items': {'class': 'write', 'methods': ['POST']},
+    'api_matches': {'class': 'write', 'methods': ['POST']},
+    'api_match_action': {'class': 'write'},
+    'api_sync': {'class': 'write', 'methods': ['POST']},
+    'api_import_waste_items': {'class': 'import'},
+}
+ADMISSION_MAX_IN_FLIGHT = 64
+# Proxies in front of gunicorn that append to X-Forwarded-For (the PaaS
+# router is one); the client IP is read from the outermost one's entry. Set
+# 0 when gunicorn faces clients directly, or they could pick their own IP.
+ADMISSION_PROXY_HOPS = int(os.environ.get('ADMISSION_PROXY_HOPS', '1'))
+ADMISSION_MAX_DB_LATENCY_MS = 250
+
+# Reference data (core/refdata.py): categories and choice lists are kept per
+# process; each process checks the shared version at most this often.
+REFDATA_CHECK_SECONDS = 5
+
+# Location autocomplete (core/places.py): the place index is rebuilt at most
+# this often after a listing names somewhere new.
+PLACES_RELOAD_SECONDS = 30
+PLACES_MAX_RESULTS = 25
+
+# Near-duplicate listings (core/dedup.py): pairs whose image hashes differ by at
+# most DEDUP_IMAGE_DISTANCE bits, or one poster's listings whose text is at
+# least DEDUP_TEXT_SIMILARITY alike, are queued for review in the admin.
+# Bucket keys shared by more than DEDUP_MAX_BUCKET listings are ignored.
+DEDUP_IMAGE_DISTANCE = 3
+DEDUP_TEXT_SIMILARITY = 0.7
+DEDUP_MAX_BUCKET = 200
+
+# Pickup scheduling (core/scheduling.py): slot capacity when neither the slot
+# nor the collector's vehicle declares one, and the assumed kg per unit for
+# listings not measured by weight.
+PICKUP_DEFAULT_CAPACITY_KG = 100
+PICKUP_UNIT_LOAD_KG = {'pieces': 1, 'bags': 10, 'bottles': 0.05, 'boxes': 5, 'liters': 1}
+
+# Archival (core/archive.py): finished listings and matches last updated more
+# than ARCHIVE_AFTER_DAYS ago move to the archive tables, ARCHIVE_CHUNK_SIZE
+# rows per transaction.
+ARCHIVE_AFTER_DAYS = 90
+ARCHIVE_CHUNK_SIZE = 500
+
+# Status event feed (core/events.py): events stamped in the last
+# EVENT_SETTLE_SECONDS wait for the next read, a batch holds at most
+# EVENT_BATCH_SIZE events, and superseded events older than
+# EVENT_RETENTION_DAYS are compacted away.
+EVENT_SETTLE_SECONDS = 2
+EVENT_BATCH_SIZE = 500
+EVENT_RETENTION_DAYS = 30
+
 # Logging configuration
 LOGGING = {
     'version': 1,
     'disable_existing_loggers': False,
+    'formatters': {
+        'structured': {
+            'format': 'level=%(levelname)s logger=%(name)s %(message)s',
+        },
+    },
     'handlers': {
         'console': {
             'class': 'logging.StreamHandler',
         },
+        'structured_console': {
+            'class': 'logging.StreamHandler',
+            'formatter': 'structured',
+        },
     },
     'root': {
         'handlers': ['console'],
         'level': 'INFO',
     },
-}
\ No newline at end of file
+    'loggers': {
+        # Debug output from the credit / match code paths (set CORE_LOG_LEVEL=DEBUG to see it)
+        'core': {
+            'handlers': ['structured_console'],
+            'level': os.environ.get('CORE_LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
+        # One line per request from RequestInstrumentationMiddleware
+        'core.requests': {
+            'handlers': ['structured_console'],
+            'level': os.environ.get('REQUEST_LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
+    },
+}